@@ -0,0 +1,160 @@
+"""Crawl a generated web end to end, without the real cache server.
+
+Run from the repository root:
+
+    python -m benchmarks.crawl [--engine E] [--threads T] [--parse-processes P]
+                               [--hosts H] [--pages N] [--latency S] ...
+
+The synthetic web (see benchmarks.synthetic_web) is served by a stub cache
+server in a child process. The crawler runs in this process with the
+settings of --config, pointed at the stub, with its save, statistics and
+log files in a scratch directory. Afterwards it prints pages per second,
+peak RSS, what the stub served and the per-stage timings from
+utils.metrics.
+"""
+from argparse import ArgumentParser
+from configparser import ConfigParser
+import json
+import logging
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.request import urlopen
+
+from benchmarks.synthetic_web import SyntheticWeb, add_arguments, web_arguments
+
+STAGES = ["wait", "download", "unpickle", "parse", "fingerprint", "links",
+          "analyze", "stats", "frontier"]
+
+
+def start_stub(args):
+    stub = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.synthetic_web", "--port", "0"]
+        + web_arguments(args),
+        stdout=subprocess.PIPE, text=True)
+    line = stub.stdout.readline()
+    if not line.startswith("port "):
+        stub.kill()
+        raise RuntimeError("The synthetic web did not start.")
+    return stub, int(line.split()[1])
+
+
+def make_config(args, port, workdir):
+    # Imported here so that this module can be imported without the
+    # crawler's dependencies, e.g. to read its arguments.
+    from utils.config import Config
+    cparser = ConfigParser()
+    if not cparser.read(args.config):
+        raise FileNotFoundError(args.config)
+    web = SyntheticWeb(args.hosts)
+    cparser["CRAWLER"]["SEEDURL"] = ",".join(web.seeds())
+    cparser["CRAWLER"]["POLITENESS"] = str(args.politeness)
+    local = cparser["LOCAL PROPERTIES"]
+    local["THREADCOUNT"] = str(args.threads)
+    local["ENGINE"] = args.engine
+    local["PARSE_PROCESSES"] = str(args.parse_processes)
+    for option, name in [("SAVE", "frontier.db"), ("STATS", "crawl_stats.seg"),
+                         ("AGGREGATES", "crawl_aggregates.db"),
+                         ("DEDUP_FILE", "fingerprints.bin"),
+                         ("METRICS_FILE", "crawl_metrics.json")]:
+        local[option] = os.path.join(workdir, name)
+    local["METRICS_PORT"] = "0"
+    local["QUEUE_LIMIT"] = str(args.queue_limit)
+    local["SPILL_DIR"] = os.path.join(workdir, "frontier_spill")
+    local["ARCHIVE"] = os.path.abspath(args.archive) if args.archive else ""
+    config = Config(cparser)
+    config.cache_server = ("127.0.0.1", port)
+    if args.replay:
+        config.replay_file = os.path.abspath(args.replay)
+    return config
+
+
+def stub_stats(port):
+    with urlopen(f"http://127.0.0.1:{port}/stats") as resp:
+        return json.loads(resp.read())
+
+
+def print_report(snapshot, elapsed, served, rss_self, rss_children):
+    counters = snapshot["counters"]
+    pages = counters.get("pages", 0)
+    print(f"{pages} urls in {elapsed:.2f}s: {pages / elapsed:.1f} urls/s, "
+          f"{counters.get('bytes', 0) / elapsed / 1e6:.2f} MB/s from the cache")
+    print(f"peak RSS: crawler {rss_self / 1024:.0f} MB, "
+          f"parse processes {rss_children / 1024:.0f} MB")
+    print("served: " + ", ".join(f"{kind} {count}" for kind, count in sorted(served.items())))
+    print(f"{'stage':12s} {'count':>8s} {'mean ms':>9s} {'p50 ms':>9s} "
+          f"{'p90 ms':>9s} {'p99 ms':>9s} {'max ms':>9s}")
+    stages = snapshot["stages"]
+    for stage in STAGES + sorted(set(stages) - set(STAGES)):
+        if stage not in stages:
+            continue
+        s = stages[stage]
+        print(f"{stage:12s} {s['count']:8d} {s['mean'] * 1e3:9.2f} {s['p50'] * 1e3:9.2f} "
+              f"{s['p90'] * 1e3:9.2f} {s['p99'] * 1e3:9.2f} {s['max'] * 1e3:9.2f}")
+
+
+def main(args):
+    stub, port = start_stub(args)
+    workdir = args.workdir or tempfile.mkdtemp(prefix="crawl-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    try:
+        config = make_config(args, port, workdir)
+        from crawler import Crawler
+        from utils.metrics import metrics
+        # Logs/ is created in the working directory.
+        cwd = os.getcwd()
+        os.chdir(workdir)
+        if not args.verbose:
+            logging.disable(logging.INFO)
+        try:
+            start = time.perf_counter()
+            Crawler(config, restart=True).start()
+            elapsed = time.perf_counter() - start
+        finally:
+            logging.disable(logging.NOTSET)
+            os.chdir(cwd)
+        snapshot = metrics.snapshot()
+        # Taken after the parse pool has been shut down, and before the stub
+        # exits, so the children's peak is the pool's.
+        rss_children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        served = stub_stats(port)
+    finally:
+        stub.terminate()
+        stub.wait()
+    rss_self = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f"engine {args.engine}, {args.threads} threads, "
+          f"{args.parse_processes} parse processes, scratch files in {workdir}")
+    print_report(snapshot, elapsed, served, rss_self, rss_children)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"elapsed": elapsed, "served": served, "rss_kb": rss_self,
+                       "children_rss_kb": rss_children, "metrics": snapshot},
+                      f, indent=1, sort_keys=True)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--config", type=str, default="config.ini")
+    parser.add_argument("--engine", type=str, default="threads",
+                        choices=["threads", "asyncio"])
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--parse-processes", type=int, default=0)
+    parser.add_argument("--politeness", type=float, default=0.0,
+                        help="per-domain delay; the real crawl uses POLITENESS")
+    parser.add_argument("--queue-limit", type=int, default=0,
+                        help="pending urls kept in memory; the rest spill to disk")
+    parser.add_argument("--workdir", type=str, default=None,
+                        help="where the crawl's files go (default: a new temp dir)")
+    parser.add_argument("--archive", type=str, default=None,
+                        help="write the responses to this archive")
+    parser.add_argument("--replay", type=str, default=None,
+                        help="crawl this archive instead of the stub")
+    parser.add_argument("--json", type=str, default=None,
+                        help="also write the results to this file")
+    parser.add_argument("--verbose", action="store_true", default=False,
+                        help="keep the crawler's per-url log lines")
+    add_arguments(parser)
+    main(parser.parse_args())
@@ -0,0 +1,108 @@
+"""Compare scraper.is_valid with the original regex-based filter.
+
+Run from the repository root:
+
+    python -m benchmarks.is_valid [--urls N] [--repeat R]
+
+The synthetic urls mix allowed and foreign hosts, ports, fragments, query
+strings and blocked or harmless extensions. Both filters must give the same
+verdict for every url before any timing is reported.
+"""
+from argparse import ArgumentParser
+import random
+import re
+import time
+from urllib.parse import urlparse
+
+import scraper
+
+HOSTS = [
+    "www.ics.uci.edu", "ics.uci.edu", "vision.ics.uci.edu", "www.cs.uci.edu",
+    "www.informatics.uci.edu", "www.stat.uci.edu", "WWW.Stat.UCI.edu",
+    "www.uci.edu", "physics.uci.edu", "example.com", "ics.uci.edu.evil.com",
+    "www.ics.uci.edu:8080", "user@www.cs.uci.edu",
+]
+SCHEMES = ["http", "https", "https", "ftp", "mailto"]
+SEGMENTS = ["people", "~eppstein", "pubs", "2024", "events", "a.b", "wiki", ""]
+FILES = [
+    "", "index.html", "index.php", "paper.pdf", "Slides.PPTX", "data.tar.gz",
+    "photo.JPEG", "style.css", "notes.txt", "archive.c", "readme", "page.htm",
+    "x.h", "dump.", ".css", "v1.2",
+]
+SUFFIXES = ["", "", "?id=3", "?file=a.pdf", "#top", "?q=1#frag"]
+
+
+def original_is_valid(url):
+    # scraper.is_valid before the rules were precompiled.
+    try:
+        parsed = urlparse(url)
+        if parsed.scheme not in set(["http", "https"]):
+            return False
+        netloc = parsed.netloc.lower()
+        valid_domains = [".ics.uci.edu", ".cs.uci.edu", ".informatics.uci.edu", ".stat.uci.edu"]
+        if not any(netloc.endswith(domain) for domain in valid_domains):
+            return False
+        if parsed.fragment:
+            return False
+        path_lower = parsed.path.lower()
+        if '?' in path_lower:
+            path_part = path_lower.split('?')[0]
+        else:
+            path_part = path_lower
+        return not re.match(
+            r".*\.(css|js|bmp|gif|jpe?g|ico"
+            + r"|png|tiff?|mid|mp2|mp3|mp4"
+            + r"|wav|avi|mov|mpeg|ram|m4v|mkv|ogg|ogv|pdf"
+            + r"|ps|eps|tex|ppt|pptx|doc|docx|xls|xlsx|names"
+            + r"|data|dat|exe|bz2|tar|msi|bin|7z|psd|dmg|iso"
+            + r"|epub|dll|cnf|tgz|sha1"
+            + r"|thmx|mso|arff|rtf|jar|csv"
+            + r"|rm|smil|wmv|swf|wma|zip|rar|gz|xml|rss|json"
+            + r"|txt|py|java|cpp|c|h|hpp|cc|svg|woff"
+            + r"|woff2|ttf|eot|otf)$", path_part)
+    except TypeError:
+        raise
+    except Exception:
+        return False
+
+
+def make_url(rng):
+    path = "/".join(rng.choice(SEGMENTS) for _ in range(rng.randint(0, 4)))
+    return (f"{rng.choice(SCHEMES)}://{rng.choice(HOSTS)}/{path}/"
+            f"{rng.choice(FILES)}{rng.choice(SUFFIXES)}")
+
+
+def best_of(repeat, func, urls):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for url in urls:
+            func(url)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(count, repeat, seed=121):
+    rng = random.Random(seed)
+    urls = [make_url(rng) for _ in range(count)]
+
+    for url in urls:
+        assert scraper.is_valid(url) == original_is_valid(url), f"Filters disagree on {url}"
+
+    valid = sum(1 for url in urls if scraper.is_valid(url))
+    old = best_of(repeat, original_is_valid, urls)
+    new = best_of(repeat, scraper.is_valid, urls)
+    print(f"{count} urls ({valid} valid), best of {repeat}")
+    print(f"  regex filter   : {old:8.3f}s  {count / old / 1e3:7.1f}K urls/s")
+    print(f"  compiled rules : {new:8.3f}s  {count / new / 1e3:7.1f}K urls/s")
+    print(f"  speedup        : {old / new:8.1f}x")
+    print(f"  verdict cache  : {scraper._host_and_extension_allowed.cache_info()}")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--urls", type=int, default=200000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    main(args.urls, args.repeat)
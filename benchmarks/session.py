@@ -0,0 +1,95 @@
+"""Compare download() over the pooled session with a connection per url.
+
+Run from the repository root:
+
+    python -m benchmarks.session [--threads T] [--urls N] [--repeat R]
+                                 [--latency S] ...
+
+The synthetic web (see benchmarks.synthetic_web) is served by a stub cache
+server in a child process. T threads download the same N page urls, spread
+over the web's hosts, first with utils.download.download, whose shared
+session keeps one connection per thread, then the way download() used to,
+with requests.get opening a connection for every url. Both must get the
+same statuses before any timing is reported.
+"""
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from configparser import ConfigParser
+import time
+
+import cbor
+import requests
+
+from benchmarks.crawl import start_stub, stub_stats
+from benchmarks.synthetic_web import add_arguments, web_from_args
+from utils.config import Config
+from utils.download import close_session, download
+from utils.response import Response
+
+
+def make_config(args, port):
+    cparser = ConfigParser()
+    if not cparser.read(args.config):
+        raise FileNotFoundError(args.config)
+    cparser["LOCAL PROPERTIES"]["THREADCOUNT"] = str(args.threads)
+    config = Config(cparser)
+    config.cache_server = ("127.0.0.1", port)
+    return config
+
+
+def unpooled(url, config):
+    host, port = config.cache_server
+    resp = requests.get(
+        f"http://{host}:{port}/",
+        params=[("q", f"{url}"), ("u", f"{config.user_agent}")],
+        timeout=(config.connect_timeout, config.read_timeout))
+    return Response(cbor.loads(resp.content))
+
+
+def best_of(repeat, threads, fetch, urls):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with ThreadPoolExecutor(threads) as pool:
+            statuses = list(pool.map(fetch, urls))
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, statuses
+
+
+def main(args):
+    web = web_from_args(args)
+    urls = [f"https://{web.hosts[n % len(web.hosts)]}/p{n // len(web.hosts) % web.pages}"
+            for n in range(args.urls)]
+    stub, port = start_stub(args)
+    try:
+        config = make_config(args, port)
+        pooled_time, pooled = best_of(
+            args.repeat, args.threads, lambda url: download(url, config).status, urls)
+        close_session()
+        unpooled_time, expected = best_of(
+            args.repeat, args.threads, lambda url: unpooled(url, config).status, urls)
+        served = stub_stats(port)
+    finally:
+        stub.terminate()
+        stub.wait()
+    assert pooled == expected, "Pooled and unpooled downloads disagree."
+    print(f"{args.urls} urls on {len(web.hosts)} hosts, {args.threads} threads, "
+          f"best of {args.repeat}; served: "
+          + ", ".join(f"{kind} {count}" for kind, count in sorted(served.items())))
+    print(f"  connection per url: {unpooled_time:8.3f}s  {args.urls / unpooled_time:8.1f} urls/s")
+    print(f"  pooled session    : {pooled_time:8.3f}s  {args.urls / pooled_time:8.1f} urls/s")
+    print(f"  speedup           : {unpooled_time / pooled_time:8.2f}x")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--config", type=str, default="config.ini")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--urls", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=3)
+    add_arguments(parser)
+    # Connection setup is what is being measured, so the stub answers at
+    # once unless asked to wait.
+    parser.set_defaults(latency=0.0, jitter=0.0)
+    main(parser.parse_args())
@@ -0,0 +1,250 @@
+"""A generated web behind a stub of the cache server, for offline crawls.
+
+Run from the repository root to serve it on its own:
+
+    python -m benchmarks.synthetic_web [--port P] [--hosts H] [--pages N] ...
+
+It answers `GET /?q=<url>&u=<agent>` the way the cache server does: a CBOR
+map with the url, the status and a pickled requests.Response, so
+utils.download handles it unchanged. `GET /stats` returns how many urls of
+each kind were served, as JSON.
+
+The web is a pure function of its parameters and seed, so every run crawls
+the same pages. Each of H hosts (h0.ics.uci.edu, ...) has N pages /p<n>
+with links to other pages, mostly on the same host. Each page is about its
+own topic, a random handful of the vocabulary, with Zipf-distributed words
+from it, so distinct pages are not near duplicates of each other. Some
+pages also link to:
+
+- a print mirror /p<n>/print with exactly the same words (duplicates);
+- /calendar/<year>/<month>, an endless chain of near-identical pages (a
+  crawler trap);
+- /paper/<n>, a PDF, and /big/<n>, an HTML page of --large-size bytes.
+
+robots.txt is missing unless given, with any other fixed files, as
+`files`; served stats count those by path.
+"""
+from argparse import ArgumentParser
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from threading import Lock
+from urllib.parse import urlparse, parse_qs
+import itertools
+import json
+import pickle
+import random
+import re
+import sys
+import time
+
+import cbor
+from requests.models import Response as RequestsResponse
+from requests.structures import CaseInsensitiveDict
+
+MONTHS = ["january", "february", "march", "april", "may", "june", "july",
+          "august", "september", "october", "november", "december"]
+
+
+class SyntheticWeb(object):
+    """Pages of the generated web, keyed by url."""
+
+    def __init__(self, hosts=5, pages=500, links=8, words=300, vocabulary=5000,
+                 topic_words=200, duplicate_rate=0.05, trap_rate=0.02,
+                 large_rate=0.01, large_size=12 * 1024 * 1024, seed=121,
+                 files=None):
+        self.hosts = [f"h{i}.ics.uci.edu" for i in range(hosts)]
+        self.pages = pages
+        self.links = links
+        self.words = words
+        self.duplicate_rate = duplicate_rate
+        self.trap_rate = trap_rate
+        self.large_rate = large_rate
+        self.large_size = large_size
+        self.seed = seed
+        # path -> (content type, body or function of the host giving it),
+        # served on every host
+        self.files = files or {}
+        self.vocabulary = _words(vocabulary, seed)
+        self.topic_words = min(topic_words, vocabulary)
+        # Zipf weights over a topic, as cumulative sums for random.choices.
+        self.cum_weights = list(itertools.accumulate(
+            1.0 / rank for rank in range(1, self.topic_words + 1)))
+
+    def seeds(self):
+        return [f"https://{host}/p0" for host in self.hosts]
+
+    def _rng(self, *key):
+        return random.Random(f"{self.seed}:{':'.join(map(str, key))}")
+
+    def _text(self, rng, count):
+        topic = rng.sample(self.vocabulary, self.topic_words)
+        return " ".join(rng.choices(topic, cum_weights=self.cum_weights, k=count))
+
+    def page(self, url):
+        """(kind, status, content type, body) for url."""
+        parsed = urlparse(url)
+        host, path = parsed.netloc, parsed.path
+        if host not in self.hosts:
+            return "missing", 404, "text/html", b""
+        if path in self.files:
+            content_type, body = self.files[path]
+            return path, 200, content_type, body(host) if callable(body) else body
+        if path == "/robots.txt":
+            return "robots", 404, "text/plain", b""
+        match = re.fullmatch(r"/p(\d+)(/print)?", path)
+        if match and int(match.group(1)) < self.pages:
+            n = int(match.group(1))
+            return ("duplicate" if match.group(2) else "page", 200,
+                    "text/html; charset=utf-8", self._page(host, n, bool(match.group(2))))
+        match = re.fullmatch(r"/calendar/(\d+)/(\d+)", path)
+        if match:
+            year, month = int(match.group(1)), int(match.group(2))
+            return "trap", 200, "text/html", self._calendar(year, month)
+        match = re.fullmatch(r"/paper/(\d+)", path)
+        if match:
+            body = b"%PDF-1.4\n" + self._text(self._rng(host, path), 2000).encode()
+            return "pdf", 200, "application/pdf", body
+        match = re.fullmatch(r"/big/(\d+)", path)
+        if match:
+            return "large", 200, "text/html", b"<html><body>" + b"big " * (self.large_size // 4)
+        return "missing", 404, "text/html", b""
+
+    def _page(self, host, n, mirror):
+        rng = self._rng(host, n)
+        text = self._text(rng, self.words)
+        links = []
+        for _ in range(self.links):
+            target_host = host if rng.random() < 0.9 else rng.choice(self.hosts)
+            links.append(f"https://{target_host}/p{rng.randrange(self.pages)}")
+        if rng.random() < self.duplicate_rate and not mirror:
+            links.append(f"/p{n}/print")
+        if rng.random() < self.trap_rate:
+            links.append(f"/calendar/{2000 + rng.randrange(30)}/1")
+        if rng.random() < self.large_rate:
+            links.append(f"/paper/{n}")
+            links.append(f"/big/{n}")
+        # Anchor text is the same everywhere, so a mirror counts the same words.
+        anchors = "".join(f'<a href="{link}">more</a> ' for link in links
+                          if not mirror or "/print" not in link)
+        return (f"<html><head><title>{host} page</title></head><body><p>{text}</p>"
+                f"{anchors}</body></html>").encode()
+
+    def _calendar(self, year, month):
+        next_year, next_month = (year + 1, 1) if month == 12 else (year, month + 1)
+        text = " ".join(["events", "calendar", "no", "events", "scheduled"] * 8)
+        return (f"<html><body><h1>{MONTHS[(month - 1) % 12]} {year}</h1><p>{text}</p>"
+                f'<a href="/calendar/{next_year}/{next_month}">next</a> '
+                f'<a href="/calendar/{year + 1}/{month}">next year</a>'
+                f"</body></html>").encode()
+
+
+def _words(count, seed):
+    rng = random.Random(seed)
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    seen = set()
+    while len(seen) < count:
+        seen.add("".join(rng.choice(letters) for _ in range(rng.randint(3, 9))))
+    return sorted(seen)
+
+
+def cache_response(url, status, content_type, body):
+    """The CBOR body the cache server sends for url."""
+    raw = RequestsResponse()
+    raw.status_code = status
+    raw.url = url
+    raw._content = body
+    raw.headers = CaseInsensitiveDict({
+        "Content-Type": content_type, "Content-Length": str(len(body))})
+    return cbor.dumps({"url": url, "status": status, "response": pickle.dumps(raw)})
+
+
+def make_server(web, port=0, latency=0.0, jitter=0.0):
+    """A ThreadingHTTPServer on 127.0.0.1 that serves web like the cache
+    server, waiting latency +- jitter seconds per request."""
+    served = {}
+    lock = Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Headers and body go out in separate writes, which Nagle would hold
+        # back for the client's delayed ACK on a kept-alive connection.
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            parsed = urlparse(self.path)
+            if parsed.path == "/stats":
+                with lock:
+                    body = json.dumps(served).encode()
+                return self._send(body, "application/json")
+            query = parse_qs(parsed.query)
+            url = query.get("q", [""])[0]
+            kind, status, content_type, page = web.page(url)
+            with lock:
+                served[kind] = served.get(kind, 0) + 1
+            if latency or jitter:
+                time.sleep(max(0.0, latency + random.uniform(-jitter, jitter)))
+            self._send(cache_response(url, status, content_type, page), "application/cbor")
+
+        def _send(self, body, content_type):
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            try:
+                self.wfile.write(body)
+            except OSError:
+                # The crawler hung up on a body it did not want.
+                pass
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    server.daemon_threads = True
+    return server
+
+
+def add_arguments(parser):
+    parser.add_argument("--hosts", type=int, default=5)
+    parser.add_argument("--pages", type=int, default=500, help="pages per host")
+    parser.add_argument("--links", type=int, default=8, help="links per page")
+    parser.add_argument("--words", type=int, default=300, help="words per page")
+    parser.add_argument("--duplicate-rate", type=float, default=0.05)
+    parser.add_argument("--trap-rate", type=float, default=0.02)
+    parser.add_argument("--large-rate", type=float, default=0.01)
+    parser.add_argument("--large-size", type=int, default=12 * 1024 * 1024)
+    parser.add_argument("--latency", type=float, default=0.02,
+                        help="seconds the stub waits before each answer")
+    parser.add_argument("--jitter", type=float, default=0.01)
+    parser.add_argument("--seed", type=int, default=121)
+
+
+def web_from_args(args):
+    return SyntheticWeb(
+        args.hosts, args.pages, args.links, args.words,
+        duplicate_rate=args.duplicate_rate, trap_rate=args.trap_rate,
+        large_rate=args.large_rate, large_size=args.large_size, seed=args.seed)
+
+
+def web_arguments(args):
+    """Command line for this module that serves the same web as args."""
+    return [
+        "--hosts", str(args.hosts), "--pages", str(args.pages),
+        "--links", str(args.links), "--words", str(args.words),
+        "--duplicate-rate", str(args.duplicate_rate),
+        "--trap-rate", str(args.trap_rate), "--large-rate", str(args.large_rate),
+        "--large-size", str(args.large_size), "--latency", str(args.latency),
+        "--jitter", str(args.jitter), "--seed", str(args.seed)]
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--port", type=int, default=0)
+    add_arguments(parser)
+    args = parser.parse_args()
+    server = make_server(web_from_args(args), args.port, args.latency, args.jitter)
+    # The benchmark runner reads the port from this line.
+    print(f"port {server.server_port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        sys.exit(0)
@@ -0,0 +1,71 @@
+"""Compare PartA.tokenize_text with the original character-loop tokenizer.
+
+Run from the repository root:
+
+    python -m benchmarks.tokenizer [--pages N] [--words W] [--repeat R]
+
+Each synthetic page mixes ASCII words, digits, punctuation and non-ASCII
+letters (including capital sigma). Both tokenizers must return identical
+dicts, in the same order, before any timing is reported.
+"""
+from argparse import ArgumentParser
+import random
+import time
+
+from utils import PartA
+
+VOCABULARY = [
+    "the", "Crawler", "frontier", "ICS", "uci", "edu", "2024", "x86",
+    "café", "naïve", "Straße", "ΟΔΟΣ", "Σίσυφος", "İstanbul", "東京",
+    "données", "n°5", "½", "résumé", "Informatics",
+]
+SEPARATORS = [" ", " ", " ", ", ", ". ", "\n", " - ", "'s ", "_", "/", "(", ") "]
+
+
+def make_page(rng, words):
+    parts = []
+    for _ in range(words):
+        parts.append(rng.choice(VOCABULARY))
+        parts.append(rng.choice(SEPARATORS))
+    return "".join(parts)
+
+
+def best_of(repeat, func, pages):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for page in pages:
+            func(page)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(pages, words, repeat, seed=121):
+    rng = random.Random(seed)
+    corpus = [make_page(rng, words) for _ in range(pages)]
+
+    def original(text):
+        return PartA.countTokens(PartA.text_parser(text))
+
+    for page in corpus:
+        expected = original(page)
+        actual = PartA.tokenize_text(page)
+        assert list(actual.items()) == list(expected.items()), "Tokenizers disagree."
+
+    chars = sum(len(page) for page in corpus)
+    old = best_of(repeat, original, corpus)
+    new = best_of(repeat, PartA.tokenize_text, corpus)
+    print(f"{pages} pages, {chars / 1e6:.1f}M characters, best of {repeat}")
+    print(f"  character loop : {old:8.3f}s  {chars / old / 1e6:7.2f}M chars/s")
+    print(f"  regex + Counter: {new:8.3f}s  {chars / new / 1e6:7.2f}M chars/s")
+    print(f"  speedup        : {old / new:8.1f}x")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--pages", type=int, default=50)
+    parser.add_argument("--words", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    main(args.pages, args.words, args.repeat)
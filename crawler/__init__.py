@@ -1,14 +1,144 @@
+import time
+
 from utils import get_logger
+from utils.metrics import metrics, MetricsServer
+from utils.download import close_session
+from crawler.pipeline import close_parse_pool
+from crawler.archive import (
+    get_response_archive, close_response_archive, remove_response_archive)
+from crawler.dedup import close_duplicate_index, remove_duplicate_index
+from crawler.robots import close_robots_cache
+from utils.aggregates import remove_aggregates
+from utils.statistics import StatisticsCollector
+from utils.stats_store import remove_stats_store
 from crawler.frontier import Frontier
 from crawler.worker import Worker
+from crawler.async_worker import AsyncWorker
+from crawler.replay_worker import ReplayWorker
+
+ENGINES = {
+    "threads": Worker,
+    "asyncio": AsyncWorker,
+}
+
+
+def get_engine(name):
+    try:
+        return ENGINES[name.strip().lower()]
+    except KeyError:
+        raise ValueError(
+            f"Unknown crawl engine {name!r}, "
+            f"expected one of {', '.join(sorted(ENGINES))}.")
+
 
 class Crawler(object):
-    def __init__(self, config, restart, frontier_factory=Frontier, worker_factory=Worker):
+    def __init__(self, config, restart, frontier_factory=Frontier, worker_factory=None):
         self.config = config
         self.logger = get_logger("CRAWLER")
+        if restart:
+            # The statistics describe the crawl being thrown away.
+            remove_stats_store(config.stats_file)
+            remove_aggregates(config.aggregates_file)
+            remove_duplicate_index(config.dedup_file)
+            if not config.replay_file:
+                remove_response_archive(config.archive_file)
+        if config.replay_file:
+            # Pages come off the disk, so there is nobody to be polite to.
+            config.time_delay = 0.0
+            config.rate_control = "fixed"
+            config.robots_max_delay = 0.0
+            if worker_factory is None:
+                worker_factory = ReplayWorker
+            self.logger.info(
+                f"Replaying {len(get_response_archive(config))} responses "
+                f"from {config.replay_file}.")
+        metrics.reset(config.metrics_sample)
         self.frontier = frontier_factory(config, restart)
+        if not restart:
+            self._recover_aggregates()
+        self.metrics_server = None
+        self._closed = False
+        self._metrics_dumped = time.time()
+        metrics.gauge("frontier", self.frontier.metrics)
+        metrics.gauge("rate_control", self.frontier.politeness.metrics)
+        self.workers = list()
+        if worker_factory is None:
+            worker_factory = get_engine(config.engine)
         self.worker_factory = worker_factory
 
+    def _recover_aggregates(self):
+        """Opening the statistics adds the pages the aggregates missed in a
+        crash. Completed pages per subdomain are counted again from the
+        save file, as the crash may have lost some or left others to be
+        completed, and counted, again."""
+        aggregates = StatisticsCollector(
+            self.config.stats_file, self.config.stats_store,
+            aggregates_file=self.config.aggregates_file,
+            checkpoint_interval=self.config.checkpoint_interval,
+            commit_interval=self.config.commit_interval,
+            commit_batch=self.config.commit_batch).aggregates
+        if aggregates is not None and not aggregates.clean:
+            self.logger.info("The crawl was not stopped cleanly, recounting completed pages.")
+            aggregates.recount_completed(self.frontier.completed_urls())
+
+    def start_async(self):
+        if self.config.metrics_port:
+            self.metrics_server = MetricsServer(metrics, self.config.metrics_port)
+            self.logger.info(
+                f"Serving metrics on http://127.0.0.1:{self.metrics_server.port}/")
+        count = getattr(self.worker_factory, "MAX_INSTANCES", None)
+        if count is None:
+            count = self.config.threads_count
+        self.workers = [
+            self.worker_factory(worker_id, self.config, self.frontier)
+            for worker_id in range(count)]
+        for worker in self.workers:
+            worker.start()
+
     def start(self):
-        worker = self.worker_factory(0, self.config, self.frontier)
-        worker.run()
+        self.start_async()
+        try:
+            self.join()
+        finally:
+            self.stop()
+
+    def stop_workers(self):
+        """Have the workers finish the urls they have and stop; start()
+        then returns, closing everything. Safe in a signal handler."""
+        self.frontier.stop()
+
+    def stop(self):
+        """Stop the workers, wait for them, then save and close the
+        frontier, the statistics and the rest. Does nothing once done."""
+        if self._closed:
+            return
+        self.frontier.stop()
+        self.join()
+        self._closed = True
+        if self.metrics_server is not None:
+            self.metrics_server.close()
+            self.metrics_server = None
+        self._dump_metrics()
+        self.frontier.close()
+        close_session()
+        close_parse_pool()
+        close_duplicate_index()
+        close_robots_cache()
+        close_response_archive()
+        StatisticsCollector.close_stores()
+
+    def join(self):
+        # Join with a timeout so the main thread still sees KeyboardInterrupt.
+        for worker in self.workers:
+            while worker.is_alive():
+                worker.join(1)
+                if time.time() - self._metrics_dumped >= self.config.checkpoint_interval:
+                    self._dump_metrics()
+
+    def _dump_metrics(self):
+        self._metrics_dumped = time.time()
+        if self.config.metrics_file:
+            try:
+                metrics.dump(self.config.metrics_file)
+            except OSError:
+                self.logger.exception("Could not write the metrics file.")
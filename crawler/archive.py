@@ -0,0 +1,215 @@
+import json
+import mmap
+import os
+import struct
+import time
+import zlib
+from threading import Lock
+from types import SimpleNamespace
+
+from utils import get_urldigest
+from utils.response import Response
+
+ARCHIVE_HEADER = b"CARCHV\x00\x01"
+# url length, compressed length; then the url and the compressed record
+_RECORD_HEAD = struct.Struct("<II")
+# inside the compressed record: status, metadata length; then the JSON
+# metadata and the body
+_BODY_HEAD = struct.Struct("<HI")
+# <path>.idx entries: url digest, offset of the url's record
+_INDEX = struct.Struct("<16sQ")
+COMPRESS_LEVEL = 6
+
+
+class ResponseArchive(object):
+    """Append-only archive of downloaded responses, so a crawl's pages can
+    be processed again without the cache server.
+
+    `<path>` holds one record per download: the url, then the status,
+    metadata (response url, error, skip reason, headers, fetch time) and
+    body, compressed together with zlib. `<path>.idx` holds the offset of
+    each url's latest record, so reading one is a dict lookup and a slice
+    of an mmap of the archive. Records are only ever appended. The index
+    is written after the archive, so on open, records past its end are
+    indexed again and a torn record at the end of the archive is cut off.
+    """
+
+    def __init__(self, path, readonly=False, commit_interval=1.0):
+        self.path = path
+        self.index_path = path + ".idx"
+        self.readonly = readonly
+        self.commit_interval = commit_interval
+        self.offsets = {}
+        self._lock = Lock()
+        if not readonly and not os.path.exists(path):
+            with open(path, "wb") as f:
+                f.write(ARCHIVE_HEADER)
+        self.file = open(path, "rb" if readonly else "r+b")
+        if self.file.read(len(ARCHIVE_HEADER)) != ARCHIVE_HEADER:
+            self.file.close()
+            raise ValueError(f"{path} is not a response archive.")
+        self._map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        start, index_size = self._load_index()
+        if not readonly:
+            self.index = open(self.index_path, "r+b" if os.path.exists(self.index_path) else "wb")
+            self.index.truncate(index_size)
+            self.index.seek(index_size)
+        self.end = start
+        for offset, url, end in self._scan(start):
+            digest = get_urldigest(url)
+            self.offsets[digest] = offset
+            if not readonly:
+                self.index.write(_INDEX.pack(digest, offset))
+            self.end = end
+        if not readonly:
+            if self.end < len(self._map):
+                self._map.close()
+                self.file.truncate(self.end)
+                self._map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.file.seek(self.end)
+            self.index.flush()
+        self.last_flush = time.time()
+
+    def _load_index(self):
+        """Fill self.offsets from <path>.idx. Returns where the records it
+        does not cover start, and how much of it is usable."""
+        if not os.path.exists(self.index_path):
+            return len(ARCHIVE_HEADER), 0
+        with open(self.index_path, "rb") as f:
+            data = f.read()
+        entries = list(_INDEX.iter_unpack(data[:len(data) - len(data) % _INDEX.size]))
+        if not entries:
+            return len(ARCHIVE_HEADER), 0
+        end = self._record_end(entries[-1][1])
+        if end is None:
+            # The index runs past the archive; build it again.
+            return len(ARCHIVE_HEADER), 0
+        for digest, offset in entries:
+            self.offsets[digest] = offset
+        return end, len(entries) * _INDEX.size
+
+    def _record_end(self, offset):
+        if offset + _RECORD_HEAD.size > len(self._map):
+            return None
+        url_length, length = _RECORD_HEAD.unpack_from(self._map, offset)
+        end = offset + _RECORD_HEAD.size + url_length + length
+        return end if end <= len(self._map) else None
+
+    def _scan(self, offset):
+        """(offset, url, end) of each whole record from offset on."""
+        while True:
+            end = self._record_end(offset)
+            if end is None:
+                return
+            url_length = _RECORD_HEAD.unpack_from(self._map, offset)[0]
+            start = offset + _RECORD_HEAD.size
+            yield offset, self._map[start:start + url_length].decode("utf-8"), end
+            offset = end
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def add(self, url, resp):
+        """Append resp, downloaded for url; it replaces any earlier record
+        of url."""
+        raw = resp.raw_response
+        meta = {"url": resp.url, "error": resp.error, "skipped": resp.skipped,
+                "time": time.time(), "raw": raw is not None}
+        content = b""
+        if raw is not None:
+            headers = getattr(raw, "headers", None)
+            meta["raw_url"] = getattr(raw, "url", resp.url)
+            meta["headers"] = dict(headers) if headers is not None else {}
+            content = getattr(raw, "content", None) or b""
+        meta = json.dumps(meta, default=str).encode("utf-8")
+        # Compressed in pieces, so the body is not copied first.
+        compressor = zlib.compressobj(COMPRESS_LEVEL)
+        record = (compressor.compress(_BODY_HEAD.pack(resp.status, len(meta)) + meta)
+                  + compressor.compress(content) + compressor.flush())
+        url_bytes = url.encode("utf-8")
+        digest = get_urldigest(url)
+        with self._lock:
+            offset = self.end
+            self.file.write(_RECORD_HEAD.pack(len(url_bytes), len(record)))
+            self.file.write(url_bytes)
+            self.file.write(record)
+            self.index.write(_INDEX.pack(digest, offset))
+            self.end = offset + _RECORD_HEAD.size + len(url_bytes) + len(record)
+            self.offsets[digest] = offset
+            if time.time() - self.last_flush >= self.commit_interval:
+                self._flush()
+
+    def _flush(self):
+        # The archive first, so the index never points past it.
+        self.file.flush()
+        self.index.flush()
+        self.last_flush = time.time()
+
+    def get(self, url):
+        """The latest archived Response for url, or None. Its raw_response
+        has only url, content and headers, as with PARSE_PROCESSES."""
+        offset = self.offsets.get(get_urldigest(url))
+        if offset is None:
+            return None
+        if self._record_end(offset) is None:
+            with self._lock:
+                # Written since the archive was mapped.
+                self._flush()
+                self._map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        archive = self._map
+        url_length, length = _RECORD_HEAD.unpack_from(archive, offset)
+        start = offset + _RECORD_HEAD.size + url_length
+        with memoryview(archive)[start:start + length] as record:
+            data = zlib.decompress(record)
+        status, meta_length = _BODY_HEAD.unpack_from(data)
+        meta = json.loads(data[_BODY_HEAD.size:_BODY_HEAD.size + meta_length])
+        resp = Response({"url": meta["url"], "status": status,
+                         "error": meta["error"], "skipped": meta["skipped"]})
+        if meta["raw"]:
+            resp.raw_response = SimpleNamespace(
+                url=meta["raw_url"], content=data[_BODY_HEAD.size + meta_length:],
+                headers=meta["headers"])
+        return resp
+
+    def close(self):
+        with self._lock:
+            if not self.readonly:
+                self._flush()
+                self.index.close()
+            self._map.close()
+            self.file.close()
+
+
+_archive = None
+_archive_lock = Lock()
+
+
+def get_response_archive(config):
+    """Shared ResponseArchive: the one being replayed, else ARCHIVE, or
+    None when there is neither."""
+    global _archive
+    path = config.replay_file or config.archive_file
+    if not path:
+        return None
+    with _archive_lock:
+        if _archive is None:
+            _archive = ResponseArchive(
+                path, readonly=bool(config.replay_file),
+                commit_interval=config.commit_interval)
+        return _archive
+
+
+def close_response_archive():
+    global _archive
+    with _archive_lock:
+        if _archive is not None:
+            _archive.close()
+            _archive = None
+
+
+def remove_response_archive(path):
+    if not path:
+        return
+    for name in (path, path + ".idx"):
+        if os.path.exists(name):
+            os.remove(name)
@@ -0,0 +1,135 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from crawler.dedup import get_duplicate_index
+from crawler.pipeline import (
+    get_parse_pool, analyze_response, analyze_page, page_args)
+from crawler.robots import get_robots_cache
+from crawler.worker import Worker
+from utils.download import AsyncCacheClient
+from utils.metrics import metrics
+
+
+class AsyncWorker(Worker):
+    """Runs the whole crawl on one thread with an asyncio event loop.
+
+    Up to ASYNC_CONCURRENCY downloads are in flight at once. Urls come from
+    the same Frontier as the threaded workers, which still decides when a
+    host may be fetched; between hand-outs the loop sleeps until the next
+    host is due or a download finishes.
+    """
+
+    MAX_INSTANCES = 1
+    # Longest sleep when the frontier cannot say when the next host is due.
+    POLL_INTERVAL = 0.05
+
+    def run(self):
+        asyncio.run(self._crawl())
+
+    async def _crawl(self):
+        concurrency = self.config.async_concurrency
+        client = AsyncCacheClient(self.config, concurrency)
+        # robots.txt and sitemaps are downloaded with the blocking
+        # download() on THREADCOUNT threads, as many as the shared session
+        # keeps connections for.
+        self._robots_pool = ThreadPoolExecutor(
+            self.config.threads_count, thread_name_prefix="robots")
+        # Downloads, and sitemaps being read, which may still add urls.
+        tasks = self._tasks = set()
+        wake = self._wake = asyncio.Event()
+        try:
+            while True:
+                wake.clear()
+                while len(tasks) < concurrency:
+                    tbd_url = self.frontier.get_tbd_url(timeout=0)
+                    if not tbd_url:
+                        break
+                    self._track(asyncio.create_task(self._fetch(client, tbd_url)))
+                # Once stopped, the downloads in flight still finish.
+                if not tasks and self.frontier.is_exhausted():
+                    self.logger.info(
+                        "Crawler stopped." if self.frontier.stopped
+                        else "Frontier is empty. Stopping Crawler.")
+                    break
+                # With every slot taken, a ready host is of no use until a
+                # task finishes, and a timeout of 0 would spin.
+                timeout = None if len(tasks) >= concurrency else self._sleep_time()
+                try:
+                    await asyncio.wait_for(wake.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            await client.close()
+            self._robots_pool.shutdown(wait=False, cancel_futures=True)
+
+    def _track(self, future):
+        self._tasks.add(future)
+        future.add_done_callback(self._untrack)
+
+    def _untrack(self, future):
+        self._tasks.discard(future)
+        self._wake.set()
+        # Downloads log their own failures; sitemaps being read do not.
+        if not future.cancelled() and future.exception() is not None:
+            self.logger.error(
+                "Failed to read sitemaps.", exc_info=future.exception())
+
+    def _sleep_time(self):
+        ready_at = self.frontier.next_ready_time()
+        if ready_at is None:
+            return self.POLL_INTERVAL
+        return max(0.0, ready_at - time.time())
+
+    async def _fetch(self, client, tbd_url):
+        try:
+            if not await self._allowed(tbd_url):
+                return
+            start = time.time()
+            resp = await client.download(tbd_url, self.logger)
+            self._record_fetch(tbd_url, time.time() - start, resp)
+            # Compressing and appending a page is cheap next to parsing it,
+            # which also runs on the loop.
+            self._archive(tbd_url, resp)
+            if not self._check_response(tbd_url, resp):
+                self._record_content(tbd_url, False)
+                return
+            pool = get_parse_pool(self.config)
+            duplicates = get_duplicate_index(self.config)
+            if pool is None:
+                page = analyze_response(tbd_url, resp, duplicates)
+            else:
+                with metrics.timer("analyze"):
+                    page = await asyncio.get_running_loop().run_in_executor(
+                        pool, analyze_page, *page_args(tbd_url, resp), duplicates is not None)
+            self._save_results(tbd_url, page)
+        except Exception:
+            self.logger.exception(f"Failed to process {tbd_url}.")
+        finally:
+            self._complete(tbd_url)
+
+    async def _allowed(self, tbd_url):
+        """Return whether robots.txt lets us download tbd_url.
+
+        Cached rules are checked on the loop. A host's robots.txt is
+        downloaded on the robots threads, and its sitemaps are read there
+        while the crawl goes on.
+        """
+        robots = get_robots_cache(self.config)
+        if robots is None:
+            return True
+        rules = robots.fresh_rules(tbd_url)
+        if rules is None:
+            loop = asyncio.get_running_loop()
+            fetch = lambda url: self._download(url, gate=False)
+            rules, fetched = await loop.run_in_executor(
+                self._robots_pool, robots.rules_for, tbd_url, fetch)
+            if fetched:
+                self._apply_crawl_delay(tbd_url, rules)
+                if rules.sitemaps:
+                    self._track(loop.run_in_executor(
+                        self._robots_pool, self._seed_sitemaps, tbd_url, rules, fetch))
+        if not rules.allowed(tbd_url):
+            self.logger.info(f"Disallowed by robots.txt, skipping: {tbd_url}")
+            return False
+        return True
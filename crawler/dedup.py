@@ -0,0 +1,146 @@
+import os
+import struct
+import time
+from collections import namedtuple
+from hashlib import blake2b
+from threading import Lock
+
+Fingerprint = namedtuple("Fingerprint", ["checksum", "simhash"])
+
+_RECORD = struct.Struct("<16sQ")
+SIMHASH_BITS = 64
+
+
+# SimHash needs, for each of the 64 bits, the total count of the words whose
+# hash has that bit set. Rather than walk the bits of every word, each hash
+# byte is looked up in _SPREAD, which places its 8 bits in 32-bit lanes of
+# one integer; multiplying by the count and adding then updates 8 bit
+# totals at once. A page would need 2**32 words for a lane to overflow.
+_LANE = 32
+_LANE_MASK = (1 << _LANE) - 1
+_SPREAD = [sum(((value >> bit) & 1) << (_LANE * bit) for bit in range(8))
+           for value in range(256)]
+
+
+def page_fingerprint(word_counts):
+    """Fingerprint of a page from its token counts.
+
+    checksum is identical only for pages with exactly the same counts;
+    simhash is a 64-bit SimHash weighted by count, so pages that share most
+    of their words differ in only a few bits.
+    """
+    checksum = blake2b(digest_size=16)
+    for word, count in sorted(word_counts.items()):
+        checksum.update(f"{word}\t{count}\n".encode("utf-8"))
+    lanes = [0] * (SIMHASH_BITS // 8)
+    total = 0
+    for word, count in word_counts.items():
+        digest = blake2b(word.encode("utf-8"), digest_size=8).digest()
+        total += count
+        for i, value in enumerate(digest):
+            lanes[i] += count * _SPREAD[value]
+    # A bit is set when the words hashing it to 1 outweigh the rest.
+    simhash = 0
+    for i, packed in enumerate(lanes):
+        for bit in range(8):
+            if 2 * ((packed >> (_LANE * bit)) & _LANE_MASK) > total:
+                simhash |= 1 << (8 * i + bit)
+    return Fingerprint(checksum.digest(), simhash)
+
+
+class DuplicateIndex(object):
+    """Remembers page fingerprints and spots exact and near duplicates.
+
+    Near duplicates are SimHashes within `max_distance` bits. The 64 bits
+    are cut into max_distance + 1 blocks with one table per block; two
+    hashes that close must agree on at least one whole block, so only pages
+    sharing a block are compared. Fingerprints are appended to `path` so
+    the index survives a resume.
+    """
+
+    def __init__(self, path, max_distance=3, min_words=10):
+        self.path = path
+        self.max_distance = max_distance
+        self.min_words = min_words
+        num_blocks = max_distance + 1
+        bounds = [SIMHASH_BITS * i // num_blocks for i in range(num_blocks + 1)]
+        self.blocks = [
+            (start, (1 << (end - start)) - 1)
+            for start, end in zip(bounds, bounds[1:])]
+        self.tables = [{} for _ in self.blocks]
+        self.checksums = set()
+        self._lock = Lock()
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                data = f.read()
+            usable = len(data) - len(data) % _RECORD.size
+            for checksum, simhash in _RECORD.iter_unpack(data[:usable]):
+                self._add(Fingerprint(checksum, simhash))
+            if usable < len(data):
+                with open(path, "r+b") as f:
+                    f.truncate(usable)
+        self.file = open(path, "ab")
+        self.last_flush = time.time()
+
+    def _add(self, fingerprint):
+        self.checksums.add(fingerprint.checksum)
+        for table, (start, mask) in zip(self.tables, self.blocks):
+            table.setdefault((fingerprint.simhash >> start) & mask, []).append(
+                fingerprint.simhash)
+
+    def _near(self, simhash):
+        for table, (start, mask) in zip(self.tables, self.blocks):
+            for other in table.get((simhash >> start) & mask, ()):
+                if bin(simhash ^ other).count("1") <= self.max_distance:
+                    return True
+        return False
+
+    def check(self, fingerprint, word_count):
+        """Return "exact" or "near" if the page duplicates one seen before,
+        else remember it and return None. Pages under min_words words are
+        never treated as duplicates."""
+        if fingerprint is None or word_count < self.min_words:
+            return None
+        with self._lock:
+            if fingerprint.checksum in self.checksums:
+                return "exact"
+            if self._near(fingerprint.simhash):
+                return "near"
+            self._add(fingerprint)
+            self.file.write(_RECORD.pack(*fingerprint))
+            if time.time() - self.last_flush >= 1.0:
+                self.file.flush()
+                self.last_flush = time.time()
+            return None
+
+    def close(self):
+        with self._lock:
+            self.file.close()
+
+
+_index = None
+_index_lock = Lock()
+
+
+def get_duplicate_index(config):
+    """Shared DuplicateIndex, or None when DEDUP is off."""
+    global _index
+    if not config.dedup:
+        return None
+    with _index_lock:
+        if _index is None:
+            _index = DuplicateIndex(config.dedup_file, config.simhash_distance)
+        return _index
+
+
+def close_duplicate_index():
+    global _index
+    with _index_lock:
+        if _index is not None:
+            _index.close()
+            _index = None
+
+
+def remove_duplicate_index(path):
+    if os.path.exists(path):
+        os.remove(path)
@@ -1,71 +1,390 @@
-import os
-import shelve
+import time
+from hashlib import sha256
+from inspect import getsource
+from heapq import heappush, heappop, heapreplace
+from itertools import count
+from threading import Condition, Lock
+from urllib.parse import urlparse
 
-from utils import get_logger, get_urlhash, normalize
+from utils import get_logger, get_urlhash, normalize, urlhash_to_digest
+import scraper
 from scraper import is_valid
+from crawler.politeness import make_politeness
+from crawler.robots import get_robots_cache
+from crawler.priority import get_priority
+from crawler.store import open_store, remove_store, store_exists, TRAPS_SUFFIX
+from crawler.seen import make_seen_index
+from crawler.spill import SpillQueue
+from crawler.traps import TrapDetector, TrapJournal, BLOCK
+from utils.metrics import metrics
+
+RULES_KEY = "rules_fingerprint"
+TRAPS_KEY = "traps"
+
+
+def rules_fingerprint():
+    """Changes whenever scraper.py, and so possibly is_valid, changes."""
+    return sha256(getsource(scraper).encode("utf-8")).hexdigest()
 
 class Frontier(object):
+    """Host-partitioned frontier.
+
+    Pending urls live in one priority queue per host. Hosts with pending urls
+    that are not currently being downloaded sit in a heap keyed by the time
+    they become eligible under the politeness delay, so get_tbd_url always
+    returns a url whose host may be fetched right now.
+
+    With QUEUE_LIMIT set, at most that many urls are queued in memory. Urls
+    discovered past it, and all urls discovered while any are spilled, go
+    to a SpillQueue on disk in discovery order. Once the queues are down to
+    half the limit, the oldest spilled urls are read back in bulk to fill
+    them again.
+    """
+
     def __init__(self, config, restart):
         self.logger = get_logger("FRONTIER")
         self.config = config
-        self.to_be_downloaded = []
+        self.politeness = make_politeness(config)
+        self.priority = get_priority(config.frontier_priority)
+        # host -> heap of (demotion, priority, seq, url, depth)
+        self.host_queues = {}
+        # heap of (ready_time, host) for idle hosts with pending urls
+        self.ready_hosts = []
+        self.scheduled_hosts = set()
+        # url -> (host, depth) for urls handed to a worker but not completed
+        self.in_progress = {}
+        # host -> number of its urls in progress
+        self.busy_hosts = {}
+        self.queued_count = 0
+        self._seq = count()
+        self._cond = Condition()
+        # Lazy stream of urls left pending by a previous run.
+        self._pending = None
+        self._revalidate = False
+        # Set by stop(); no more urls are handed out.
+        self.stopped = False
+        self._rules = rules_fingerprint()
+        self.traps = TrapDetector(
+            config.trap_max_depth, config.trap_max_repeats,
+            config.trap_pattern_limit, config.trap_param_values,
+            min_yield=config.trap_min_yield, max_patterns=config.trap_max_patterns)
+        self._traps_saved = time.time()
+        # Held by the one worker writing trap changes out, so they are
+        # written in the order they were taken.
+        self._traps_saving = Lock()
+        self.robots = get_robots_cache(config)
+        self.spill = (
+            SpillQueue(config.spill_dir, config.spill_segment)
+            if config.queue_limit > 0 else None)
         
-        if not os.path.exists(self.config.save_file) and not restart:
+        # A shelve backed by dbm.dumb leaves no file at the save path itself.
+        save_exists = store_exists(self.config.save_file)
+        if not save_exists and not restart:
             self.logger.info(
                 f"Did not find save file {self.config.save_file}, "
                 f"starting from seed.")
-        elif os.path.exists(self.config.save_file) and restart:
+        elif save_exists and restart:
             self.logger.info(
                 f"Found save file {self.config.save_file}, deleting it.")
-            os.remove(self.config.save_file)
+            remove_store(self.config.save_file)
         
-        save = shelve.open(self.config.save_file)
-        if restart:
-            for url in self.config.seed_urls:
-                urlhash = get_urlhash(normalize(url))
-                save[urlhash] = (normalize(url), False)
-                self.to_be_downloaded.append(normalize(url))
+        self.store = open_store(
+            self.config.save_file, self.config.store_backend,
+            commit_interval=self.config.commit_interval,
+            commit_batch=self.config.commit_batch)
+        # Duplicate checks are answered from memory; the store is only
+        # written to, except for this one pass at startup.
+        self.seen = make_seen_index(
+            self.config.seen_index, self.config.bloom_capacity,
+            self.config.bloom_fp_rate)
+        for urlhash in self.store.hashes():
+            self.seen.add(urlhash_to_digest(urlhash))
+        self.trap_journal = TrapJournal(self.config.save_file + TRAPS_SUFFIX)
+        if not self.trap_journal.load(self.traps):
+            # Saves from before the journal kept the whole state in meta.
+            traps = self.store.get_meta(TRAPS_KEY)
+            if traps is not None:
+                self.traps.loads(traps)
+        if restart or len(self.store) == 0:
+            self._add_seeds()
+            self.store.set_meta(RULES_KEY, self._rules)
         else:
-            total_count = len(save)
-            tbd_count = 0
-            for url, completed in save.values():
-                if not completed and is_valid(url):
-                    self.to_be_downloaded.append(url)
-                    tbd_count += 1
-            if tbd_count == 0 and total_count == 0:
-                for url in self.config.seed_urls:
-                    urlhash = get_urlhash(normalize(url))
-                    save[urlhash] = (normalize(url), False)
-                    self.to_be_downloaded.append(normalize(url))
-            else:
-                self.logger.info(
-                    f"Found {tbd_count} urls to be downloaded from {total_count} "
-                    f"total urls discovered.")
-        save.close()
-
-    def get_tbd_url(self):
-        if self.to_be_downloaded:
-            return self.to_be_downloaded.pop(0)
-        return None
-
-    def add_url(self, url):
+            total_count = len(self.store)
+            tbd_count = self.store.count_pending()
+            # Pending urls passed is_valid when they were added, so they only
+            # need checking again if the rules changed since.
+            self._revalidate = self.store.get_meta(RULES_KEY) != self._rules
+            self._pending = self.store.iter_pending(self.config.resume_batch)
+            self._refill()
+            self.logger.info(
+                f"Found {tbd_count} urls to be downloaded from {total_count} "
+                f"total urls discovered."
+                + (" Scraper rules changed, re-validating them."
+                   if self._revalidate else ""))
+        self.store.commit()
+
+    def _add_seeds(self):
+        for url in self.config.seed_urls:
+            url = normalize(url)
+            urlhash = get_urlhash(url)
+            digest = urlhash_to_digest(urlhash)
+            if digest in self.seen:
+                continue
+            self.seen.add(digest)
+            self.store.put(urlhash, url, False)
+            self._enqueue(url, 0)
+
+    def _refill(self):
+        """Stream pending urls from the store until a batch is queued,
+        then read spilled urls back if there is room."""
+        batch = self.config.resume_batch
+        if self.spill is not None:
+            batch = min(batch, self.config.queue_limit)
+        while self._pending is not None and self.queued_count < batch:
+            entry = next(self._pending, None)
+            if entry is None:
+                self._pending = None
+                if self._revalidate:
+                    self.store.set_meta(RULES_KEY, self._rules)
+                    self._revalidate = False
+                break
+            urlhash, url = entry
+            if self._revalidate and not is_valid(url):
+                self.store.delete(urlhash)
+                continue
+            self._enqueue(url, 0)
+        self._refill_spilled()
+
+    def _refill_spilled(self):
+        """Read spilled urls back once the queues are half empty. Urls
+        pending from a previous run are older, so they go first."""
+        if (self.spill is None or not len(self.spill) or self._pending is not None
+                or self.queued_count > self.config.queue_limit // 2):
+            return
+        with metrics.timer("refill"):
+            entries = self.spill.pop_many(self.config.queue_limit - self.queued_count)
+            for demotion, depth, url in entries:
+                self._enqueue(url, depth, demotion)
+        metrics.incr("refilled", len(entries))
+
+    def _add_pending(self, url, depth, demotion):
+        """Queue a newly discovered url, or spill it when the queues are
+        full or older urls are already spilled."""
+        if self.spill is not None and (
+                len(self.spill) or self.queued_count >= self.config.queue_limit):
+            self.spill.push(demotion, depth, url)
+            metrics.incr("spilled")
+            return
+        self._enqueue(url, depth, demotion)
+
+    def _enqueue(self, url, depth, demotion=0):
+        host = urlparse(url).netloc
+        queue = self.host_queues.get(host)
+        if queue is None:
+            queue = self.host_queues[host] = []
+        heappush(queue, (demotion, self.priority(url, depth), next(self._seq), url, depth))
+        self.queued_count += 1
+        self._schedule(host)
+
+    def _schedule(self, host):
+        """Put a host with pending urls and room for another download on
+        the ready heap."""
+        if host in self.scheduled_hosts or host not in self.host_queues:
+            return
+        if self.busy_hosts.get(host, 0) >= self.politeness.host_limit(host):
+            return
+        heappush(self.ready_hosts, (self.politeness.ready_at(host), host))
+        self.scheduled_hosts.add(host)
+
+    def _pop_ready(self):
+        ready_time, host = heappop(self.ready_hosts)
+        self.scheduled_hosts.discard(host)
+        queue = self.host_queues[host]
+        *_, url, depth = heappop(queue)
+        if not queue:
+            del self.host_queues[host]
+        self.queued_count -= 1
+        self.politeness.claim(host)
+        self.busy_hosts[host] = self.busy_hosts.get(host, 0) + 1
+        self.in_progress[url] = (host, depth)
+        self._schedule(host)
+        return url
+
+    def get_tbd_url(self, timeout=None):
+        """Return a url whose host is ready now.
+
+        Blocks until one becomes ready, or until `timeout` seconds pass.
+        Returns None on timeout, or when nothing is queued or in progress
+        or the frontier was stopped, which means the crawl is over.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            while True:
+                if self.stopped:
+                    return None
+                self._refill()
+                now = time.time()
+                if self.ready_hosts and self.ready_hosts[0][0] <= now:
+                    ready_time, host = self.ready_hosts[0]
+                    due = self.politeness.ready_at(host)
+                    if due > ready_time:
+                        # The host was slowed down after it was scheduled.
+                        heapreplace(self.ready_hosts, (due, host))
+                        continue
+                    return self._pop_ready()
+                if not self.ready_hosts and not self.in_progress and self._pending is None:
+                    return None
+                if deadline is not None and now >= deadline:
+                    return None
+                self.store.maybe_commit()
+                wait_until = self.ready_hosts[0][0] if self.ready_hosts else None
+                if deadline is not None:
+                    wait_until = deadline if wait_until is None else min(wait_until, deadline)
+                self._cond.wait(None if wait_until is None else wait_until - now)
+
+    def next_ready_time(self):
+        """When the next queued host may be fetched, or None if none is queued."""
+        with self._cond:
+            if self.stopped:
+                return None
+            return self.ready_hosts[0][0] if self.ready_hosts else None
+
+    def is_exhausted(self):
+        """True when nothing is queued and no worker can add more urls, or
+        once the frontier is stopped."""
+        with self._cond:
+            return self.stopped or (
+                not self.queued_count and not self.in_progress and self._pending is None
+                and not (self.spill and len(self.spill)))
+
+    def add_url(self, url, parent=None):
         url = normalize(url)
         urlhash = get_urlhash(url)
-        save = shelve.open(self.config.save_file)
-        if urlhash not in save:
-            save[urlhash] = (url, False)
-            save.sync()
-            save.close()
-            self.to_be_downloaded.append(url)
-        else:
-            save.close()
+        digest = urlhash_to_digest(urlhash)
+        with self._cond:
+            if digest not in self.seen:
+                self.seen.add(digest)
+                # Only rules already downloaded are checked here; workers
+                # check the rest before downloading. Checked first, so that
+                # disallowed urls do not count towards their trap pattern.
+                rules = self.robots.known_rules(url) if self.robots else None
+                if rules is not None and not rules.allowed(url):
+                    self.logger.debug(f"Disallowed by robots.txt {url}.")
+                    return
+                demotion = self.traps.check(url)
+                if demotion == BLOCK:
+                    # Remembered as seen so it is not checked again, but not
+                    # saved: on resume the saved trap state blocks it anew.
+                    self.logger.debug(f"Blocked likely crawler trap {url}.")
+                    return
+                self.store.put(urlhash, url, False)
+                parent_depth = self.in_progress.get(parent, (None, -1))[1]
+                self._add_pending(url, parent_depth + 1, demotion)
+                self._cond.notify_all()
     
     def mark_url_complete(self, url):
+        """Save url as completed. Returns whether it was in progress, that
+        is, False for a url completed before or never handed out."""
         urlhash = get_urlhash(url)
-        save = shelve.open(self.config.save_file)
-        if urlhash not in save:
-            self.logger.error(
-                f"Completed url {url}, but have not seen it before.")
-        save[urlhash] = (url, True)
-        save.sync()
-        save.close()
+        with self._cond:
+            if urlhash_to_digest(urlhash) not in self.seen:
+                self.logger.error(
+                    f"Completed url {url}, but have not seen it before.")
+            self.store.put(urlhash, url, True)
+            host, _ = self.in_progress.pop(url, (None, None))
+            if host is not None:
+                if self.busy_hosts[host] > 1:
+                    self.busy_hosts[host] -= 1
+                else:
+                    del self.busy_hosts[host]
+                self._schedule(host)
+            trap_changes = self._take_trap_changes()
+            self._cond.notify_all()
+        if trap_changes is not None:
+            self._save_traps(trap_changes)
+        return host is not None
+
+    def completed_urls(self):
+        """Yield the urls saved as completed. For use before the workers
+        start, as it reads the whole store."""
+        for url, completed in self.store.values():
+            if completed:
+                yield url
+
+    def set_crawl_delay(self, host, delay):
+        """Apply a robots.txt Crawl-delay to host."""
+        self.politeness.set_delay(host, delay)
+
+    def metrics(self):
+        """Queue depths, for the metrics endpoint."""
+        with self._cond:
+            return {
+                "queued": self.queued_count,
+                "in_progress": len(self.in_progress),
+                "hosts_queued": len(self.host_queues),
+                "hosts_ready": len(self.ready_hosts),
+                "hosts_busy": len(self.busy_hosts),
+                "seen": len(self.seen),
+                "resuming": self._pending is not None,
+                "spilled": len(self.spill) if self.spill else 0,
+            }
+
+    def record_fetch(self, url, latency, status):
+        """Tell the rate control how long a download took and its status."""
+        host = urlparse(url).netloc
+        self.politeness.record(host, latency, status)
+        with self._cond:
+            # A host given room for another download can be scheduled now.
+            self._schedule(host)
+            self._cond.notify_all()
+
+    def record_content(self, url, is_new):
+        """Tell the trap detector whether a downloaded url gave new content."""
+        with self._cond:
+            self.traps.record_fetch(url, is_new)
+
+    def _take_trap_changes(self):
+        """The trap rows changed since the last save, once per
+        CHECKPOINT_INTERVAL, else None. Called with the lock held; the
+        caller saves them with _save_traps after releasing it."""
+        if time.time() - self._traps_saved < self.config.checkpoint_interval:
+            return None
+        if not self._traps_saving.acquire(blocking=False):
+            # Another worker is still writing the last ones.
+            return None
+        self._traps_saved = time.time()
+        self._log_rates()
+        return self.traps.take_changes()
+
+    def _save_traps(self, trap_changes):
+        try:
+            self.trap_journal.append(trap_changes)
+        finally:
+            self._traps_saving.release()
+
+    def _log_rates(self):
+        rates = self.politeness.metrics()
+        if rates.get("backed_off_hosts") or rates.get("paused_for"):
+            self.logger.info(
+                f"Rate control: {rates['backed_off_hosts']} hosts slowed down, "
+                f"all hosts paused for {rates['paused_for']:.1f}s "
+                f"after {rates['cache_errors']} cache server failures.")
+
+    def stop(self):
+        """Stop handing out urls. Workers finish, and complete, the urls
+        they have; the frontier stays open until close()."""
+        with self._cond:
+            self.stopped = True
+            self._cond.notify_all()
+
+    def close(self):
+        """Commit outstanding writes and release the save file."""
+        with self._cond:
+            if self.store is not None:
+                with self._traps_saving:
+                    self.trap_journal.append(self.traps.take_changes())
+                    self.trap_journal.close()
+                self.store.close()
+                self.store = None
+                if self.spill is not None:
+                    self.spill.close()
@@ -0,0 +1,176 @@
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import AuthenticationError, get_context
+from multiprocessing.connection import Client, Listener
+from threading import Lock, Thread
+from types import SimpleNamespace
+
+import scraper
+from crawler.dedup import Fingerprint, get_duplicate_index, page_fingerprint
+from utils.metrics import metrics
+from utils.page_parser import parse_response
+from utils.response import Response
+from utils.statistics import StatisticsCollector
+
+# Parsing stage shared by the worker engines. With PARSE_PROCESSES = 0 it
+# runs inline on the fetching thread; otherwise the raw page is handed to a
+# process pool so parsing does not hold the GIL the fetchers need.
+
+_pool = None
+_duplicate_server = None
+_pool_lock = Lock()
+# In a parse process, its connection to the crawler's DuplicateIndex.
+_remote_duplicates = None
+
+
+def get_parse_pool(config):
+    """Shared process pool for analyze_page, or None to parse inline."""
+    global _pool, _duplicate_server
+    if config.parse_processes <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            initializer, initargs = None, ()
+            duplicates = get_duplicate_index(config)
+            if duplicates is not None:
+                _duplicate_server = DuplicateServer(duplicates)
+                initializer = _connect_duplicates
+                initargs = (_duplicate_server.address, _duplicate_server.authkey)
+            # Workers and the frontier's database are already running, so
+            # start clean interpreters rather than forking this one.
+            _pool = ProcessPoolExecutor(
+                max_workers=config.parse_processes, mp_context=get_context("spawn"),
+                initializer=initializer, initargs=initargs)
+        return _pool
+
+
+def close_parse_pool():
+    global _pool, _duplicate_server
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True)
+            _pool = None
+        if _duplicate_server is not None:
+            _duplicate_server.close()
+            _duplicate_server = None
+
+
+class DuplicateServer(object):
+    """Answers DuplicateIndex.check for the parse processes.
+
+    Each process connects once, and asks about every page it fingerprints
+    before it extracts links, so a duplicate page goes no further. The
+    index itself stays in the crawler process.
+    """
+
+    def __init__(self, duplicates):
+        self.duplicates = duplicates
+        self.authkey = os.urandom(16)
+        self.listener = Listener(("127.0.0.1", 0), authkey=self.authkey)
+        self.address = self.listener.address
+        Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                conn = self.listener.accept()
+            except AuthenticationError:
+                continue
+            except OSError:
+                return
+            Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn):
+        with conn:
+            while True:
+                try:
+                    checksum, simhash, word_count = conn.recv()
+                except (EOFError, OSError):
+                    return
+                conn.send(self.duplicates.check(Fingerprint(checksum, simhash), word_count))
+
+    def close(self):
+        self.listener.close()
+
+
+class RemoteDuplicates(object):
+    """DuplicateIndex.check in a parse process, asked of a DuplicateServer."""
+
+    def __init__(self, address, authkey):
+        self.conn = Client(address, authkey=authkey)
+
+    def check(self, fingerprint, word_count):
+        self.conn.send((fingerprint.checksum, fingerprint.simhash, word_count))
+        return self.conn.recv()
+
+
+def _connect_duplicates(address, authkey):
+    global _remote_duplicates
+    _remote_duplicates = RemoteDuplicates(address, authkey)
+
+
+# links is empty for a duplicate page; duplicate says "exact" or "near" for
+# one and is None otherwise. fingerprint is None unless it was asked for.
+PageAnalysis = namedtuple(
+    "PageAnalysis", ["links", "word_counts", "fingerprint", "duplicate"])
+
+
+def analyze_response(url, resp, duplicates=None, fingerprint=False):
+    """Return a PageAnalysis for a downloaded page.
+
+    word_counts is None for pages that do not count towards statistics.
+    Those pages are fingerprinted when `fingerprint` is set or a
+    DuplicateIndex is given, and with one, a duplicate page is not handed
+    to the scraper at all.
+    """
+    word_counts = None
+    page_fp = None
+    if resp.status == 200 and resp.body:
+        # parse_response caches the parse, so the scraper reuses it.
+        with metrics.timer("parse"):
+            word_counts = StatisticsCollector().count_words(parse_response(resp).text)
+        if fingerprint or duplicates is not None:
+            with metrics.timer("fingerprint"):
+                page_fp = page_fingerprint(word_counts)
+    page = check_duplicate(PageAnalysis(None, word_counts, page_fp, None), duplicates)
+    if page.duplicate:
+        return page
+    with metrics.timer("links"):
+        links = scraper.scraper(url, resp)
+    return page._replace(links=links)
+
+
+def check_duplicate(page, duplicates):
+    """Look page up in the DuplicateIndex, adding it if it is new."""
+    if duplicates is None or page.fingerprint is None or page.duplicate:
+        return page
+    duplicate = duplicates.check(page.fingerprint, sum(page.word_counts.values()))
+    if duplicate:
+        return page._replace(links=[], duplicate=duplicate)
+    return page
+
+
+def page_args(url, resp):
+    """The picklable parts of resp that analyze_page needs."""
+    raw = resp.raw_response
+    if not raw:
+        return url, resp.status, resp.url, None, None
+    headers = getattr(raw, "headers", None)
+    return (url, resp.status, resp.url, getattr(raw, "content", None),
+            dict(headers) if headers is not None else None)
+
+
+def analyze_page(url, status, resp_url, content, headers, check_duplicates=False):
+    """analyze_response for a page sent to the process pool as raw bytes.
+
+    With check_duplicates, the page is looked up in the crawler's
+    DuplicateIndex through the pool's DuplicateServer, and a duplicate is
+    not handed to the scraper.
+    """
+    resp = Response({"url": resp_url, "status": status})
+    if content is not None:
+        resp.raw_response = SimpleNamespace(
+            url=resp_url, content=content, headers=headers or {})
+    return analyze_response(
+        url, resp, _remote_duplicates if check_duplicates else None)
@@ -0,0 +1,187 @@
+from threading import Lock
+import time
+
+# Statuses that mean a host is struggling or asking us to slow down.
+HOST_ERRORS = frozenset([429, 500, 502, 503, 504])
+# download() reports a cache server it cannot reach as status 600.
+CACHE_ERROR = 600
+
+
+class PolitenessScheduler(object):
+    """Per-netloc request spacing shared by everything that downloads.
+
+    The frontier asks ready_at() when a host may be fetched again and calls
+    claim() when it hands a url of that host to a worker, so requests to the
+    same host stay at least `delay` seconds apart while different hosts are
+    served in parallel.
+    """
+
+    def __init__(self, delay):
+        self.delay = delay
+        self._next_slot = {}
+        # host -> delay for hosts that ask for more than `delay`
+        self._delays = {}
+        self._lock = Lock()
+
+    def set_delay(self, host, delay):
+        """Space requests to host `delay` seconds apart, e.g. for a
+        robots.txt Crawl-delay; never less than the default delay."""
+        with self._lock:
+            if delay > self.delay:
+                self._delays[host] = delay
+            else:
+                self._delays.pop(host, None)
+
+    def ready_at(self, host):
+        with self._lock:
+            return self._next_slot.get(host, 0.0)
+
+    def claim(self, host, now=None):
+        if now is None:
+            now = time.time()
+        with self._lock:
+            self._next_slot[host] = (
+                max(now, self._next_slot.get(host, now))
+                + self._delays.get(host, self.delay))
+
+    def host_limit(self, host):
+        """How many urls of host may be downloading at once."""
+        return 1
+
+    def record(self, host, latency, status):
+        """Note how a download from host went; fixed spacing ignores it."""
+
+    def metrics(self):
+        with self._lock:
+            return {"delay": self.delay, "hosts": len(self._next_slot),
+                    "crawl_delays": dict(self._delays)}
+
+
+class AdaptivePoliteness(PolitenessScheduler):
+    """Politeness that adapts each host's pace to how the host copes.
+
+    The configured delay (or a larger robots.txt Crawl-delay) is a floor.
+    A host that answers 429 or 5xx has its delay doubled, up to `max_delay`,
+    and its concurrency halved; every success takes a quarter of the way
+    back to the floor. A host that stays healthy and answers slower than
+    its delay may have one more download in flight after each run of
+    `window` successes, up to `max_concurrency`, as overlapping slow
+    requests still start `delay` apart.
+
+    A download the cache server could not serve (status 600) pauses every
+    host for a global backoff that doubles with each failure and halves
+    with each success.
+    """
+
+    # Weight of the newest sample in the moving averages.
+    ALPHA = 0.2
+    # Error rate above which a host is not given more concurrency.
+    MAX_ERROR_RATE = 0.05
+
+    def __init__(self, delay, max_delay=60.0, max_concurrency=1, window=10):
+        super().__init__(delay)
+        self.max_delay = max_delay
+        self.max_concurrency = max_concurrency
+        self.window = window
+        # host -> {"delay", "concurrency", "latency", "error_rate",
+        #          "streak", "fetches", "errors"}
+        self._hosts = {}
+        self._last_claim = {}
+        self.global_backoff = 0.0
+        self.paused_until = 0.0
+        self.cache_errors = 0
+
+    def _state(self, host):
+        state = self._hosts.get(host)
+        if state is None:
+            state = self._hosts[host] = {
+                "delay": self.delay, "concurrency": 1, "latency": 0.0,
+                "error_rate": 0.0, "streak": 0, "fetches": 0, "errors": 0}
+        return state
+
+    def _floor(self, host):
+        return self._delays.get(host, self.delay)
+
+    def ready_at(self, host):
+        # From the last claim and the current delay, so a delay raised by a
+        # failure also holds back a host that was already scheduled.
+        with self._lock:
+            last = self._last_claim.get(host)
+            ready = 0.0
+            if last is not None:
+                state = self._hosts.get(host)
+                delay = state["delay"] if state else self.delay
+                ready = last + max(delay, self._floor(host))
+            return max(ready, self.paused_until)
+
+    def claim(self, host, now=None):
+        if now is None:
+            now = time.time()
+        with self._lock:
+            self._last_claim[host] = max(now, self._last_claim.get(host, now))
+
+    def host_limit(self, host):
+        with self._lock:
+            state = self._hosts.get(host)
+            return state["concurrency"] if state else 1
+
+    def record(self, host, latency, status):
+        now = time.time()
+        with self._lock:
+            if status == CACHE_ERROR:
+                self.cache_errors += 1
+                self.global_backoff = min(
+                    self.max_delay, max(2 * self.global_backoff, self.delay, 1.0))
+                self.paused_until = max(self.paused_until, now + self.global_backoff)
+                return
+            self.global_backoff /= 2
+            state = self._state(host)
+            floor = self._floor(host)
+            state["fetches"] += 1
+            error = status in HOST_ERRORS
+            state["error_rate"] += self.ALPHA * (error - state["error_rate"])
+            if error:
+                state["errors"] += 1
+                state["streak"] = 0
+                state["delay"] = min(self.max_delay, 2 * max(state["delay"], floor, 0.5))
+                state["concurrency"] = max(1, state["concurrency"] // 2)
+                return
+            state["latency"] += self.ALPHA * (latency - state["latency"])
+            state["delay"] = max(floor, state["delay"] - (state["delay"] - floor) / 4)
+            if state["delay"] - floor < 0.01:
+                state["delay"] = floor
+            state["streak"] += 1
+            if (state["streak"] >= self.window
+                    and state["concurrency"] < self.max_concurrency
+                    and state["error_rate"] < self.MAX_ERROR_RATE
+                    and state["latency"] > state["delay"]):
+                state["concurrency"] += 1
+                state["streak"] = 0
+
+    def metrics(self):
+        with self._lock:
+            hosts = {host: {key: state[key] for key in (
+                         "delay", "concurrency", "latency", "error_rate",
+                         "fetches", "errors")}
+                     for host, state in self._hosts.items()}
+            return {
+                "delay": self.delay,
+                "global_backoff": self.global_backoff,
+                "paused_for": max(0.0, self.paused_until - time.time()),
+                "cache_errors": self.cache_errors,
+                "backed_off_hosts": sum(
+                    1 for host, state in self._hosts.items()
+                    if state["delay"] > self._floor(host)),
+                "hosts": hosts,
+            }
+
+
+def make_politeness(config):
+    kind = config.rate_control.strip().lower()
+    if kind == "fixed":
+        return PolitenessScheduler(config.time_delay)
+    if kind == "adaptive":
+        return AdaptivePoliteness(
+            config.time_delay, config.rate_max_delay, config.max_host_concurrency)
+    raise ValueError(
+        f"Unknown rate control {config.rate_control!r}, expected fixed or adaptive.")
@@ -0,0 +1,30 @@
+# Frontier priorities. Each takes (url, depth) and returns a sort key;
+# lower keys are downloaded first within a host. Ties keep discovery order.
+
+
+def fifo_priority(url, depth):
+    return 0
+
+
+def bfs_priority(url, depth):
+    return depth
+
+
+def dfs_priority(url, depth):
+    return -depth
+
+
+PRIORITIES = {
+    "fifo": fifo_priority,
+    "bfs": bfs_priority,
+    "dfs": dfs_priority,
+}
+
+
+def get_priority(name):
+    try:
+        return PRIORITIES[name.strip().lower()]
+    except KeyError:
+        raise ValueError(
+            f"Unknown frontier priority {name!r}, "
+            f"expected one of {', '.join(sorted(PRIORITIES))}.")
@@ -0,0 +1,28 @@
+from crawler.archive import get_response_archive
+from crawler.worker import Worker
+from utils.metrics import metrics
+from utils.response import Response
+
+
+class ReplayWorker(Worker):
+    """Crawls a ResponseArchive instead of the cache server.
+
+    Urls still come from the frontier, and pages go through the same robots
+    rules, scraper, dedup and statistics as in a live crawl, so changes to
+    any of them can be tried on an earlier crawl's pages at disk speed. A
+    url the archive does not have, such as a link the old scraper did not
+    find, gets a 404.
+    """
+
+    def _download(self, url, logger=None, gate=True):
+        with metrics.timer("replay"):
+            resp = get_response_archive(self.config).get(url)
+        if resp is None:
+            metrics.incr("replay_misses")
+            if logger:
+                logger.info(f"Not in the response archive: {url}")
+            return Response({
+                "error": f"{url} is not in the response archive.",
+                "status": 404,
+                "url": url})
+        return resp
@@ -0,0 +1,244 @@
+import gzip
+import re
+import time
+from threading import Event, Lock
+from urllib.parse import urlparse, urljoin
+
+_LOC = re.compile(rb"<loc>\s*(.*?)\s*</loc>", re.IGNORECASE | re.DOTALL)
+_SITEMAP_INDEX = re.compile(rb"<sitemapindex[\s>]", re.IGNORECASE)
+
+
+class RobotsRules(object):
+    """The rules of one robots.txt group, compiled for matching.
+
+    Matching follows RFC 9309: the longest matching pattern decides, allow
+    wins a tie, and "*" and a trailing "$" are wildcards. Patterns without
+    wildcards are plain prefix checks; the rest become regexes. Rules are
+    kept longest first, so the first match is the answer.
+    """
+
+    def __init__(self, rules=(), crawl_delay=None, sitemaps=()):
+        self.crawl_delay = crawl_delay
+        self.sitemaps = list(sitemaps)
+        compiled = []
+        for allow, pattern in rules:
+            if not pattern:
+                # "Disallow:" with no path allows everything.
+                continue
+            if "*" in pattern or pattern.endswith("$"):
+                anchored = pattern.endswith("$")
+                body = pattern[:-1] if anchored else pattern
+                regex = ".*".join(re.escape(part) for part in body.split("*"))
+                matcher = re.compile(regex + ("$" if anchored else "")).match
+            else:
+                matcher = _prefix_matcher(pattern)
+            compiled.append((len(pattern), allow, matcher))
+        compiled.sort(key=lambda rule: (-rule[0], not rule[1]))
+        self._rules = [(allow, matcher) for _, allow, matcher in compiled]
+
+    def allowed(self, url):
+        parsed = urlparse(url)
+        path = parsed.path or "/"
+        if parsed.query:
+            path += "?" + parsed.query
+        for allow, matcher in self._rules:
+            if matcher(path):
+                return allow
+        return True
+
+
+def _prefix_matcher(prefix):
+    return lambda path: path.startswith(prefix)
+
+
+ALLOW_ALL = RobotsRules()
+
+
+def parse_robots(text, user_agent):
+    """RobotsRules for user_agent from the text of a robots.txt.
+
+    The groups naming user_agent's product token, the part before any
+    "/", apply, compared without case; if none does, the "*" groups do.
+    Sitemap lines apply to every agent.
+    """
+    product = _product_token(user_agent)
+    groups = {"specific": [], "any": []}
+    delays = {"specific": None, "any": None}
+    sitemaps = []
+    targets = []
+    in_rules = False
+    for line in text.splitlines():
+        line = line.split("#", 1)[0].strip()
+        if ":" not in line:
+            continue
+        field, _, value = line.partition(":")
+        field = field.strip().lower()
+        value = value.strip()
+        if field == "user-agent":
+            if in_rules:
+                # A user-agent line after rules starts a new group.
+                targets = []
+                in_rules = False
+            token = _product_token(value)
+            if token == "*":
+                targets.append("any")
+            elif token and token == product:
+                targets.append("specific")
+        elif field in ("allow", "disallow"):
+            in_rules = True
+            for target in targets:
+                groups[target].append((field == "allow", value))
+        elif field == "crawl-delay":
+            in_rules = True
+            try:
+                delay = float(value)
+            except ValueError:
+                continue
+            for target in targets:
+                delays[target] = delay
+        elif field == "sitemap" and value:
+            sitemaps.append(value)
+    chosen = "specific" if groups["specific"] or delays["specific"] is not None else "any"
+    return RobotsRules(groups[chosen], delays[chosen], sitemaps)
+
+
+def _product_token(user_agent):
+    return user_agent.split("/", 1)[0].strip().lower()
+
+
+class RobotsCache(object):
+    """Parsed robots.txt rules per scheme and host, kept for `ttl` seconds.
+
+    rules_for() downloads robots.txt the first time a host is seen, through
+    whatever `fetch` it is given, while other callers asking for the same
+    host wait for that one download. A missing robots.txt (4xx) allows
+    everything; one that could not be fetched allows everything too, but
+    is tried again after ERROR_TTL seconds.
+    """
+
+    ERROR_TTL = 600.0
+
+    def __init__(self, user_agent, ttl=86400.0, max_delay=30.0):
+        self.user_agent = user_agent
+        self.ttl = ttl
+        self.max_delay = max_delay
+        # "scheme://netloc" -> (expires, RobotsRules)
+        self._rules = {}
+        self._fetching = {}
+        self._lock = Lock()
+
+    def known_rules(self, url):
+        """Cached rules for url's host, or None without downloading them."""
+        parsed = urlparse(url)
+        with self._lock:
+            entry = self._rules.get(f"{parsed.scheme}://{parsed.netloc}")
+        return entry[1] if entry is not None else None
+
+    def fresh_rules(self, url):
+        """Like known_rules, but None once the rules are past their ttl, when
+        rules_for would download them again."""
+        parsed = urlparse(url)
+        with self._lock:
+            entry = self._rules.get(f"{parsed.scheme}://{parsed.netloc}")
+        return entry[1] if entry is not None and entry[0] > time.time() else None
+
+    def rules_for(self, url, fetch):
+        """(rules, fetched) for url's host; fetched is True for the one
+        caller whose call downloaded them."""
+        parsed = urlparse(url)
+        site = f"{parsed.scheme}://{parsed.netloc}"
+        with self._lock:
+            entry = self._rules.get(site)
+            if entry is not None and entry[0] > time.time():
+                return entry[1], False
+            pending = self._fetching.get(site)
+            owner = pending is None
+            if owner:
+                pending = self._fetching[site] = Event()
+        if not owner:
+            pending.wait()
+            with self._lock:
+                return self._rules[site][1], False
+        rules, ttl = ALLOW_ALL, self.ERROR_TTL
+        try:
+            rules, ttl = self._download(site, fetch)
+        finally:
+            with self._lock:
+                self._rules[site] = (time.time() + ttl, rules)
+                del self._fetching[site]
+            pending.set()
+        return rules, True
+
+    def _download(self, site, fetch):
+        resp = fetch(site + "/robots.txt")
+        if resp.status == 200 and resp.raw_response is not None:
+            text = (resp.raw_response.content or b"").decode("utf-8", "replace")
+            rules = parse_robots(text, self.user_agent)
+            if rules.crawl_delay is not None:
+                rules.crawl_delay = min(rules.crawl_delay, self.max_delay)
+            return rules, self.ttl
+        if 400 <= resp.status < 500:
+            return ALLOW_ALL, self.ttl
+        return ALLOW_ALL, self.ERROR_TTL
+
+
+def sitemap_urls(sitemaps, fetch, limit=10000, max_depth=2, delay=0.0):
+    """Yield up to `limit` page urls listed in the given sitemaps.
+
+    Sitemap index files are followed `max_depth` levels deep, and gzipped
+    sitemaps are decompressed. Sitemaps that fail to download are skipped.
+    Downloads are `delay` seconds apart, as they all go to the same host.
+    """
+    queue = [(url, 0) for url in sitemaps]
+    seen = set()
+    count = 0
+    while queue and count < limit:
+        sitemap, depth = queue.pop(0)
+        if sitemap in seen:
+            continue
+        seen.add(sitemap)
+        if len(seen) > 1:
+            time.sleep(delay)
+        resp = fetch(sitemap)
+        if resp.status != 200 or resp.raw_response is None:
+            continue
+        content = resp.raw_response.content or b""
+        if content[:2] == b"\x1f\x8b":
+            try:
+                content = gzip.decompress(content)
+            except (OSError, EOFError):
+                continue
+        is_index = _SITEMAP_INDEX.search(content) is not None
+        for match in _LOC.finditer(content):
+            url = urljoin(sitemap, match.group(1).decode("utf-8", "replace")
+                          .replace("&amp;", "&"))
+            if is_index:
+                if depth < max_depth:
+                    queue.append((url, depth + 1))
+                continue
+            yield url
+            count += 1
+            if count >= limit:
+                return
+
+
+_cache = None
+_cache_lock = Lock()
+
+
+def get_robots_cache(config):
+    """Shared RobotsCache, or None when ROBOTS is off."""
+    global _cache
+    if not config.robots:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = RobotsCache(
+                config.user_agent, config.robots_ttl, config.robots_max_delay)
+        return _cache
+
+
+def close_robots_cache():
+    global _cache
+    with _cache_lock:
+        _cache = None
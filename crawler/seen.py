@@ -0,0 +1,66 @@
+import math
+
+
+class SeenSet(object):
+    """Exact set of 16-byte url digests."""
+
+    def __init__(self):
+        self._digests = set()
+
+    def __contains__(self, digest):
+        return digest in self._digests
+
+    def __len__(self):
+        return len(self._digests)
+
+    def add(self, digest):
+        self._digests.add(digest)
+
+
+class BloomFilter(object):
+    """Fixed-size Bloom filter over 16-byte url digests.
+
+    Sized for `capacity` entries at `fp_rate` false positives. A false
+    positive makes the frontier treat a new url as already seen, so the url
+    is skipped; memory stays at about -1.44 * log2(fp_rate) bits per entry.
+    """
+
+    def __init__(self, capacity, fp_rate):
+        if capacity <= 0 or not 0 < fp_rate < 1:
+            raise ValueError("Bloom filter needs capacity > 0 and 0 < fp_rate < 1.")
+        self.capacity = capacity
+        self.fp_rate = fp_rate
+        self.num_bits = max(8, int(-capacity * math.log(fp_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self._bits = bytearray((self.num_bits + 7) // 8)
+        self._count = 0
+
+    def _positions(self, digest):
+        # The digest is already uniformly distributed, so its two halves
+        # serve as the two base hashes for double hashing.
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:16], "little") | 1
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def __contains__(self, digest):
+        bits = self._bits
+        return all(bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(digest))
+
+    def __len__(self):
+        return self._count
+
+    def add(self, digest):
+        bits = self._bits
+        for pos in self._positions(digest):
+            bits[pos >> 3] |= 1 << (pos & 7)
+        self._count += 1
+
+
+def make_seen_index(kind, capacity=None, fp_rate=None):
+    kind = kind.strip().lower()
+    if kind == "set":
+        return SeenSet()
+    if kind == "bloom":
+        return BloomFilter(capacity, fp_rate)
+    raise ValueError(f"Unknown seen index {kind!r}, expected set or bloom.")
@@ -0,0 +1,99 @@
+import os
+import struct
+from collections import deque
+
+SEGMENT_PREFIX = "spill-"
+SEGMENT_SUFFIX = ".seg"
+# demotion, depth, url length; then the url
+_RECORD_HEAD = struct.Struct("<iiI")
+
+
+class SpillQueue(object):
+    """First-in first-out queue of frontier entries kept on disk.
+
+    Entries are appended to numbered segment files of up to
+    `segment_size` entries in `directory`, and read back in order, a
+    segment at a time, deleting each segment once it is read. Only the
+    segment being written and the one being read are open.
+
+    Every spilled url is also pending in the frontier's save file, which is
+    what a resume reads, so the segments are scratch space: any left in
+    `directory` by an earlier run are deleted on open.
+    """
+
+    def __init__(self, directory, segment_size=100000):
+        self.directory = directory
+        self.segment_size = segment_size
+        os.makedirs(directory, exist_ok=True)
+        for name in os.listdir(directory):
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX):
+                os.remove(os.path.join(directory, name))
+        # Full segments waiting to be read, oldest first.
+        self.segments = deque()
+        self.writer = None
+        self.writer_path = None
+        self.written = 0
+        self.reader = None
+        self.reader_path = None
+        self.count = 0
+        self.next_segment = 0
+
+    def __len__(self):
+        return self.count
+
+    def push(self, demotion, depth, url):
+        if self.writer is None:
+            self.writer_path = os.path.join(
+                self.directory, f"{SEGMENT_PREFIX}{self.next_segment:06d}{SEGMENT_SUFFIX}")
+            self.next_segment += 1
+            self.writer = open(self.writer_path, "wb")
+            self.written = 0
+        url_bytes = url.encode("utf-8")
+        self.writer.write(_RECORD_HEAD.pack(demotion, depth, len(url_bytes)))
+        self.writer.write(url_bytes)
+        self.written += 1
+        self.count += 1
+        if self.written >= self.segment_size:
+            self._seal()
+
+    def _seal(self):
+        """Close the segment being written so it can be read."""
+        self.writer.close()
+        self.segments.append(self.writer_path)
+        self.writer = None
+        self.writer_path = None
+
+    def pop_many(self, limit):
+        """Up to `limit` of the oldest (demotion, depth, url) entries."""
+        entries = []
+        while len(entries) < limit and self.count:
+            if self.reader is None:
+                if not self.segments:
+                    self._seal()
+                self.reader_path = self.segments.popleft()
+                self.reader = open(self.reader_path, "rb")
+            head = self.reader.read(_RECORD_HEAD.size)
+            if len(head) < _RECORD_HEAD.size:
+                self._finish_segment()
+                continue
+            demotion, depth, length = _RECORD_HEAD.unpack(head)
+            entries.append((demotion, depth, self.reader.read(length).decode("utf-8")))
+            self.count -= 1
+        if self.reader is not None and not self.count:
+            self._finish_segment()
+        return entries
+
+    def _finish_segment(self):
+        self.reader.close()
+        os.remove(self.reader_path)
+        self.reader = None
+        self.reader_path = None
+
+    def close(self):
+        """Close and delete every segment."""
+        if self.writer is not None:
+            self._seal()
+        if self.reader is not None:
+            self._finish_segment()
+        while self.segments:
+            os.remove(self.segments.popleft())
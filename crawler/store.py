@@ -0,0 +1,279 @@
+import json
+import os
+import shelve
+import sqlite3
+import time
+
+SQLITE_HEADER = b"SQLite format 3\x00"
+
+
+class FrontierStore(object):
+    """Persistent urlhash -> (url, completed) map kept open for the whole crawl.
+
+    Writes are grouped: they become durable on commit(), which maybe_commit()
+    calls once `commit_batch` writes are pending or `commit_interval` seconds
+    have passed since the last commit. A `read_only` store leaves the file
+    as it found it, for reading a save another process may be crawling into.
+    """
+
+    def __init__(self, commit_interval=1.0, commit_batch=1000, read_only=False):
+        self.commit_interval = commit_interval
+        self.commit_batch = commit_batch
+        self.read_only = read_only
+        self.pending_writes = 0
+        self.last_commit = time.time()
+
+    def maybe_commit(self):
+        if not self.pending_writes:
+            return
+        if (self.pending_writes >= self.commit_batch
+                or time.time() - self.last_commit >= self.commit_interval):
+            self.commit()
+
+    def commit(self):
+        self._commit()
+        self.pending_writes = 0
+        self.last_commit = time.time()
+
+    def put(self, urlhash, url, completed):
+        self._put(urlhash, url, completed)
+        self.pending_writes += 1
+        self.maybe_commit()
+
+    def delete(self, urlhash):
+        self._delete(urlhash)
+        self.pending_writes += 1
+        self.maybe_commit()
+
+
+class SQLiteStore(FrontierStore):
+    """SQLite in WAL mode. Every commit is atomic, so after a crash the store
+    holds exactly the writes up to the last group commit, in order."""
+
+    def __init__(self, path, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        if self.read_only:
+            self.conn = sqlite3.connect(
+                f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+            return
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self._migrate_without_rowid()
+        # Rowids grow with insertion order, and the index on completed keeps
+        # pending urls in rowid order, so resume can page through them.
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS urls ("
+            "hash TEXT PRIMARY KEY, url TEXT NOT NULL, "
+            "completed INTEGER NOT NULL)")
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS urls_completed ON urls (completed)")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS meta ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self.conn.commit()
+
+    def _migrate_without_rowid(self):
+        """Saves from before resume paging stored urls WITHOUT ROWID."""
+        row = self.conn.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'urls'"
+        ).fetchone()
+        if row is None or "WITHOUT ROWID" not in row[0].upper():
+            return
+        self.conn.execute("ALTER TABLE urls RENAME TO urls_old")
+        self.conn.execute(
+            "CREATE TABLE urls ("
+            "hash TEXT PRIMARY KEY, url TEXT NOT NULL, "
+            "completed INTEGER NOT NULL)")
+        self.conn.execute(
+            "INSERT INTO urls (hash, url, completed) "
+            "SELECT hash, url, completed FROM urls_old")
+        self.conn.execute("DROP TABLE urls_old")
+        self.conn.commit()
+
+    def __contains__(self, urlhash):
+        return self.conn.execute(
+            "SELECT 1 FROM urls WHERE hash = ?", (urlhash,)).fetchone() is not None
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM urls").fetchone()[0]
+
+    def get(self, urlhash, default=None):
+        row = self.conn.execute(
+            "SELECT url, completed FROM urls WHERE hash = ?", (urlhash,)).fetchone()
+        if row is None:
+            return default
+        return row[0], bool(row[1])
+
+    def values(self):
+        for url, completed in self.conn.execute("SELECT url, completed FROM urls"):
+            yield url, bool(completed)
+
+    def hashes(self):
+        for (urlhash,) in self.conn.execute("SELECT hash FROM urls"):
+            yield urlhash
+
+    def count_pending(self):
+        return self.conn.execute(
+            "SELECT COUNT(*) FROM urls WHERE completed = 0").fetchone()[0]
+
+    def iter_pending(self, batch_size=10000):
+        """Lazily yield (urlhash, url) for urls pending when this was called.
+
+        Reads one batch at a time, so urls added while iterating are not
+        returned; the caller already has those queued.
+        """
+        last = 0
+        end = self.conn.execute("SELECT MAX(rowid) FROM urls").fetchone()[0] or 0
+        while last < end:
+            rows = self.conn.execute(
+                "SELECT rowid, hash, url FROM urls "
+                "WHERE completed = 0 AND rowid > ? AND rowid <= ? "
+                "ORDER BY rowid LIMIT ?", (last, end, batch_size)).fetchall()
+            if not rows:
+                return
+            for _, urlhash, url in rows:
+                yield urlhash, url
+            last = rows[-1][0]
+
+    def get_meta(self, key, default=None):
+        row = self.conn.execute(
+            "SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return default if row is None else row[0]
+
+    def set_meta(self, key, value):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+        self.pending_writes += 1
+
+    def _put(self, urlhash, url, completed):
+        # Upsert rather than REPLACE so a url keeps its rowid.
+        self.conn.execute(
+            "INSERT INTO urls (hash, url, completed) VALUES (?, ?, ?) "
+            "ON CONFLICT (hash) DO UPDATE SET completed = excluded.completed",
+            (urlhash, url, int(completed)))
+
+    def _delete(self, urlhash):
+        self.conn.execute("DELETE FROM urls WHERE hash = ?", (urlhash,))
+
+    def _commit(self):
+        self.conn.commit()
+
+    def close(self):
+        if not self.read_only:
+            self.commit()
+        self.conn.close()
+
+
+class ShelveStore(FrontierStore):
+    """The original shelve format, opened once and synced on group commit.
+    Unlike SQLiteStore a crash can lose or tear the unsynced tail."""
+
+    def __init__(self, path, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self.db = shelve.open(path, flag='r' if self.read_only else 'c')
+        # Metadata lives in a json sidecar so the shelve holds only urls.
+        self.meta_file = path + ".meta"
+        self.meta = {}
+        if os.path.exists(self.meta_file):
+            with open(self.meta_file) as f:
+                self.meta = json.load(f)
+
+    def __contains__(self, urlhash):
+        return urlhash in self.db
+
+    def __len__(self):
+        return len(self.db)
+
+    def get(self, urlhash, default=None):
+        return self.db.get(urlhash, default)
+
+    def values(self):
+        return self.db.values()
+
+    def hashes(self):
+        return self.db.keys()
+
+    def count_pending(self):
+        return sum(1 for _, completed in self.db.values() if not completed)
+
+    def iter_pending(self, batch_size=10000):
+        # dbm cannot be iterated while it is written to, so take a snapshot.
+        pending = [(urlhash, url) for urlhash, (url, completed) in self.db.items()
+                   if not completed]
+        return iter(pending)
+
+    def get_meta(self, key, default=None):
+        return self.meta.get(key, default)
+
+    def set_meta(self, key, value):
+        self.meta[key] = value
+        self.pending_writes += 1
+
+    def _put(self, urlhash, url, completed):
+        self.db[urlhash] = (url, completed)
+
+    def _delete(self, urlhash):
+        del self.db[urlhash]
+
+    def _commit(self):
+        self.db.sync()
+        tmp_file = self.meta_file + ".tmp"
+        with open(tmp_file, "w") as f:
+            json.dump(self.meta, f)
+        os.replace(tmp_file, self.meta_file)
+
+    def close(self):
+        if not self.read_only:
+            self.commit()
+        self.db.close()
+
+
+STORES = {
+    "sqlite": SQLiteStore,
+    "shelve": ShelveStore,
+}
+
+
+def detect_backend(path):
+    """Guess the backend of an existing save file, defaulting to shelve."""
+    try:
+        with open(path, "rb") as f:
+            if f.read(len(SQLITE_HEADER)) == SQLITE_HEADER:
+                return "sqlite"
+    except OSError:
+        pass
+    return "shelve"
+
+
+def open_store(path, backend=None, **kwargs):
+    if backend is None:
+        backend = detect_backend(path)
+    try:
+        store_class = STORES[backend.strip().lower()]
+    except KeyError:
+        raise ValueError(
+            f"Unknown frontier store {backend!r}, "
+            f"expected one of {', '.join(sorted(STORES))}.")
+    return store_class(path, **kwargs)
+
+
+# The frontier's trap journal (see crawler.traps.TrapJournal)
+TRAPS_SUFFIX = ".traps"
+# SQLite's WAL and shared-memory files, the shelve metadata sidecar, the
+# trap journal, and the files shelve makes when backed by dbm.dumb
+# (.dat/.dir/.bak) or ndbm (.db)
+STORE_SUFFIXES = ("", "-wal", "-shm", ".meta", TRAPS_SUFFIX, ".dat", ".dir", ".bak", ".db")
+
+
+def store_exists(path):
+    """Whether a save file of either backend is at path."""
+    return any(os.path.exists(path + suffix) for suffix in STORE_SUFFIXES)
+
+
+def remove_store(path):
+    for suffix in STORE_SUFFIXES:
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
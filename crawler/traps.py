@@ -0,0 +1,242 @@
+import json
+import os
+import re
+from collections import OrderedDict
+from urllib.parse import urlparse, parse_qsl
+
+BLOCK = -1
+# Kinds of TrapDetector rows
+PATTERN = "p"
+PARAM = "v"
+BLOCKED = "b"
+
+SESSION_PARAMS = {
+    "sid", "sessionid", "session_id", "jsessionid", "phpsessid", "aspsessionid",
+    "cfid", "cftoken", "sessid", "s_id",
+}
+_DIGITS = re.compile(r"\d+")
+# Long runs of letters and digits mixed are ids and hashes, not words.
+_TOKEN = re.compile(r"^(?=.*\d)(?=.*[a-z])[a-z0-9_-]{16,}$", re.IGNORECASE)
+
+
+def url_pattern(parsed):
+    """host/path with numbers and id-like segments generalised, plus the
+    sorted names of the query parameters, e.g.
+    www.ics.uci.edu/events/N/N/N?view"""
+    segments = []
+    for segment in parsed.path.split("/"):
+        if _TOKEN.match(segment):
+            segments.append("*")
+        else:
+            segments.append(_DIGITS.sub("N", segment))
+    names = sorted({name.lower() for name, _ in parse_qsl(parsed.query, keep_blank_values=True)})
+    pattern = parsed.netloc.lower() + "/".join(segments)
+    if names:
+        pattern += "?" + "&".join(names)
+    return pattern
+
+
+class TrapDetector(object):
+    """Spots crawler traps from the urls the frontier is offered.
+
+    check() blocks urls that are too deep, repeat a path segment, carry a
+    session id, or give a query parameter on one path more distinct values
+    than `max_param_values`. Urls of a pattern (see url_pattern) that has
+    already been admitted `pattern_limit` times are demoted one more level
+    for every further `pattern_limit`, and a pattern whose fetched pages
+    are mostly duplicates or errors is blocked once `min_sample` of its
+    pages have been fetched.
+
+    State is kept for the `max_patterns` most recently used patterns and
+    query parameters; traps keep theirs in use, while patterns of one or
+    two urls make way. take_changes() hands out only the state changed
+    since it was last called, for a TrapJournal to save.
+    """
+
+    def __init__(self, max_depth=12, max_repeats=3, pattern_limit=500,
+                 max_param_values=50, min_sample=50, min_yield=0.1,
+                 max_patterns=100000):
+        self.max_depth = max_depth
+        self.max_repeats = max_repeats
+        self.pattern_limit = pattern_limit
+        self.max_param_values = max_param_values
+        self.min_sample = min_sample
+        self.min_yield = min_yield
+        self.max_patterns = max_patterns
+        # pattern -> [admitted, fetched, new content], least recently used first
+        self.patterns = OrderedDict()
+        self.blocked = set()
+        # "host/path?param" -> distinct values seen, at most max_param_values
+        self.param_values = OrderedDict()
+        # (kind, key) of the rows changed since take_changes()
+        self._changed = set()
+
+    def check(self, url):
+        """BLOCK, or how many levels to demote url by (0 for none)."""
+        parsed = urlparse(url)
+        segments = [segment for segment in parsed.path.split("/") if segment]
+        if len(segments) > self.max_depth:
+            return BLOCK
+        repeats = {}
+        for segment in segments:
+            repeats[segment] = repeats.get(segment, 0) + 1
+            if repeats[segment] >= self.max_repeats:
+                return BLOCK
+        params = parse_qsl(parsed.query, keep_blank_values=True)
+        for name, value in params:
+            if name.lower() in SESSION_PARAMS:
+                return BLOCK
+        pattern = url_pattern(parsed)
+        if pattern in self.blocked:
+            return BLOCK
+        path_key = parsed.netloc.lower() + parsed.path + "?"
+        for name, value in params:
+            values = self._use(self.param_values, path_key + name, set)
+            if value not in values:
+                if len(values) >= self.max_param_values:
+                    return BLOCK
+                values.add(value)
+                self._changed.add((PARAM, path_key + name))
+        counts = self._use(self.patterns, pattern, _new_counts)
+        counts[0] += 1
+        self._changed.add((PATTERN, pattern))
+        return counts[0] // self.pattern_limit
+
+    def record_fetch(self, url, new_content):
+        """Note whether a fetched url gave a page that was not an error or
+        a duplicate, blocking its pattern when too few of them do."""
+        pattern = url_pattern(urlparse(url))
+        counts = self._use(self.patterns, pattern, _new_counts)
+        counts[1] += 1
+        if new_content:
+            counts[2] += 1
+        self._changed.add((PATTERN, pattern))
+        if (counts[1] >= self.min_sample
+                and counts[2] < self.min_yield * counts[1]):
+            self.blocked.add(pattern)
+            self._changed.add((BLOCKED, pattern))
+
+    def _use(self, table, key, make):
+        """table[key], made if missing and marked most recently used. The
+        least recently used row goes when the table is over max_patterns."""
+        row = table.get(key)
+        if row is None:
+            row = table[key] = make()
+            if len(table) > self.max_patterns:
+                table.popitem(last=False)
+        else:
+            table.move_to_end(key)
+        return row
+
+    def take_changes(self):
+        """Rows for the state changed since the last call, for
+        TrapJournal.append. Cheap enough to call under the frontier lock;
+        encoding them is left to the journal."""
+        tables = {PATTERN: self.patterns, PARAM: self.param_values}
+        rows = []
+        for kind, key in self._changed:
+            if kind == BLOCKED:
+                rows.append((BLOCKED, key, None))
+                continue
+            row = tables[kind].get(key)
+            # Evicted rows are not written; replaying the journal evicts
+            # them again.
+            if row is not None:
+                rows.append((kind, key, list(row)))
+        self._changed = set()
+        return rows
+
+    def rows(self):
+        """Rows for the whole state, least recently used first."""
+        return ([(BLOCKED, pattern, None) for pattern in self.blocked]
+                + [(PARAM, key, list(values)) for key, values in self.param_values.items()]
+                + [(PATTERN, key, list(counts)) for key, counts in self.patterns.items()])
+
+    def apply(self, kind, key, value):
+        """Restore one row written by TrapJournal."""
+        if kind == BLOCKED:
+            self.blocked.add(key)
+            return
+        table = self.patterns if kind == PATTERN else self.param_values
+        table.pop(key, None)
+        table[key] = value if kind == PATTERN else set(value)
+        if len(table) > self.max_patterns:
+            table.popitem(last=False)
+
+    def loads(self, data):
+        """Restore the state frontiers used to keep in their store's meta."""
+        state = json.loads(data)
+        for pattern, counts in state["patterns"].items():
+            self.apply(PATTERN, pattern, counts)
+        for key, values in state["param_values"].items():
+            self.apply(PARAM, key, values[:self.max_param_values])
+        self.blocked.update(state["blocked"])
+        self._changed.update((PATTERN, key) for key in self.patterns)
+        self._changed.update((PARAM, key) for key in self.param_values)
+        self._changed.update((BLOCKED, key) for key in self.blocked)
+
+
+class TrapJournal(object):
+    """Append-only file of TrapDetector rows, one JSON array per line.
+
+    A checkpoint appends only the rows changed since the last one, so its
+    cost follows the crawl's recent activity rather than the size of the
+    trap state. On open the rows are replayed, later ones replacing earlier
+    ones, a torn last line is ignored, and the file is rewritten with just
+    the live rows once most of its lines are stale.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+
+    def load(self, traps):
+        """Replay the journal into traps; returns whether there was one."""
+        if not os.path.exists(self.path):
+            return False
+        lines = 0
+        torn = False
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    kind, key, value = json.loads(line)
+                except ValueError:
+                    # Cut short by a crash; later rows would follow it.
+                    torn = True
+                    break
+                traps.apply(kind, key, value)
+                lines += 1
+        live = len(traps.patterns) + len(traps.param_values) + len(traps.blocked)
+        if torn or lines > 2 * live + 1000:
+            self._rewrite(traps.rows())
+        return True
+
+    def _rewrite(self, rows):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.writelines(_encode(row) for row in rows)
+        os.replace(tmp_path, self.path)
+
+    def append(self, rows):
+        if not rows:
+            return
+        if self.file is None:
+            self.file = open(self.path, "a", encoding="utf-8")
+        self.file.writelines(_encode(row) for row in rows)
+        self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def _new_counts():
+    return [0, 0, 0]
+
+
+def _encode(row):
+    kind, key, value = row
+    if kind == PARAM:
+        value = sorted(value)
+    return json.dumps([kind, key, value]) + "\n"
@@ -1,35 +1,48 @@
+import time
+from threading import Thread
 from urllib.parse import urlparse
 
 from inspect import getsource
 from utils.download import download
 from utils import get_logger
+from utils.metrics import metrics
 from utils.statistics import StatisticsCollector
+from crawler.archive import get_response_archive
+from crawler.dedup import get_duplicate_index
+from crawler.robots import get_robots_cache, sitemap_urls
+from crawler.pipeline import (
+    get_parse_pool, analyze_response, analyze_page, page_args)
 import scraper
-import time
 
 
-class Worker:
-    _domain_times = {}
+class Worker(Thread):
     MIN_WORD_COUNT = 10 
-    MAX_CONTENT_SIZE = 10 * 1024 * 1024  # 10MB max
+    # How many of these the Crawler starts; None means THREADCOUNT.
+    MAX_INSTANCES = None
 
     def __init__(self, worker_id, config, frontier):
         self.logger = get_logger(f"Worker-{worker_id}", "Worker")
         self.config = config
         self.frontier = frontier
-        self.stats_collector = StatisticsCollector()
+        self.stats_collector = StatisticsCollector(
+            config.stats_file, config.stats_store,
+            aggregates_file=config.aggregates_file,
+            checkpoint_interval=config.checkpoint_interval,
+            commit_interval=config.commit_interval,
+            commit_batch=config.commit_batch)
         assert {getsource(scraper).find(req) for req in {"from requests import", "import requests"}} == {-1}, "Do not use requests in scraper.py"
         assert {getsource(scraper).find(req) for req in {"from urllib.request import", "import urllib.request"}} == {-1}, "Do not use urllib.request in scraper.py"
+        super().__init__(daemon=True)
     
     def _is_dead_url(self, resp):
         """Detect dead URLs that return 200 but have no meaningful content."""
         if resp.status != 200:
             return False
-        if not resp.raw_response or not resp.raw_response.content:
+        content_size = len(resp.body)
+        if not content_size:
             return True
         
         # Check if content is too small (likely a dead page)
-        content_size = len(resp.raw_response.content)
         if content_size < 100:  # Very small content, likely dead
             return True
         
@@ -37,75 +50,158 @@ class Worker:
     
     def _is_large_low_value(self, resp):
         """Detect very large files with potentially low information value."""
-        if not resp.raw_response or not resp.raw_response.content:
-            return False
-        
-        content_size = len(resp.raw_response.content)
-        if content_size > Worker.MAX_CONTENT_SIZE:
+        content_size = len(resp.body)
+        if content_size > self.config.max_content_size:
             self.logger.warning(f"Large file detected: {content_size} bytes")
             return True
         
         return False
     
-    def _wait_for_domain_politeness(self, url):
-        parsed = urlparse(url)
-        domain = parsed.netloc
-        current_time = time.time()
-        if domain in Worker._domain_times:
-            last_time = Worker._domain_times[domain]
-            elapsed = current_time - last_time
-            if elapsed < self.config.time_delay:
-                sleep_time = self.config.time_delay - elapsed
-                time.sleep(sleep_time)
-        Worker._domain_times[domain] = time.time()
-    
     def run(self):
-        consecutive_empty = 0
-        max_consecutive_empty = 5
-        
         while True:
-            tbd_url = self.frontier.get_tbd_url()
+            # The frontier only hands out urls whose domain is past its
+            # politeness delay, blocking until one is ready.
+            with metrics.timer("wait"):
+                tbd_url = self.frontier.get_tbd_url()
             if not tbd_url:
-                consecutive_empty += 1
-                if consecutive_empty >= max_consecutive_empty:
-                    self.logger.info("Frontier is empty. Stopping Crawler.")
-                    break
-                time.sleep(self.config.time_delay)
-                continue
-            
-            consecutive_empty = 0
-            
-            self._wait_for_domain_politeness(tbd_url)
-            resp = download(tbd_url, self.config, self.logger)
-            self.logger.info(
-                f"Downloaded {tbd_url}, status <{resp.status}>, "
-                f"using cache {self.config.cache_server}.")
-            
-            # Check for dead URLs or large low-value files
-            if self._is_dead_url(resp):
-                self.logger.warning(f"Dead URL detected (no meaningful content): {tbd_url}")
-                self.frontier.mark_url_complete(tbd_url)
-                time.sleep(self.config.time_delay)
-                continue
-            
-            if self._is_large_low_value(resp):
-                self.logger.warning(f"Large low-value file detected, skipping: {tbd_url}")
-                self.frontier.mark_url_complete(tbd_url)
-                time.sleep(self.config.time_delay)
-                continue
-            
-            # Only process successful downloads
-            if resp.status == 200:
-                if resp.raw_response and resp.raw_response.content:
-                    self.stats_collector.save_page_stats(tbd_url, resp)
-                scraped_urls = scraper.scraper(tbd_url, resp)
-                for scraped_url in scraped_urls:
-                    self.frontier.add_url(scraped_url)
-            else:
-                scraped_urls = scraper.scraper(tbd_url, resp)
-                # Still check for links in non-200 responses (redirects, etc.)
-                for scraped_url in scraped_urls:
-                    self.frontier.add_url(scraped_url)
-            
-            self.frontier.mark_url_complete(tbd_url)
-            time.sleep(self.config.time_delay)
+                self.logger.info(
+                    "Crawler stopped." if self.frontier.stopped
+                    else "Frontier is empty. Stopping Crawler.")
+                break
+            try:
+                self._process(tbd_url)
+            except Exception:
+                self.logger.exception(f"Failed to process {tbd_url}.")
+            finally:
+                self._complete(tbd_url)
+
+    def _complete(self, tbd_url):
+        with metrics.timer("frontier"):
+            completed = self.frontier.mark_url_complete(tbd_url)
+        if completed:
+            self.stats_collector.record_completed(tbd_url)
+        metrics.page_done()
+
+    def _process(self, tbd_url):
+        if not self._check_robots(tbd_url):
+            return
+        start = time.time()
+        resp = self._download(tbd_url, self.logger)
+        self._record_fetch(tbd_url, time.time() - start, resp)
+        self._handle_response(tbd_url, resp)
+
+    def _download(self, url, logger=None, gate=True):
+        resp = download(url, self.config, logger, gate)
+        self._archive(url, resp)
+        return resp
+
+    def _archive(self, url, resp):
+        # Keeps the raw body for a later --replay, when ARCHIVE is set.
+        archive = get_response_archive(self.config)
+        if archive is not None:
+            with metrics.timer("archive"):
+                archive.add(url, resp)
+
+    def _check_robots(self, tbd_url):
+        """Return whether robots.txt lets us download tbd_url, fetching the
+        host's robots.txt first if it is not cached."""
+        robots = get_robots_cache(self.config)
+        if robots is None:
+            return True
+        # No logger: a missing robots.txt or sitemap is not an error. No
+        # gate: sitemaps are XML, and are often served gzipped.
+        fetch = lambda url: self._download(url, gate=False)
+        rules, fetched = robots.rules_for(tbd_url, fetch)
+        if fetched:
+            self._apply_robots(tbd_url, rules, fetch)
+        if not rules.allowed(tbd_url):
+            self.logger.info(f"Disallowed by robots.txt, skipping: {tbd_url}")
+            return False
+        return True
+
+    def _apply_robots(self, tbd_url, rules, fetch):
+        """Pass a host's Crawl-delay to the frontier and seed it with the
+        urls of the host's sitemaps."""
+        self._apply_crawl_delay(tbd_url, rules)
+        self._seed_sitemaps(tbd_url, rules, fetch)
+
+    def _apply_crawl_delay(self, tbd_url, rules):
+        if rules.crawl_delay is not None:
+            self.frontier.set_crawl_delay(urlparse(tbd_url).netloc, rules.crawl_delay)
+
+    def _seed_sitemaps(self, tbd_url, rules, fetch):
+        if self.config.sitemap_limit <= 0 or not rules.sitemaps:
+            return
+        added = 0
+        for url in sitemap_urls(rules.sitemaps, fetch, self.config.sitemap_limit,
+                                delay=self.config.time_delay):
+            if self.frontier.stopped:
+                break
+            if scraper.is_valid(url):
+                self.frontier.add_url(url)
+                added += 1
+        self.logger.info(f"Seeded {added} urls from the sitemaps of {urlparse(tbd_url).netloc}.")
+
+    def _handle_response(self, tbd_url, resp):
+        if not self._check_response(tbd_url, resp):
+            self._record_content(tbd_url, False)
+            return
+        pool = get_parse_pool(self.config)
+        duplicates = get_duplicate_index(self.config)
+        if pool is None:
+            page = analyze_response(tbd_url, resp, duplicates)
+        else:
+            # Stage timings inside the pool stay in its processes, so the
+            # round trip is timed as one stage.
+            with metrics.timer("analyze"):
+                page = pool.submit(
+                    analyze_page, *page_args(tbd_url, resp), duplicates is not None).result()
+        self._save_results(tbd_url, page)
+
+    def _check_response(self, tbd_url, resp):
+        """Log the download and return whether the page is worth parsing."""
+        self.logger.info(
+            f"Downloaded {tbd_url}, status <{resp.status}>, "
+            f"using cache {self.config.cache_server}.")
+        
+        # Too large or not HTML, found before the body was parsed
+        if resp.skipped:
+            self.logger.info(f"Skipping {resp.skipped}: {tbd_url}")
+            return False
+        
+        # Check for dead URLs or large low-value files
+        if self._is_dead_url(resp):
+            self.logger.warning(f"Dead URL detected (no meaningful content): {tbd_url}")
+            return False
+        
+        if self._is_large_low_value(resp):
+            self.logger.warning(f"Large low-value file detected, skipping: {tbd_url}")
+            return False
+        return True
+
+    def _record_fetch(self, tbd_url, latency, resp):
+        metrics.host_incr(
+            urlparse(tbd_url).netloc, fetches=1, bytes=len(resp.body),
+            errors=int(resp.status >= 400 or resp.error is not None))
+        # Feeds rate control.
+        self.frontier.record_fetch(tbd_url, latency, resp.status)
+
+    def _record_content(self, tbd_url, is_new):
+        # Feeds trap detection.
+        self.frontier.record_content(tbd_url, is_new)
+
+    def _save_results(self, tbd_url, page):
+        self._record_content(
+            tbd_url, not page.duplicate and page.word_counts is not None)
+        if page.duplicate:
+            self.logger.info(f"Skipping {page.duplicate} duplicate page {tbd_url}.")
+            return
+        # Only successful downloads contribute statistics, but links are
+        # still collected from non-200 responses (redirects, etc.)
+        if page.word_counts is not None:
+            with metrics.timer("stats"):
+                self.stats_collector.record_page_stats(tbd_url, page.word_counts)
+        with metrics.timer("frontier"):
+            for scraped_url in page.links:
+                self.frontier.add_url(scraped_url, parent=tbd_url)
+        metrics.incr("links", len(page.links))
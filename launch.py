@@ -1,39 +1,46 @@
 from configparser import ConfigParser
 from argparse import ArgumentParser
 import signal
-import sys
 
 from utils.server_registration import get_cache_server
 from utils.config import Config
 from crawler import Crawler
 
 
-def main(config_file, restart):
+def main(config_file, restart, engine=None, replay=None):
     cparser = ConfigParser()
     cparser.read(config_file)
     config = Config(cparser)
-    config.cache_server = get_cache_server(config, restart)
+    if engine:
+        config.engine = engine
+    if replay:
+        # Responses come from the archive, so no cache server is needed.
+        config.replay_file = replay
+    else:
+        config.cache_server = get_cache_server(config, restart)
     crawler = Crawler(config, restart)
-    
+    stop_on_signals(crawler)
+    # Returns once the workers are done, with the progress saved.
+    crawler.start()
+
+
+def stop_on_signals(crawler):
+    """Stop the crawl on SIGINT (Ctrl-C) or SIGTERM. The workers finish
+    their current urls, then Crawler.start saves and closes everything."""
     def signal_handler(sig, frame):
         print("\n\nKeyboard interrupt received. Saving progress...")
         crawler.logger.info("Keyboard interrupt received. Workers will finish current operations...")
-        sys.exit(0)
+        crawler.stop_workers()
     
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
-    
-    try:
-        crawler.start()
-    except KeyboardInterrupt:
-        print("\n\nKeyboard interrupt received. Saving progress...")
-        crawler.logger.info("Keyboard interrupt received. Shutting down gracefully...")
-        sys.exit(0)
 
 
 if __name__ == "__main__":
     parser = ArgumentParser()
     parser.add_argument("--restart", action="store_true", default=False)
     parser.add_argument("--config_file", type=str, default="config.ini")
+    parser.add_argument("--engine", type=str, default=None)
+    parser.add_argument("--replay", type=str, default=None)
     args = parser.parse_args()
-    main(args.config_file, args.restart)
+    main(args.config_file, args.restart, args.engine, args.replay)
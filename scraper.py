@@ -1,22 +1,7 @@
-import re
-from html.parser import HTMLParser
-from urllib.parse import urlparse, urljoin, urlunparse
-
-class LinkExtractor(HTMLParser):
-    def __init__(self, base_url):
-        super().__init__()
-        self.links = []
-        self.base_url = base_url
-
-    def handle_starttag(self, tag, attrs):
-        if tag == 'a':
-            for attr, value in attrs:
-                if attr == 'href' and value:
-                    absolute_url = urljoin(self.base_url, value)
-                    parsed = urlparse(absolute_url)
-                    # Remove fragment part (defragment URLs)
-                    clean_url = urlunparse((parsed.scheme, parsed.netloc, parsed.path, parsed.params, parsed.query, ''))
-                    self.links.append(clean_url)
+from functools import lru_cache
+from urllib.parse import urlparse, urljoin
+from utils.canonical import canonicalize
+from utils.page_parser import parse_response
 
 def scraper(url, resp):
     links = extract_next_links(url, resp)
@@ -39,56 +24,55 @@ def extract_next_links(url, resp):
     if not resp.raw_response or not resp.raw_response.content:
         return links
     try:
-        content = resp.raw_response.content
-        if isinstance(content, bytes):
-            html_content = content.decode('utf-8', errors='ignore')
-        else:
-            html_content = str(content)
-        parser = LinkExtractor(resp.url if resp.url else url)
-        parser.feed(html_content)
-        links = parser.links
+        base_url = resp.url if resp.url else url
+        for href in parse_response(resp).hrefs:
+            # Canonicalize, which also removes the fragment (defragment URLs)
+            links.append(canonicalize(urljoin(base_url, href)))
     except Exception:
         pass
     return links
 
+# is_valid rules, built once at import.
+VALID_SCHEMES = frozenset(["http", "https"])
+# Required domains: *.ics.uci.edu, *.cs.uci.edu, *.informatics.uci.edu, *.stat.uci.edu
+VALID_DOMAINS = (".ics.uci.edu", ".cs.uci.edu", ".informatics.uci.edu", ".stat.uci.edu")
+INVALID_EXTENSIONS = frozenset("""
+    css js bmp gif jpg jpeg ico
+    png tif tiff mid mp2 mp3 mp4
+    wav avi mov mpeg ram m4v mkv ogg ogv pdf
+    ps eps tex ppt pptx doc docx xls xlsx names
+    data dat exe bz2 tar msi bin 7z psd dmg iso
+    epub dll cnf tgz sha1
+    thmx mso arff rtf jar csv
+    rm smil wmv swf wma zip rar gz xml rss json
+    txt py java cpp c h hpp cc svg woff
+    woff2 ttf eot otf
+""".split())
+
+@lru_cache(maxsize=65536)
+def _host_and_extension_allowed(netloc, extension):
+    # Most links share a handful of hosts and extensions, so verdicts are cached.
+    return netloc.endswith(VALID_DOMAINS) and extension not in INVALID_EXTENSIONS
+
 def is_valid(url):
     # Decide whether to crawl this url or not. 
     # If you decide to crawl it, return True; otherwise return False.
     # There are already some conditions that return False.
     try:
         parsed = urlparse(url)
-        if parsed.scheme not in set(["http", "https"]):
-            return False
-        
-        # Check for all required domains: *.ics.uci.edu, *.cs.uci.edu, *.informatics.uci.edu, *.stat.uci.edu
-        netloc = parsed.netloc.lower()
-        valid_domains = [".ics.uci.edu", ".cs.uci.edu", ".informatics.uci.edu", ".stat.uci.edu"]
-        if not any(netloc.endswith(domain) for domain in valid_domains):
+        if parsed.scheme not in VALID_SCHEMES:
             return False
         
         # Check for fragment (should be removed, but validate it's not in the URL)
         if parsed.fragment:
             return False
         
-        # Check for invalid file extensions using regex
-        # Remove query parameters for checking extensions
-        path_lower = parsed.path.lower()
-        if '?' in path_lower:
-            path_part = path_lower.split('?')[0]
-        else:
-            path_part = path_lower
-        
-        return not re.match(
-            r".*\.(css|js|bmp|gif|jpe?g|ico"
-            + r"|png|tiff?|mid|mp2|mp3|mp4"
-            + r"|wav|avi|mov|mpeg|ram|m4v|mkv|ogg|ogv|pdf"
-            + r"|ps|eps|tex|ppt|pptx|doc|docx|xls|xlsx|names"
-            + r"|data|dat|exe|bz2|tar|msi|bin|7z|psd|dmg|iso"
-            + r"|epub|dll|cnf|tgz|sha1"
-            + r"|thmx|mso|arff|rtf|jar|csv"
-            + r"|rm|smil|wmv|swf|wma|zip|rar|gz|xml|rss|json"
-            + r"|txt|py|java|cpp|c|h|hpp|cc|svg|woff"
-            + r"|woff2|ttf|eot|otf)$", path_part)
+        # The extension is whatever follows the last dot of the path, as
+        # long as no "/" follows it. parsed.path never holds the query.
+        _, dot, extension = parsed.path.lower().rpartition('.')
+        if not dot or '/' in extension:
+            extension = ''
+        return _host_and_extension_allowed(parsed.netloc.lower(), extension)
     except TypeError:
         print("TypeError for ", parsed)
         raise
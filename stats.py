@@ -1,8 +1,16 @@
-import shelve
-import re
+import dbm
+import os
+import time
+from argparse import ArgumentParser
 from urllib.parse import urlparse
 from collections import defaultdict
 
+from crawler.store import open_store, store_exists
+from utils import normalize
+from utils.aggregates import AggregatesReader
+from utils.stats_store import open_stats_reader
+from utils.topk import SpaceSaving, exact_top, accuracy_report
+
 STOP_WORDS = {
     'a', 'an', 'and', 'are', 'as', 'at', 'be', 'been', 'by', 'for', 'from',
     'has', 'he', 'in', 'is', 'it', 'its', 'of', 'on', 'that', 'the', 'to',
@@ -14,16 +22,32 @@ STOP_WORDS = {
     'find', 'down', 'day', 'did', 'get', 'come', 'made', 'may', 'part'
 }
 
-def analyze_crawl_data(save_file='frontier.shelve', stats_file='crawl_stats.shelve'):
+def is_reported_word(word):
+    # Only 3+ character words that are not stop words
+    return len(word) > 2 and word not in STOP_WORDS
+
+def analyze_crawl_data(save_file='frontier.db', stats_file='crawl_stats.seg', top_k_capacity=None):
+    """Build the report by scanning the frontier and every page's statistics.
+
+    With top_k_capacity, the top words come from a Space-Saving summary of
+    that many words instead of a table of the whole vocabulary, so memory
+    stays bounded but counts may be overestimated.
+    """
     print("Analyzing crawl data...")
     
     unique_urls = set()
     subdomain_counts = defaultdict(set)
     
-    save = shelve.open(save_file)
+    if not store_exists(save_file):
+        print(f"Warning: Save file {save_file} not found. Run the crawler first.")
+        return
+    save = open_store(save_file, read_only=True)
     try:
         for url, completed in save.values():
             if completed:
+                # Saves from before urls were canonicalized may hold several
+                # spellings of one page.
+                url = normalize(url)
                 parsed = urlparse(url)
                 unique_urls.add(url)
                 subdomain = parsed.netloc
@@ -31,41 +55,106 @@ def analyze_crawl_data(save_file='frontier.shelve', stats_file='crawl_stats.shel
     finally:
         save.close()
     
-    print(f"\n{'='*60}")
-    print(f"1. UNIQUE PAGES: {len(unique_urls)}")
-    print(f"{'='*60}")
-    
     word_counts = {}
     page_word_counts = {}
     
     try:
-        stats = shelve.open(stats_file)
-        try:
-            all_words = {}
-            for urlhash, data in stats.items():
-                if isinstance(data, dict) and 'word_count' in data:
-                    url_key = data.get('url', urlhash)
-                    page_word_counts[url_key] = data['word_count']
-                    if 'words' in data and isinstance(data['words'], dict):
-                        for word, count in data['words'].items():
-                            if word in all_words:
-                                all_words[word] += count
-                            else:
-                                all_words[word] = count
-            word_counts = all_words
-        finally:
-            stats.close()
-    except FileNotFoundError:
+        stats = open_stats_reader(stats_file)
+    except dbm.error:
         print(f"Warning: Statistics file {stats_file} not found. Run the crawler first.")
         return
+    summary = SpaceSaving(top_k_capacity) if top_k_capacity else None
+    try:
+        all_words = {}
+        for url_key, word_count, words in stats.pages():
+            page_word_counts[url_key] = word_count
+            for word, count in words.items():
+                if not is_reported_word(word):
+                    continue
+                if summary is not None:
+                    summary.update(word, count)
+                elif word in all_words:
+                    all_words[word] += count
+                else:
+                    all_words[word] = count
+        word_counts = all_words
+    finally:
+        stats.close()
     
-    # Filter out stop words and words with 2 or fewer characters (only 3+ character words)
-    filtered_word_counts = {word: count for word, count in word_counts.items() 
-                           if word not in STOP_WORDS and len(word) > 2}
-    top_50 = sorted(filtered_word_counts.items(), key=lambda x: (-x[1], x[0]))[:50]
+    if summary is not None:
+        top_50 = summary.top(50)
+    else:
+        top_50 = exact_top(word_counts.items(), 50)
     
     longest_page_url = max(page_word_counts.items(), key=lambda x: x[1]) if page_word_counts else ("N/A", 0)
     
+    result = {
+        'unique_pages': len(unique_urls),
+        'longest_page': longest_page_url,
+        'top_50_words': top_50,
+        'subdomains': {subdomain: len(urls) for subdomain, urls in sorted(subdomain_counts.items())}
+    }
+    print_report(result)
+    return result
+
+def top_words_accuracy(stats_file='crawl_stats.seg', top_k_capacity=10000, k=50):
+    """Compute the top k words exactly and with a Space-Saving summary of
+    top_k_capacity words in one pass, and print how close the summary is."""
+    stats = open_stats_reader(stats_file)
+    exact_counts = {}
+    summary = SpaceSaving(top_k_capacity)
+    try:
+        for _, _, words in stats.pages():
+            for word, count in words.items():
+                if is_reported_word(word):
+                    exact_counts[word] = exact_counts.get(word, 0) + count
+                    summary.update(word, count)
+    finally:
+        stats.close()
+    exact = exact_top(exact_counts.items(), k)
+    approx = summary.top(k)
+    report = accuracy_report(exact, approx)
+    report['vocabulary'] = len(exact_counts)
+    report['capacity'] = top_k_capacity
+    report['guaranteed'] = summary.guaranteed(k)
+    
+    print(f"\n{'='*60}")
+    print(f"TOP {k} WORDS: EXACT vs SPACE-SAVING ({top_k_capacity} of "
+          f"{report['vocabulary']} words tracked)")
+    print(f"{'='*60}")
+    print(f"   Recall:            {report['recall']:.1%}")
+    print(f"   Same rank:         {report['same_rank']} / {k}")
+    print(f"   Guaranteed top {k}: {report['guaranteed']}")
+    print(f"   Count error:       max {report['max_count_error']:.2%}, "
+          f"mean {report['mean_count_error']:.2%}")
+    print(f"{'='*60}")
+    return report
+
+def report_from_aggregates(aggregates_file='crawl_aggregates.db'):
+    """Build the report from the totals the crawler keeps as it runs.
+
+    Only reads as much as it prints, so it is fast at any crawl size and
+    can be run while the crawler is still going.
+    """
+    aggregates = AggregatesReader(aggregates_file)
+    try:
+        result = {
+            'unique_pages': aggregates.unique_pages(),
+            'longest_page': tuple(aggregates.longest_page()),
+            'top_50_words': aggregates.top_words(50, STOP_WORDS, min_length=2),
+            'subdomains': dict(aggregates.subdomains())
+        }
+    finally:
+        aggregates.close()
+    print_report(result)
+    return result
+
+def print_report(result):
+    print(f"\n{'='*60}")
+    print(f"1. UNIQUE PAGES: {result['unique_pages']}")
+    print(f"{'='*60}")
+    
+    longest_page_url = result['longest_page']
     print(f"\n{'='*60}")
     print(f"2. LONGEST PAGE:")
     print(f"   URL: {longest_page_url[0]}")
@@ -75,25 +164,42 @@ def analyze_crawl_data(save_file='frontier.shelve', stats_file='crawl_stats.shel
     print(f"\n{'='*60}")
     print(f"3. TOP 50 WORDS:")
     print(f"{'='*60}")
-    for i, (word, count) in enumerate(top_50, 1):
+    for i, (word, count) in enumerate(result['top_50_words'], 1):
         print(f"   {i:2d}. {word:20s} : {count:8d}")
     
     print(f"\n{'='*60}")
     print(f"4. SUBDOMAINS FOUND:")
     print(f"{'='*60}")
-    sorted_subdomains = sorted(subdomain_counts.items())
-    for subdomain, urls in sorted_subdomains:
-        print(f"   {subdomain}, {len(urls)}")
+    for subdomain, pages in sorted(result['subdomains'].items()):
+        print(f"   {subdomain}, {pages}")
     
     print(f"\n{'='*60}")
-    
-    return {
-        'unique_pages': len(unique_urls),
-        'longest_page': longest_page_url,
-        'top_50_words': top_50,
-        'subdomains': {subdomain: len(urls) for subdomain, urls in sorted_subdomains}
-    }
 
-if __name__ == "__main__":
-    analyze_crawl_data()
+def main(args):
+    if args.accuracy:
+        top_words_accuracy(args.stats, args.approx or 10000)
+        return
+    while True:
+        if not args.scan and not args.approx and os.path.exists(args.aggregates):
+            report_from_aggregates(args.aggregates)
+        else:
+            analyze_crawl_data(args.save, args.stats, args.approx)
+        if not args.watch:
+            break
+        time.sleep(args.watch)
 
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--save", type=str, default="frontier.db")
+    parser.add_argument("--stats", type=str, default="crawl_stats.seg")
+    parser.add_argument("--aggregates", type=str, default="crawl_aggregates.db")
+    parser.add_argument("--scan", action="store_true", default=False,
+                        help="rebuild the report from the save and stats files")
+    parser.add_argument("--watch", type=float, default=0,
+                        help="print the report again every WATCH seconds")
+    parser.add_argument("--approx", type=int, default=None, metavar="CAPACITY",
+                        help="rescan, counting words in bounded memory with "
+                             "a Space-Saving summary of CAPACITY words")
+    parser.add_argument("--accuracy", action="store_true", default=False,
+                        help="compare the exact top words with --approx ones")
+    main(parser.parse_args())
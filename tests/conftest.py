@@ -0,0 +1,57 @@
+import os
+import sys
+from configparser import ConfigParser
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture
+def make_config(tmp_path, monkeypatch):
+    """Builds a Config from config.ini with the crawl's files in tmp_path,
+    and robots.txt and the politeness delay turned off. Keyword arguments
+    override options, by name, in whichever section has them."""
+    from utils.config import Config
+    # Logs/ is created in the working directory.
+    monkeypatch.chdir(tmp_path)
+
+    def make(**options):
+        cparser = ConfigParser()
+        cparser.read(os.path.join(ROOT, "config.ini"))
+        local = cparser["LOCAL PROPERTIES"]
+        for option, name in [("SAVE", "frontier.db"), ("STATS", "crawl_stats.seg"),
+                             ("AGGREGATES", "crawl_aggregates.db"),
+                             ("DEDUP_FILE", "fingerprints.bin"),
+                             ("METRICS_FILE", "crawl_metrics.json"),
+                             ("SPILL_DIR", "frontier_spill")]:
+            local[option] = str(tmp_path / name)
+        cparser["CRAWLER"]["ROBOTS"] = "false"
+        cparser["CRAWLER"]["POLITENESS"] = "0"
+        for option, value in options.items():
+            option = option.upper()
+            section = next((s for s in cparser.sections() if option in cparser[s]),
+                           "LOCAL PROPERTIES")
+            cparser[section][option] = str(value)
+        return Config(cparser)
+    return make
+
+
+@pytest.fixture
+def serve_web():
+    """Serves a benchmarks.synthetic_web SyntheticWeb like the cache server,
+    on a thread, and returns its port."""
+    from threading import Thread
+    from benchmarks.synthetic_web import make_server
+    servers = []
+
+    def serve(web, latency=0.0):
+        server = make_server(web, latency=latency)
+        Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server.server_port
+    yield serve
+    for server in servers:
+        server.shutdown()
+        server.server_close()
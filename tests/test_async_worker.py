@@ -0,0 +1,63 @@
+import asyncio
+import time
+
+import crawler.async_worker
+from crawler.async_worker import AsyncWorker
+from utils.response import Response
+
+
+class SlowClient(object):
+    def __init__(self, config, max_connections):
+        pass
+
+    async def download(self, url, logger=None, gate=True):
+        await asyncio.sleep(0.2)
+        return Response({"url": url, "status": 404})
+
+    async def close(self):
+        pass
+
+
+class BusyFrontier(object):
+    """Always has a host that was due a second ago."""
+
+    def __init__(self, urls):
+        self.urls = list(urls)
+        self.in_progress = 0
+        self.polls = 0
+        self.stopped = False
+
+    def get_tbd_url(self, timeout=None):
+        if not self.urls:
+            return None
+        self.in_progress += 1
+        return self.urls.pop()
+
+    def next_ready_time(self):
+        self.polls += 1
+        return time.time() - 1
+
+    def is_exhausted(self):
+        return not self.urls and not self.in_progress
+
+    def mark_url_complete(self, url):
+        self.in_progress -= 1
+
+    def record_fetch(self, url, latency, status):
+        pass
+
+    def record_content(self, url, is_new):
+        pass
+
+    def add_url(self, url, parent=None):
+        pass
+
+
+def test_full_task_set_waits_for_a_task_instead_of_spinning(make_config, monkeypatch):
+    monkeypatch.setattr(crawler.async_worker, "AsyncCacheClient", SlowClient)
+    config = make_config(async_concurrency=1)
+    frontier = BusyFrontier(f"https://www.ics.uci.edu/p{i}" for i in range(3))
+    AsyncWorker(0, config, frontier).run()
+    assert not frontier.urls
+    # Spinning polled the frontier thousands of times in the 0.6s.
+    assert frontier.polls < 20
@@ -0,0 +1,145 @@
+import os
+import signal
+import threading
+from collections import Counter
+
+import pytest
+
+from benchmarks.crawl import stub_stats
+from benchmarks.synthetic_web import SyntheticWeb
+from crawler import Crawler
+from crawler.dedup import close_duplicate_index
+from crawler.pipeline import analyze_page, close_parse_pool, get_parse_pool
+from crawler.store import open_store
+from launch import stop_on_signals
+from utils.aggregates import AggregatesReader
+from utils.metrics import metrics
+from utils.statistics import StatisticsCollector
+from utils.stats_store import open_stats_reader
+
+
+@pytest.fixture
+def thread_errors(monkeypatch):
+    errors = []
+    monkeypatch.setattr(threading, "excepthook", errors.append)
+    return errors
+
+
+@pytest.fixture
+def restore_signals():
+    handlers = {sig: signal.getsignal(sig) for sig in (signal.SIGINT, signal.SIGTERM)}
+    yield
+    for sig, handler in handlers.items():
+        signal.signal(sig, handler)
+
+
+@pytest.mark.parametrize("engine", ["threads", "asyncio"])
+def test_interrupted_crawl_saves_its_progress(
+        make_config, serve_web, thread_errors, restore_signals, engine):
+    web = SyntheticWeb(hosts=3, pages=200)
+    config = make_config(
+        seedurl=",".join(web.seeds()), threadcount=4, engine=engine,
+        async_concurrency=4)
+    config.cache_server = ("127.0.0.1", serve_web(web, latency=0.02))
+    crawler = Crawler(config, restart=True)
+    stop_on_signals(crawler)
+    timer = threading.Timer(1.0, os.kill, (os.getpid(), signal.SIGINT))
+    timer.start()
+    try:
+        crawler.start()
+    finally:
+        timer.cancel()
+    crawler.stop()
+
+    assert thread_errors == []
+    assert not any(worker.is_alive() for worker in crawler.workers)
+    pages = metrics.snapshot()["counters"]["pages"]
+    store = open_store(config.save_file)
+    try:
+        completed = len(store) - store.count_pending()
+        assert 0 < completed < 600
+        assert store.count_pending() > 0
+    finally:
+        store.close()
+    # Every url a worker finished was saved, and counted once.
+    assert completed == pages
+    reader = AggregatesReader(config.aggregates_file)
+    try:
+        assert reader.unique_pages() == completed
+    finally:
+        reader.close()
+
+
+def test_resume_after_a_crash_between_the_stats_and_aggregates_flushes(
+        make_config, serve_web):
+    web = SyntheticWeb(hosts=2, pages=100)
+    config = make_config(
+        seedurl=",".join(web.seeds()), threadcount=2, checkpoint_interval=3600)
+    config.cache_server = ("127.0.0.1", serve_web(web))
+    crawler = Crawler(config, restart=True)
+    threading.Timer(0.5, crawler.stop_workers).start()
+    crawler.start_async()
+    crawler.join()
+    # The crash: the frontier and the statistics are saved, the aggregates
+    # were last checkpointed when they were opened.
+    crawler.frontier.store.commit()
+    StatisticsCollector(config.stats_file, config.stats_store).store.flush()
+    StatisticsCollector._stores.clear()
+    store = open_store(config.save_file)
+    completed = len(store) - store.count_pending()
+    store.close()
+    assert completed > 0
+
+    Crawler(config, restart=False).stop()
+
+    words = Counter()
+    pages = 0
+    reader = open_stats_reader(config.stats_file)
+    for page in reader.pages():
+        words.update(page.words)
+        pages += 1
+    reader.close()
+    aggregates = AggregatesReader(config.aggregates_file)
+    try:
+        assert aggregates.unique_pages() == completed
+        assert dict(aggregates.top_words(10**6)) == dict(words)
+    finally:
+        aggregates.close()
+    assert pages > 0
+
+
+def test_parse_processes_skip_duplicate_pages(make_config, serve_web):
+    web = SyntheticWeb(hosts=1, pages=30, duplicate_rate=1.0, trap_rate=0, large_rate=0)
+    config = make_config(
+        seedurl=",".join(web.seeds()), threadcount=2, parse_processes=1)
+    config.cache_server = ("127.0.0.1", serve_web(web))
+    crawler = Crawler(config, restart=True)
+    crawler.start()
+    crawler.stop()
+
+    served = stub_stats(config.cache_server[1])
+    assert served["duplicate"] > 0
+    reader = open_stats_reader(config.stats_file)
+    try:
+        # Every print mirror was caught in the parse process, and no page
+        # was taken for a duplicate of itself.
+        assert sum(1 for _ in reader.pages()) == served["page"]
+    finally:
+        reader.close()
+
+
+def test_parse_pool_checks_the_duplicate_index_before_extracting_links(make_config):
+    config = make_config(parse_processes=1)
+    url = "https://www.ics.uci.edu/a"
+    body = ("<html><body><p>" + "some words on a page " * 10
+            + '</p><a href="/b">b</a></body></html>').encode()
+    args = (url, 200, url, body, {"Content-Type": "text/html"})
+    try:
+        pool = get_parse_pool(config)
+        first = pool.submit(analyze_page, *args, True).result()
+        again = pool.submit(analyze_page, *args, True).result()
+    finally:
+        close_parse_pool()
+        close_duplicate_index()
+    assert first.duplicate is None and first.links
+    assert again.duplicate == "exact" and again.links == []
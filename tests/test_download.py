@@ -0,0 +1,57 @@
+from concurrent.futures import ThreadPoolExecutor
+from threading import Thread
+
+import pytest
+
+from benchmarks.synthetic_web import SyntheticWeb, make_server
+from utils.download import close_session, download, get_session
+
+
+@pytest.fixture
+def session_config(make_config):
+    config = make_config(threadcount=3, retries=4, retry_backoff=0.25)
+    yield config
+    close_session()
+
+
+def test_session_and_adapter_are_shared_with_the_configured_retry(session_config):
+    session = get_session(session_config)
+    adapter = session.get_adapter("http://127.0.0.1:9/")
+
+    assert get_session(session_config) is session
+    assert session.get_adapter("http://cache:8000/") is adapter
+    retry = adapter.max_retries
+    assert (retry.total, retry.connect, retry.read, retry.status) == (4, 4, 4, 4)
+    assert retry.backoff_factor == 0.25
+    assert set(retry.status_forcelist) == {502, 503, 504}
+    # One pool, as every request goes to the cache server, with a
+    # connection for each thread.
+    assert adapter._pool_connections == 1
+    assert adapter._pool_maxsize == 3
+    assert adapter._pool_block
+
+
+def test_downloads_reuse_a_connection_per_thread(session_config):
+    web = SyntheticWeb(hosts=4, pages=20)
+    server = make_server(web)
+    connections = []
+    process_request = server.process_request
+
+    def counting(request, client_address):
+        connections.append(client_address)
+        process_request(request, client_address)
+    server.process_request = counting
+    Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        session_config.cache_server = ("127.0.0.1", server.server_port)
+        urls = [f"https://{host}/p{n}" for host in web.hosts for n in range(20)]
+        with ThreadPoolExecutor(3) as pool:
+            statuses = list(pool.map(
+                lambda url: download(url, session_config).status, urls))
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert statuses == [200] * len(urls)
+    # 80 urls on four hosts, over at most one connection per thread.
+    assert 1 <= len(connections) <= 3
@@ -0,0 +1,59 @@
+import os
+import sqlite3
+
+import pytest
+
+from crawler.frontier import Frontier
+from crawler.store import STORE_SUFFIXES, open_store
+
+
+def drain(frontier):
+    urls = []
+    while True:
+        url = frontier.get_tbd_url(timeout=1)
+        if url is None:
+            return urls
+        urls.append(url)
+        frontier.mark_url_complete(url)
+
+
+def test_restart_with_shelve_store_starts_from_seeds(make_config, tmp_path):
+    config = make_config(store="shelve", save=tmp_path / "frontier.shelve")
+    frontier = Frontier(config, restart=False)
+    first = drain(frontier)
+    frontier.close()
+    assert len(first) == len(config.seed_urls)
+
+    frontier = Frontier(config, restart=True)
+    try:
+        assert sorted(drain(frontier)) == sorted(first)
+    finally:
+        frontier.close()
+
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+@pytest.mark.parametrize("backend", ["sqlite", "shelve"])
+def test_read_only_store_leaves_the_save_file_alone(tmp_path, backend):
+    path = str(tmp_path / "frontier")
+    store = open_store(path, backend)
+    store.put("a", "https://www.ics.uci.edu/a", True)
+    store.put("b", "https://www.ics.uci.edu/b", False)
+    store.close()
+    files = {suffix: read(path + suffix) for suffix in STORE_SUFFIXES
+             if os.path.exists(path + suffix)}
+
+    store = open_store(path, read_only=True)
+    try:
+        assert sorted(store.values()) == [
+            ("https://www.ics.uci.edu/a", True), ("https://www.ics.uci.edu/b", False)]
+        with pytest.raises((sqlite3.OperationalError, OSError)):
+            store.put("c", "https://www.ics.uci.edu/c", False)
+            store.commit()
+    finally:
+        store.close()
+    # SQLite may add its WAL index to read, but nothing that was there changes.
+    assert {suffix: read(path + suffix) for suffix in files} == files
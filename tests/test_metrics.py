@@ -0,0 +1,22 @@
+import random
+
+from utils.metrics import Histogram
+
+
+def test_quantiles_do_not_exceed_the_largest_observation():
+    histogram = Histogram()
+    for _ in range(10):
+        histogram.observe(0.0011)
+    snapshot = histogram.snapshot()
+    assert snapshot["p50"] == snapshot["p99"] == snapshot["max"] == 0.0011
+
+
+def test_quantiles_are_close_to_the_observed_ones():
+    rng = random.Random(7)
+    values = sorted(rng.lognormvariate(-4, 1.5) for _ in range(10000))
+    histogram = Histogram()
+    for value in values:
+        histogram.observe(value)
+    for q in (0.5, 0.9, 0.99):
+        exact = values[int(q * len(values)) - 1]
+        assert exact <= histogram.quantile(q) <= exact * 1.19
@@ -0,0 +1,28 @@
+import pytest
+
+from utils.page_parser import decode_content, detect_encoding, parse_html
+
+PAGE = "<html><body><p>Café menu</p></body></html>".encode("utf-8")
+
+
+@pytest.mark.parametrize("charset", [
+    "base64", "hex", "zlib", "bz2", "uu", "quopri", "rot13",  # not text codecs
+    "undefined", "idna", "punycode",  # text codecs that refuse "ignore"
+    "no-such-charset",
+])
+def test_unusable_charset_falls_back_to_utf8(charset):
+    assert decode_content(PAGE, f"text/html; charset={charset}") == PAGE.decode("utf-8")
+    page = f'<meta charset="{charset}">'.encode("ascii") + PAGE
+    assert decode_content(page) == page.decode("utf-8")
+    assert parse_html(page).text == "Café menu"
+
+
+@pytest.mark.parametrize("charset", ["base64", "zlib", "rot13", "hex"])
+def test_bytes_codecs_are_not_detected(charset):
+    assert detect_encoding(PAGE, f"text/html; charset={charset}") == "utf-8"
+
+
+def test_declared_charset_is_used():
+    page = "<p>Café</p>".encode("cp1252")
+    assert decode_content(page, "text/html; charset=iso-8859-1") == "<p>Café</p>"
+    assert decode_content(b'<meta charset="latin-1">' + page).endswith("<p>Café</p>")
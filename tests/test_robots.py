@@ -0,0 +1,87 @@
+import gzip
+
+import pytest
+
+from benchmarks.crawl import stub_stats
+from benchmarks.synthetic_web import SyntheticWeb
+from crawler.async_worker import AsyncWorker
+from crawler.dedup import close_duplicate_index
+from crawler.frontier import Frontier
+from crawler.robots import close_robots_cache, parse_robots, sitemap_urls
+from crawler.worker import Worker
+from utils.download import close_session, download
+
+SITEMAP = (b'<?xml version="1.0" encoding="UTF-8"?>'
+           b'<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+           b"<url><loc>https://h0.ics.uci.edu/p1</loc></url>"
+           b"<url><loc>https://h0.ics.uci.edu/p2?x=1&amp;y=2</loc></url>"
+           b"</urlset>")
+
+
+@pytest.fixture
+def stub_config(make_config, serve_web):
+    """Config for a crawl of a SyntheticWeb served by the stub."""
+    def make(web, **options):
+        config = make_config(seedurl=",".join(web.seeds()), **options)
+        config.cache_server = ("127.0.0.1", serve_web(web))
+        return config
+    yield make
+    close_session()
+    close_robots_cache()
+    close_duplicate_index()
+
+
+@pytest.mark.parametrize("content_type", [
+    "application/x-gzip", "application/octet-stream", "text/xml"])
+def test_gzipped_sitemap_gets_past_the_content_gate(stub_config, content_type):
+    web = SyntheticWeb(hosts=1, files={
+        "/sitemap.xml.gz": (content_type, gzip.compress(SITEMAP))})
+    config = stub_config(web)
+    url = "https://h0.ics.uci.edu/sitemap.xml.gz"
+
+    # A page fetch drops it unparsed...
+    assert download(url, config).skipped
+    # ...but the robots.txt and sitemap fetches do not.
+    fetch = lambda url: download(url, config, gate=False)
+    assert list(sitemap_urls([url], fetch)) == [
+        "https://h0.ics.uci.edu/p1", "https://h0.ics.uci.edu/p2?x=1&y=2"]
+
+
+@pytest.mark.parametrize("engine", [Worker, AsyncWorker])
+def test_crawl_fetches_robots_once_obeys_it_and_reads_sitemaps(stub_config, engine):
+    def sitemap(host):
+        urls = [f"https://{host}/p{n}" for n in range(20)] + [f"https://{host}/paper/1"]
+        return gzip.compress(
+            ('<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+             + "".join(f"<url><loc>{url}</loc></url>" for url in urls)
+             + "</urlset>").encode())
+    web = SyntheticWeb(
+        hosts=2, pages=20, links=2, duplicate_rate=0, trap_rate=0,
+        large_rate=1.0, large_size=1000, files={
+            "/robots.txt": ("text/plain", lambda host: (
+                "User-agent: *\nDisallow: /paper/\nDisallow: /big/\n"
+                f"Sitemap: https://{host}/sitemap.xml.gz\n").encode()),
+            "/sitemap.xml.gz": ("application/x-gzip", sitemap)})
+    config = stub_config(web, robots="true", async_concurrency=4)
+    frontier = Frontier(config, restart=True)
+    try:
+        engine(0, config, frontier).run()
+    finally:
+        frontier.close()
+
+    served = stub_stats(config.cache_server[1])
+    assert served == {"/robots.txt": 2, "/sitemap.xml.gz": 2, "page": 40}
+
+
+def test_groups_match_the_product_token():
+    text = ("User-agent: bot\nDisallow: /a\n\n"
+            "User-agent: IRBot\nDisallow: /b\n\n"
+            "User-agent: *\nDisallow: /c\n")
+    url = "https://www.ics.uci.edu/"
+    irbot = parse_robots(text, "IRbot/1.0 (UCI)")
+    assert irbot.allowed(url + "a") and not irbot.allowed(url + "b")
+    assert irbot.allowed(url + "c")
+    # A group for "bot" is not one for every agent containing "bot".
+    other = parse_robots(text, "Somebot/2.1")
+    assert other.allowed(url + "a") and other.allowed(url + "b")
+    assert not other.allowed(url + "c")
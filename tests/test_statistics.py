@@ -0,0 +1,65 @@
+import pytest
+
+from utils.aggregates import AggregatesReader
+from utils.statistics import StatisticsCollector
+
+
+@pytest.mark.parametrize("backend", ["segment", "shelve"])
+def test_a_page_stored_again_is_counted_once(tmp_path, backend):
+    collector = StatisticsCollector(
+        str(tmp_path / "crawl_stats"), backend,
+        aggregates_file=str(tmp_path / "crawl_aggregates.db"))
+    try:
+        for _ in range(2):
+            collector.record_page_stats("https://www.ics.uci.edu/a", {"crawler": 3})
+    finally:
+        StatisticsCollector.close_stores()
+    reader = AggregatesReader(str(tmp_path / "crawl_aggregates.db"))
+    try:
+        assert reader.top_words(1) == [("crawler", 3)]
+    finally:
+        reader.close()
+
+
+def test_a_url_is_completed_once(make_config):
+    from crawler.frontier import Frontier
+    frontier = Frontier(make_config(), restart=True)
+    try:
+        url = frontier.get_tbd_url(timeout=1)
+        assert frontier.mark_url_complete(url)
+        assert not frontier.mark_url_complete(url)
+    finally:
+        frontier.close()
+
+
+def crash(collector):
+    """Drop the open stores without closing them, as a crash would."""
+    collector.store.flush()
+    StatisticsCollector._stores.clear()
+
+
+@pytest.mark.parametrize("backend", ["segment", "shelve"])
+def test_pages_flushed_but_not_checkpointed_are_added_on_resume(tmp_path, backend):
+    make = lambda: StatisticsCollector(
+        str(tmp_path / "crawl_stats"), backend,
+        aggregates_file=str(tmp_path / "crawl_aggregates.db"),
+        checkpoint_interval=3600, commit_batch=1)
+    collector = make()
+    collector.record_page_stats("https://www.ics.uci.edu/a", {"crawler": 3})
+    collector.store.aggregates.checkpoint()
+    collector.record_page_stats("https://www.ics.uci.edu/b", {"crawler": 2, "web": 9})
+    # The stats store has flushed b, the aggregates have not.
+    crash(collector)
+
+    collector = make()
+    try:
+        assert not collector.aggregates.clean
+        collector.record_page_stats("https://www.ics.uci.edu/b", {"crawler": 2, "web": 9})
+    finally:
+        StatisticsCollector.close_stores()
+    reader = AggregatesReader(str(tmp_path / "crawl_aggregates.db"))
+    try:
+        assert reader.top_words(2) == [("web", 9), ("crawler", 5)]
+        assert reader.longest_page() == ("https://www.ics.uci.edu/b", 11)
+    finally:
+        reader.close()
@@ -0,0 +1,37 @@
+import random
+from collections import Counter
+
+from utils.topk import SpaceSaving, exact_top
+
+
+def test_guarantee_allows_for_evicted_items():
+    summary = SpaceSaving(2)
+    for item in "abcd":
+        summary.update(item)
+    summary.update("e", 5)
+
+    assert summary.top(2) == [("e", 7), ("d", 2)]
+    # d may have been seen once, fewer times than the evicted a, b or c.
+    assert summary.guaranteed(2) == 1
+
+
+def test_guaranteed_items_are_in_the_true_top_k_of_an_overflowing_stream():
+    rng = random.Random(3)
+    words = [f"w{i}" for i in range(2000)]
+    stream = rng.choices(words, weights=[1 / (i + 1) for i in range(2000)], k=50000)
+    summary = SpaceSaving(100)
+    for word in stream:
+        summary.update(word)
+    k = 50
+    exact = {item for item, _ in exact_top(Counter(stream).items(), k)}
+    guaranteed = summary.guaranteed(k)
+
+    found = sum(1 for item, _ in summary.top(k) if item in exact)
+    assert 0 < guaranteed <= found < k
+
+def test_exact_while_not_full():
+    summary = SpaceSaving(10)
+    for item, count in [("a", 5), ("b", 3), ("c", 1)]:
+        summary.update(item, count)
+    assert summary.guaranteed(2) == 2
+    assert summary.guaranteed(5) == 3
@@ -0,0 +1,69 @@
+import json
+
+from crawler.frontier import Frontier
+from crawler.robots import close_robots_cache
+from crawler.traps import BLOCK, TrapDetector, TrapJournal
+from utils.response import Response
+
+
+def test_param_values_are_capped_at_the_limit():
+    traps = TrapDetector(max_param_values=3)
+    admitted = [traps.check(f"https://www.ics.uci.edu/list?page={i}") for i in range(5)]
+    assert admitted == [0, 0, 0, BLOCK, BLOCK]
+    # Values already seen are still admitted.
+    assert traps.check("https://www.ics.uci.edu/list?page=1") != BLOCK
+
+
+def test_state_is_bounded_by_max_patterns():
+    traps = TrapDetector(max_patterns=100)
+    for i in range(1000):
+        traps.check(f"https://www.ics.uci.edu/page-{chr(97 + i % 26)}{i}/x?q{i}=1")
+        # A trap stays in use, so it is never evicted.
+        traps.check(f"https://www.ics.uci.edu/calendar/{i}")
+    assert len(traps.patterns) == 100
+    assert len(traps.param_values) == 100
+    assert traps.patterns["www.ics.uci.edu/calendar/N"][0] == 1000
+
+
+def test_journal_saves_only_changed_rows(tmp_path):
+    path = str(tmp_path / "frontier.db.traps")
+    traps = TrapDetector(pattern_limit=2, min_sample=2)
+    journal = TrapJournal(path)
+    for i in range(3):
+        traps.check(f"https://www.ics.uci.edu/events/{i}?day={i}")
+    traps.check("https://www.ics.uci.edu/about")
+    journal.append(traps.take_changes())
+    traps.record_fetch("https://www.ics.uci.edu/events/7", False)
+    traps.record_fetch("https://www.ics.uci.edu/events/8", False)
+    changes = traps.take_changes()
+    assert sorted(kind for kind, _, _ in changes) == ["b", "p"]
+    journal.append(changes)
+    journal.close()
+    # A crash cut the last line short.
+    with open(path, "a") as f:
+        f.write('["p", "www.ics')
+
+    restored = TrapDetector(pattern_limit=2, min_sample=2)
+    assert TrapJournal(path).load(restored)
+    assert dict(restored.patterns) == dict(traps.patterns)
+    assert dict(restored.param_values) == dict(traps.param_values)
+    assert restored.check("https://www.ics.uci.edu/events/9") == BLOCK
+    with open(path) as f:
+        assert all(json.loads(line) for line in f)
+
+
+def test_disallowed_urls_do_not_count_towards_traps(make_config):
+    config = make_config(robots="true", sitemap_limit=0)
+    frontier = Frontier(config, restart=True)
+    try:
+        raw = type("Raw", (), {"content": b"User-agent: *\nDisallow: /private\n"})()
+        robots_txt = Response({"url": "https://www.ics.uci.edu/robots.txt", "status": 200})
+        robots_txt.raw_response = raw
+        frontier.robots.rules_for("https://www.ics.uci.edu/", lambda url: robots_txt)
+        frontier.add_url("https://www.ics.uci.edu/private/1")
+        frontier.add_url("https://www.ics.uci.edu/public/1")
+        assert "www.ics.uci.edu/private/N" not in frontier.traps.patterns
+        assert "www.ics.uci.edu/public/N" in frontier.traps.patterns
+    finally:
+        frontier.close()
+        close_robots_cache()
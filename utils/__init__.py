@@ -3,8 +3,14 @@ import logging
 from hashlib import sha256
 from urllib.parse import urlparse
 
+from utils.canonical import canonicalize
+
 def get_logger(name, filename=None):
     logger = logging.getLogger(name)
+    if logger.handlers:
+        # Already set up by an earlier call; more handlers would repeat
+        # every line.
+        return logger
     logger.setLevel(logging.INFO)
     if not os.path.exists("Logs"):
         os.makedirs("Logs")
@@ -28,6 +34,14 @@ def get_urlhash(url):
         f"{parsed.query}/{parsed.fragment}".encode("utf-8")).hexdigest()
 
 def normalize(url):
+    url = canonicalize(url)
     if url.endswith("/"):
         return url.rstrip("/")
     return url
+
+def get_urldigest(url):
+    """16-byte binary form of get_urlhash(url), for in-memory indexes."""
+    return urlhash_to_digest(get_urlhash(url))
+
+def urlhash_to_digest(urlhash):
+    return bytes.fromhex(urlhash[:32])
@@ -0,0 +1,218 @@
+import os
+import sqlite3
+import time
+from threading import Lock
+from urllib.parse import urlparse
+
+
+def _connect(path):
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS terms ("
+        "word TEXT PRIMARY KEY, count INTEGER NOT NULL)")
+    # Lets the report read the most frequent words first without sorting.
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS terms_by_count ON terms (count DESC, word)")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS subdomains ("
+        "netloc TEXT PRIMARY KEY, pages INTEGER NOT NULL)")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS longest ("
+        "id INTEGER PRIMARY KEY CHECK (id = 0), "
+        "url TEXT NOT NULL, word_count INTEGER NOT NULL)")
+    # "pages": how many pages of the statistics store the terms and the
+    # longest page hold. "clean": 1 once closed, 0 while open.
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS state ("
+        "key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+    conn.commit()
+    return conn
+
+
+class CrawlAggregates(object):
+    """Running totals for the crawl report, kept up to date as pages arrive.
+
+    Holds the global term frequencies, the longest page and the number of
+    completed pages per subdomain. Changes collect in memory and are added
+    to a SQLite file (WAL, so stats.py can read it mid-crawl) on checkpoint,
+    which maybe_checkpoint() runs every `checkpoint_interval` seconds.
+
+    Pages come from a StatsStore, which checkpoints them only when it has
+    flushed every page they hold, and the checkpoint saves how many that
+    is. After a crash the store has the same pages or more, and
+    StatsStore.attach adds the rest with catch_up(). `clean` is False when
+    the file was not closed, so the completed counts may be off too.
+    """
+
+    def __init__(self, path, checkpoint_interval=10.0):
+        self.path = path
+        self.checkpoint_interval = checkpoint_interval
+        self.conn = _connect(path)
+        row = self.conn.execute("SELECT url, word_count FROM longest").fetchone()
+        self.longest = row if row is not None else (None, -1)
+        self._longest_dirty = False
+        self._terms = {}
+        self._subdomains = {}
+        state = dict(self.conn.execute("SELECT key, value FROM state"))
+        # None for a file from before the count was kept.
+        self.pages_saved = state.get("pages")
+        if self.pages_saved is None and self._is_empty():
+            self.pages_saved = 0
+        self._pages = 0
+        self.clean = bool(state.get("clean", 1))
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO state VALUES ('clean', 0)")
+        self.last_checkpoint = time.time()
+        self._lock = Lock()
+
+    def _is_empty(self):
+        return (self.conn.execute("SELECT 1 FROM terms LIMIT 1").fetchone() is None
+                and self.longest[0] is None)
+
+    @property
+    def pages(self):
+        """How many pages were added, or None if that is not known."""
+        if self.pages_saved is None:
+            return None
+        return self.pages_saved + self._pages
+
+    def add_page(self, url, word_counts):
+        """Count the words of a page that was downloaded."""
+        total = sum(word_counts.values())
+        with self._lock:
+            terms = self._terms
+            for word, count in word_counts.items():
+                terms[word] = terms.get(word, 0) + count
+            if total > self.longest[1]:
+                self.longest = (url, total)
+                self._longest_dirty = True
+            self._pages += 1
+
+    def add_completed(self, url):
+        """Count a url the frontier newly marked complete."""
+        netloc = urlparse(url).netloc
+        with self._lock:
+            self._subdomains[netloc] = self._subdomains.get(netloc, 0) + 1
+
+    def maybe_checkpoint(self):
+        with self._lock:
+            if time.time() - self.last_checkpoint >= self.checkpoint_interval:
+                self._checkpoint()
+
+    def catch_up(self, pages):
+        """Add the (url, word counts) of the pages stored after the ones
+        already counted, and checkpoint them."""
+        for url, word_counts in pages:
+            self.add_page(url, word_counts)
+        self.checkpoint()
+
+    def rebuild(self, pages):
+        """Count the terms and the longest page again from every stored
+        (url, word counts), when it is not known which are counted."""
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM terms")
+            self.conn.execute("DELETE FROM longest")
+            self.longest = (None, -1)
+            self._longest_dirty = False
+            self._terms.clear()
+            self.pages_saved = self._pages = 0
+        self.catch_up(pages)
+
+    def recount_completed(self, urls):
+        """Replace the completed pages per subdomain with a count of urls,
+        the urls the frontier has saved as completed."""
+        subdomains = {}
+        for url in urls:
+            netloc = urlparse(url).netloc
+            subdomains[netloc] = subdomains.get(netloc, 0) + 1
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM subdomains")
+            self.conn.executemany(
+                "INSERT INTO subdomains (netloc, pages) VALUES (?, ?)",
+                subdomains.items())
+            self._subdomains.clear()
+
+    def _checkpoint(self):
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO terms (word, count) VALUES (?, ?) "
+                "ON CONFLICT (word) DO UPDATE SET count = count + excluded.count",
+                self._terms.items())
+            self.conn.executemany(
+                "INSERT INTO subdomains (netloc, pages) VALUES (?, ?) "
+                "ON CONFLICT (netloc) DO UPDATE SET pages = pages + excluded.pages",
+                self._subdomains.items())
+            if self._longest_dirty:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO longest (id, url, word_count) "
+                    "VALUES (0, ?, ?)", self.longest)
+            if self.pages_saved is not None:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO state VALUES ('pages', ?)", (self.pages,))
+        if self.pages_saved is not None:
+            self.pages_saved += self._pages
+        self._pages = 0
+        self._terms.clear()
+        self._subdomains.clear()
+        self._longest_dirty = False
+        self.last_checkpoint = time.time()
+
+    def checkpoint(self):
+        with self._lock:
+            self._checkpoint()
+
+    def close(self):
+        with self._lock:
+            self._checkpoint()
+            with self.conn:
+                self.conn.execute("INSERT OR REPLACE INTO state VALUES ('clean', 1)")
+            self.conn.close()
+
+
+class AggregatesReader(object):
+    """Answers the report questions from a CrawlAggregates file; each one
+    costs about as much as its answer is long."""
+
+    def __init__(self, path):
+        if not os.path.exists(path):
+            raise FileNotFoundError(path)
+        self.conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+
+    def unique_pages(self):
+        return self.conn.execute(
+            "SELECT COALESCE(SUM(pages), 0) FROM subdomains").fetchone()[0]
+
+    def longest_page(self):
+        row = self.conn.execute("SELECT url, word_count FROM longest").fetchone()
+        return row if row is not None else ("N/A", 0)
+
+    def top_words(self, k, stop_words=(), min_length=0):
+        """The k most frequent words longer than min_length and not in
+        stop_words, most frequent first, ties in alphabetical order."""
+        top = []
+        if k <= 0:
+            return top
+        for word, count in self.conn.execute(
+                "SELECT word, count FROM terms WHERE length(word) > ? "
+                "ORDER BY count DESC, word", (min_length,)):
+            if word in stop_words:
+                continue
+            top.append((word, count))
+            if len(top) == k:
+                break
+        return top
+
+    def subdomains(self):
+        return self.conn.execute(
+            "SELECT netloc, pages FROM subdomains ORDER BY netloc").fetchall()
+
+    def close(self):
+        self.conn.close()
+
+
+def remove_aggregates(path):
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
@@ -0,0 +1,103 @@
+import re
+from functools import lru_cache
+from urllib.parse import urlsplit, urlunsplit, quote
+
+DEFAULT_PORTS = {"http": "80", "https": "443"}
+# Query parameters that only say where a visitor came from.
+TRACKING_PARAMS = {
+    "fbclid", "gclid", "dclid", "msclkid", "mc_cid", "mc_eid", "_ga", "_gl",
+    "yclid", "igshid",
+}
+TRACKING_PREFIXES = ("utm_",)
+
+# Urls that are already canonical: lowercase http(s) host without a port,
+# a path of plain segments none of which starts with a dot, no query, no
+# fragment and no escapes. Most links on a page look like this.
+_CANONICAL = re.compile(
+    r"https?://[a-z0-9-]+(?:\.[a-z0-9-]+)*(?:/(?!\.)[A-Za-z0-9_~.-]*)+")
+_ESCAPE = re.compile(r"%([0-9A-Fa-f]{2})")
+_UNRESERVED = frozenset(
+    "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-._~")
+_PATH_SAFE = "%/:@!$&'()*+,;=-._~"
+_QUERY_SAFE = _PATH_SAFE + "?"
+
+
+def _normalize_escape(match):
+    char = chr(int(match.group(1), 16))
+    return char if char in _UNRESERVED else "%" + match.group(1).upper()
+
+
+def _normalize_escapes(text, safe):
+    """Decode escaped unreserved characters, upper-case the other escapes
+    and escape anything a url may not hold as is, e.g. spaces."""
+    if "%" in text:
+        text = _ESCAPE.sub(_normalize_escape, text)
+    return quote(text, safe=safe)
+
+
+def _remove_dot_segments(path):
+    output = []
+    for segment in path.split("/"):
+        if segment == ".":
+            continue
+        if segment == "..":
+            if len(output) > 1:
+                output.pop()
+            continue
+        output.append(segment)
+    result = "/".join(output)
+    if path.endswith(("/.", "/..")):
+        result += "/"
+    return result if result.startswith("/") else "/" + result
+
+
+def _canonical_query(query):
+    pairs = []
+    for pair in query.split("&"):
+        if not pair:
+            continue
+        name = pair.split("=", 1)[0].lower()
+        if name in TRACKING_PARAMS or name.startswith(TRACKING_PREFIXES):
+            continue
+        pairs.append(_normalize_escapes(pair, _QUERY_SAFE))
+    # Sorted by name only, so repeated names keep the order of their values.
+    pairs.sort(key=lambda pair: pair.split("=", 1)[0])
+    return "&".join(pairs)
+
+
+def _canonical_netloc(scheme, netloc):
+    userinfo, at, hostport = netloc.rpartition("@")
+    host, port = hostport, ""
+    # The colons of an IPv6 literal such as [::1] are not a port separator.
+    if ":" in hostport and not hostport.endswith("]"):
+        host, _, port = hostport.rpartition(":")
+    host = host.lower().rstrip(".")
+    if port and port != DEFAULT_PORTS.get(scheme):
+        host += ":" + port
+    return userinfo + at + host
+
+
+@lru_cache(maxsize=65536)
+def canonicalize(url):
+    """Canonical form of an absolute url, so that spellings of one page hash
+    the same: lowercase scheme and host, no default port, dot segments
+    resolved, tracking parameters dropped and the rest sorted, percent
+    escapes normalized and no fragment.
+
+    HTTP://WWW.ICS.UCI.EDU:443/a/./b?y=2&x=1&utm_source=feed#top
+    becomes http://www.ics.uci.edu:443/a/b?x=1&y=2 (443 is only the default
+    port for https).
+    """
+    if _CANONICAL.fullmatch(url):
+        return url
+    try:
+        parts = urlsplit(url)
+    except ValueError:
+        return url
+    scheme = parts.scheme.lower()
+    netloc = _canonical_netloc(scheme, parts.netloc)
+    path = _normalize_escapes(parts.path, _PATH_SAFE)
+    if netloc:
+        path = _remove_dot_segments(path)
+    query = _canonical_query(parts.query) if parts.query else ""
+    return urlunsplit((scheme, netloc, path, query, ""))
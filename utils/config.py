@@ -8,12 +8,57 @@ class Config(object):
         assert self.user_agent != "DEFAULT AGENT", "Set useragent in config.ini"
         assert re.match(r"^[a-zA-Z0-9_ ,]+$", self.user_agent), "User agent should not have any special characters outside '_', ',' and 'space'"
         self.threads_count = int(config["LOCAL PROPERTIES"]["THREADCOUNT"])
+        self.engine = config["LOCAL PROPERTIES"].get("ENGINE", "threads")
+        self.async_concurrency = int(config["LOCAL PROPERTIES"].get("ASYNC_CONCURRENCY", "1000"))
+        self.parse_processes = int(config["LOCAL PROPERTIES"].get("PARSE_PROCESSES", "0"))
         self.save_file = config["LOCAL PROPERTIES"]["SAVE"]
+        self.store_backend = config["LOCAL PROPERTIES"].get("STORE", "shelve")
+        self.stats_file = config["LOCAL PROPERTIES"].get("STATS", "crawl_stats.seg")
+        self.stats_store = config["LOCAL PROPERTIES"].get("STATS_STORE", "segment")
+        self.aggregates_file = config["LOCAL PROPERTIES"].get("AGGREGATES", "crawl_aggregates.db")
+        self.checkpoint_interval = float(config["LOCAL PROPERTIES"].get("CHECKPOINT_INTERVAL", "10"))
+        self.dedup = config["LOCAL PROPERTIES"].getboolean("DEDUP", True)
+        self.dedup_file = config["LOCAL PROPERTIES"].get("DEDUP_FILE", "fingerprints.bin")
+        self.simhash_distance = int(config["LOCAL PROPERTIES"].get("SIMHASH_DISTANCE", "3"))
+        self.commit_interval = float(config["LOCAL PROPERTIES"].get("COMMIT_INTERVAL", "1.0"))
+        self.commit_batch = int(config["LOCAL PROPERTIES"].get("COMMIT_BATCH", "1000"))
+        self.resume_batch = int(config["LOCAL PROPERTIES"].get("RESUME_BATCH", "10000"))
+        self.seen_index = config["LOCAL PROPERTIES"].get("SEEN_INDEX", "set")
+        self.bloom_capacity = int(config["LOCAL PROPERTIES"].get("BLOOM_CAPACITY", "10000000"))
+        self.bloom_fp_rate = float(config["LOCAL PROPERTIES"].get("BLOOM_FP_RATE", "0.001"))
+        self.queue_limit = int(config["LOCAL PROPERTIES"].get("QUEUE_LIMIT", "0"))
+        self.spill_dir = config["LOCAL PROPERTIES"].get("SPILL_DIR", "frontier_spill")
+        self.spill_segment = int(config["LOCAL PROPERTIES"].get("SPILL_SEGMENT", "100000"))
+        self.metrics_file = config["LOCAL PROPERTIES"].get("METRICS_FILE", "crawl_metrics.json")
+        self.metrics_port = int(config["LOCAL PROPERTIES"].get("METRICS_PORT", "0"))
+        self.metrics_sample = float(config["LOCAL PROPERTIES"].get("METRICS_SAMPLE", "1.0"))
+        self.archive_file = config["LOCAL PROPERTIES"].get("ARCHIVE", "").strip()
 
         self.host = config["CONNECTION"]["HOST"]
         self.port = int(config["CONNECTION"]["PORT"])
+        self.connect_timeout = float(config["CONNECTION"].get("CONNECT_TIMEOUT", "5"))
+        self.read_timeout = float(config["CONNECTION"].get("READ_TIMEOUT", "30"))
+        self.retries = int(config["CONNECTION"].get("RETRIES", "3"))
+        self.retry_backoff = float(config["CONNECTION"].get("RETRY_BACKOFF", "0.5"))
+        self.max_content_size = int(config["CONNECTION"].get("MAX_CONTENT_SIZE", str(10 * 1024 * 1024)))
 
         self.seed_urls = [url.strip() for url in config["CRAWLER"]["SEEDURL"].split(",") if url.strip()]
         self.time_delay = float(config["CRAWLER"]["POLITENESS"])
+        self.frontier_priority = config["CRAWLER"].get("PRIORITY", "bfs")
+        self.trap_max_depth = int(config["CRAWLER"].get("TRAP_MAX_DEPTH", "12"))
+        self.trap_max_repeats = int(config["CRAWLER"].get("TRAP_MAX_REPEATS", "3"))
+        self.trap_pattern_limit = int(config["CRAWLER"].get("TRAP_PATTERN_LIMIT", "500"))
+        self.trap_param_values = int(config["CRAWLER"].get("TRAP_PARAM_VALUES", "50"))
+        self.trap_min_yield = float(config["CRAWLER"].get("TRAP_MIN_YIELD", "0.1"))
+        self.trap_max_patterns = int(config["CRAWLER"].get("TRAP_MAX_PATTERNS", "100000"))
+        self.rate_control = config["CRAWLER"].get("RATE_CONTROL", "adaptive")
+        self.rate_max_delay = float(config["CRAWLER"].get("RATE_MAX_DELAY", "60"))
+        self.max_host_concurrency = int(config["CRAWLER"].get("MAX_HOST_CONCURRENCY", "1"))
+        self.robots = config["CRAWLER"].getboolean("ROBOTS", True)
+        self.robots_ttl = float(config["CRAWLER"].get("ROBOTS_TTL", "86400"))
+        self.robots_max_delay = float(config["CRAWLER"].get("ROBOTS_MAX_DELAY", "30"))
+        self.sitemap_limit = int(config["CRAWLER"].get("SITEMAP_LIMIT", "10000"))
 
-        self.cache_server = None
\ No newline at end of file
+        self.cache_server = None
+        # Set by launch.py --replay: crawl from this archive instead.
+        self.replay_file = None
\ No newline at end of file
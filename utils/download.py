@@ -1,26 +1,261 @@
+import asyncio
 import requests
 import cbor
 import time
+from threading import Lock
+from urllib.parse import urlencode
 
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from utils.gate import header, read_limited, skip_reason
+from utils.metrics import metrics
 from utils.response import Response
 
-def download(url, config, logger=None):
+_session = None
+_session_lock = Lock()
+# Room for the cache server's cbor envelope and the pickled headers around
+# a body of MAX_CONTENT_SIZE bytes.
+ENVELOPE_SLACK = 64 * 1024
+
+
+def get_session(config):
+    """Shared keep-alive session for the cache server.
+
+    Every request goes to the one cache server, whatever host the url is
+    on, so the session has a single pool. It holds a connection for each
+    of the THREADCOUNT threads that download through it, the workers or,
+    with the asyncio engine, the threads fetching robots.txt and sitemaps.
+    Every thread reuses its own TCP connection instead of opening one per
+    url.
+    Connection failures, read timeouts and gateway errors are retried with
+    exponential backoff.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            retry = Retry(
+                total=config.retries, connect=config.retries,
+                read=config.retries, status=config.retries,
+                backoff_factor=config.retry_backoff,
+                status_forcelist=(502, 503, 504),
+                allowed_methods=("GET",),
+                raise_on_status=False)
+            adapter = HTTPAdapter(
+                pool_connections=1, pool_maxsize=config.threads_count,
+                pool_block=True, max_retries=retry)
+            session = requests.Session()
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+
+def close_session():
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+def download(url, config, logger=None, gate=True):
+    """The cache server's Response for url. With gate, a body that is not
+    worth parsing as a page is dropped (see utils.gate.skip_reason);
+    robots.txt and sitemap downloads turn it off."""
     host, port = config.cache_server
     try:
-        resp = requests.get(
-            f"http://{host}:{port}/",
-            params=[("q", f"{url}"), ("u", f"{config.user_agent}")])
-    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+        with metrics.timer("download"):
+            status_code, content = _get(url, config)
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+            requests.exceptions.RetryError,
+            requests.exceptions.ChunkedEncodingError) as e:
         if logger:
             logger.warning(f"Struggling to connect to cache server at {host}:{port}")
         return Response({"error": f"Connection error: {e}", "status": 600, "url": url})
+    if content is None:
+        return _too_large(url, status_code, config.max_content_size)
+    return _to_response(url, status_code, content, logger, gate)
+
+
+def _get(url, config):
+    """(status, body) from the cache server; body is None when it is over
+    MAX_CONTENT_SIZE. Streamed, so such a body is dropped unread instead of
+    being held in memory and unpickled."""
+    host, port = config.cache_server
+    limit = config.max_content_size + ENVELOPE_SLACK
+    resp = get_session(config).get(
+        f"http://{host}:{port}/",
+        params=[("q", f"{url}"), ("u", f"{config.user_agent}")],
+        timeout=(config.connect_timeout, config.read_timeout),
+        stream=True)
+    try:
+        length = header(resp.headers, "Content-Length")
+        if length is not None and length.isdigit() and int(length) > limit:
+            return resp.status_code, None
+        return resp.status_code, read_limited(resp.iter_content(64 * 1024), limit)
+    finally:
+        resp.close()
+
+
+def _too_large(url, status_code, max_size):
+    return Response({
+        "error": f"Response over {max_size} bytes, not downloaded.",
+        "status": status_code,
+        "url": url,
+        "skipped": f"response over {max_size} bytes"})
+
+
+def _to_response(url, status_code, content, logger=None, gate=True):
+    if content:
+        metrics.incr("bytes", len(content))
     try:
-        if resp and resp.content:
-            return Response(cbor.loads(resp.content))
+        if status_code < 400 and content:
+            with metrics.timer("unpickle"):
+                resp = Response(cbor.loads(content))
+            if gate and resp.raw_response is not None:
+                reason = skip_reason(resp.raw_response)
+                if reason is not None:
+                    # Free the body now rather than after the worker is done.
+                    resp.skipped = reason
+                    resp.raw_response = None
+            return resp
     except (EOFError, ValueError) as e:
         pass
-    logger.error(f"Spacetime Response error {resp} with url {url}.")
+    if logger:
+        logger.error(f"Spacetime Response error <{status_code}> with url {url}.")
     return Response({
-        "error": f"Spacetime Response error {resp} with url {url}.",
-        "status": resp.status_code,
+        "error": f"Spacetime Response error <{status_code}> with url {url}.",
+        "status": status_code,
         "url": url})
+
+
+class AsyncCacheClient(object):
+    """asyncio counterpart of download() for a single event loop.
+
+    Speaks just enough HTTP/1.1 to talk to the cache server, keeping up to
+    `max_connections` keep-alive connections open. Timeouts and retries
+    follow the same config as the threaded download().
+    """
+
+    RETRY_STATUSES = (502, 503, 504)
+
+    def __init__(self, config, max_connections):
+        self.config = config
+        self.host, self.port = config.cache_server
+        self.limit = config.max_content_size + ENVELOPE_SLACK
+        self._idle = []
+        self._slots = asyncio.Semaphore(max_connections)
+
+    async def download(self, url, logger=None, gate=True):
+        target = "/?" + urlencode([("q", url), ("u", self.config.user_agent)])
+        async with self._slots:
+            for attempt in range(self.config.retries + 1):
+                if attempt:
+                    await asyncio.sleep(self.config.retry_backoff * 2 ** (attempt - 1))
+                try:
+                    with metrics.timer("download"):
+                        status_code, content = await self._get(target)
+                except (OSError, asyncio.TimeoutError,
+                        asyncio.IncompleteReadError, ValueError) as e:
+                    error = e
+                    continue
+                if status_code in self.RETRY_STATUSES and attempt < self.config.retries:
+                    continue
+                if content is None:
+                    return _too_large(url, status_code, self.config.max_content_size)
+                return _to_response(url, status_code, content, logger, gate)
+        if logger:
+            logger.warning(
+                f"Struggling to connect to cache server at {self.host}:{self.port}")
+        return Response({"error": f"Connection error: {error!r}", "status": 600, "url": url})
+
+    async def _get(self, target):
+        # A pooled connection may have been closed by the server while
+        # idle; that costs a reconnect, not one of the retries.
+        while self._idle:
+            reader, writer = self._idle.pop()
+            try:
+                return await self._request(reader, writer, target)
+            except (OSError, asyncio.IncompleteReadError):
+                continue
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port),
+            self.config.connect_timeout)
+        return await self._request(reader, writer, target)
+
+    async def _request(self, reader, writer, target):
+        try:
+            writer.write(
+                f"GET {target} HTTP/1.1\r\n"
+                f"Host: {self.host}:{self.port}\r\n"
+                f"Accept-Encoding: identity\r\n"
+                f"Connection: keep-alive\r\n\r\n".encode("latin-1"))
+            await writer.drain()
+            status_code, headers, content = await asyncio.wait_for(
+                self._read_response(reader), self.config.read_timeout)
+        except BaseException:
+            writer.close()
+            raise
+        if headers.get("connection", "").lower() == "close" or reader.at_eof():
+            writer.close()
+        else:
+            self._idle.append((reader, writer))
+        return status_code, content
+
+    async def _read_response(self, reader):
+        status_line = await reader.readuntil(b"\r\n")
+        parts = status_line.split(None, 2)
+        if len(parts) < 2 or not parts[0].startswith(b"HTTP/"):
+            raise ValueError(f"Malformed status line {status_line!r}")
+        status_code = int(parts[1])
+        headers = {}
+        while True:
+            line = await reader.readuntil(b"\r\n")
+            if line == b"\r\n":
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        # A body over the limit is left unread, so content is None and
+        # the connection is closed rather than reused.
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            chunks = []
+            received = 0
+            while True:
+                size = int((await reader.readuntil(b"\r\n")).split(b";")[0], 16)
+                if size == 0:
+                    while await reader.readuntil(b"\r\n") != b"\r\n":
+                        pass
+                    break
+                received += size
+                if received > self.limit:
+                    headers["connection"] = "close"
+                    return status_code, headers, None
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+            content = b"".join(chunks)
+        elif "content-length" in headers:
+            length = int(headers["content-length"])
+            if length > self.limit:
+                headers["connection"] = "close"
+                return status_code, headers, None
+            content = await reader.readexactly(length)
+        else:
+            headers["connection"] = "close"
+            parts = []
+            received = 0
+            while True:
+                chunk = await reader.read(64 * 1024)
+                if not chunk:
+                    content = b"".join(parts)
+                    break
+                received += len(chunk)
+                if received > self.limit:
+                    content = None
+                    break
+                parts.append(chunk)
+        return status_code, headers, content
+
+    async def close(self):
+        while self._idle:
+            _, writer = self._idle.pop()
+            writer.close()
@@ -0,0 +1,63 @@
+# Cheap checks that decide whether a download is worth parsing, made before
+# any parser sees the body.
+
+# Content-Type values the HTML parser can do something with.
+TEXT_TYPES = ("text/", "application/xhtml", "application/xml")
+# Leading bytes of file formats that are often served without, or with a
+# wrong, Content-Type.
+BINARY_SIGNATURES = (
+    b"%PDF-", b"%!PS", b"\x89PNG", b"GIF87a", b"GIF89a", b"\xff\xd8\xff",
+    b"PK\x03\x04", b"\x1f\x8b", b"BZh", b"\xfd7zXZ", b"7z\xbc\xaf", b"Rar!",
+    b"\x7fELF", b"\xd0\xcf\x11\xe0", b"OggS", b"ID3", b"fLaC", b"wOFF",
+    b"wOF2", b"{\\rtf",
+)
+SNIFF_SIZE = 1024
+
+
+def header(headers, name):
+    """Case-insensitive header lookup in a dict or CaseInsensitiveDict."""
+    if not headers:
+        return None
+    value = headers.get(name)
+    if value is not None:
+        return value
+    name = name.lower()
+    for key, value in headers.items():
+        if key.lower() == name:
+            return value
+    return None
+
+
+def is_text_type(content_type):
+    media_type = content_type.split(";", 1)[0].strip().lower()
+    return not media_type or media_type.startswith(TEXT_TYPES) or media_type.endswith("+xml")
+
+
+def skip_reason(raw_response):
+    """Why a downloaded body should not be parsed, or None if it should.
+
+    Looks only at the Content-Type header and the first SNIFF_SIZE bytes.
+    """
+    content_type = header(getattr(raw_response, "headers", None), "Content-Type")
+    if content_type and not is_text_type(content_type):
+        return f"non-HTML content ({content_type.split(';', 1)[0].strip()})"
+    content = raw_response.content
+    if not content:
+        return None
+    head = content[:SNIFF_SIZE]
+    if head.startswith(BINARY_SIGNATURES) or b"\x00" in head:
+        return "binary content"
+    return None
+
+
+def read_limited(chunks, limit):
+    """Join an iterable of byte chunks, or return None as soon as they add
+    up to more than limit bytes, so an oversized body is never held."""
+    parts = []
+    size = 0
+    for chunk in chunks:
+        size += len(chunk)
+        if size > limit:
+            return None
+        parts.append(chunk)
+    return b"".join(parts)
@@ -0,0 +1,200 @@
+import json
+import os
+import random
+import time
+from bisect import bisect_left
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from threading import Lock, Thread
+
+# Histogram bucket upper bounds in seconds: 0.1ms up to ~105s, four buckets
+# per doubling, so a quantile is at most ~19% above the true value.
+BUCKETS = [0.0001 * 2 ** (i / 4) for i in range(81)]
+# Pages per second is also reported over this many recent seconds.
+RATE_WINDOW = 60
+
+
+class Histogram(object):
+    """Counts of observed durations in BUCKETS, plus their sum and max."""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th quantile, or the
+        largest observation if that is lower."""
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                return min(BUCKETS[i], self.max) if i < len(BUCKETS) else self.max
+        return 0.0
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": self.quantile(0.5),
+            "p90": self.quantile(0.9),
+            "p99": self.quantile(0.99),
+            "max": self.max,
+        }
+
+
+class _Timer(object):
+    __slots__ = ("metrics", "stage", "start")
+
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+        self.start = None
+
+    def __enter__(self):
+        if self.metrics.sample_rate >= 1.0 or random.random() < self.metrics.sample_rate:
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if self.start is not None:
+            self.metrics.observe(self.stage, time.perf_counter() - self.start)
+        return False
+
+
+class Metrics(object):
+    """Crawl instrumentation: stage timings, counters, per-host counters and
+    gauges read on demand.
+
+    Only `sample_rate` of timer() blocks are timed, so histogram counts are
+    samples while counters are exact. Everything sits behind one lock that
+    is held only for a dict update.
+    """
+
+    def __init__(self, sample_rate=1.0):
+        self.sample_rate = sample_rate
+        self._lock = Lock()
+        self._clear()
+
+    def _clear(self):
+        self.started = time.time()
+        self.stages = {}
+        self.counters = {}
+        self.hosts = {}
+        self.gauges = {}
+        self._recent = {}
+
+    def timer(self, stage):
+        """Context manager timing its block as `stage`."""
+        return _Timer(self, stage)
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            histogram = self.stages.get(stage)
+            if histogram is None:
+                histogram = self.stages[stage] = Histogram()
+            histogram.observe(seconds)
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def page_done(self):
+        """Count a url finished by a worker, for pages per second."""
+        second = int(time.time())
+        with self._lock:
+            self.counters["pages"] = self.counters.get("pages", 0) + 1
+            self._recent[second] = self._recent.get(second, 0) + 1
+            if len(self._recent) > 2 * RATE_WINDOW:
+                for old in [s for s in self._recent if s <= second - RATE_WINDOW]:
+                    del self._recent[old]
+
+    def host_incr(self, host, **amounts):
+        with self._lock:
+            counters = self.hosts.get(host)
+            if counters is None:
+                counters = self.hosts[host] = {}
+            for name, amount in amounts.items():
+                counters[name] = counters.get(name, 0) + amount
+
+    def gauge(self, name, read):
+        """Report read() under name in every snapshot."""
+        with self._lock:
+            self.gauges[name] = read
+
+    def snapshot(self):
+        now = time.time()
+        with self._lock:
+            elapsed = max(now - self.started, 1e-9)
+            recent = sum(count for second, count in self._recent.items()
+                         if second > now - RATE_WINDOW)
+            result = {
+                "uptime": elapsed,
+                "sample_rate": self.sample_rate,
+                "pages_per_second": self.counters.get("pages", 0) / elapsed,
+                "recent_pages_per_second": recent / min(elapsed, RATE_WINDOW),
+                "counters": dict(self.counters),
+                "stages": {stage: histogram.snapshot()
+                           for stage, histogram in self.stages.items()},
+                "hosts": {host: dict(counters) for host, counters in self.hosts.items()},
+            }
+            gauges = dict(self.gauges)
+        for name, read in gauges.items():
+            try:
+                result[name] = read()
+            except Exception as e:
+                result[name] = {"error": repr(e)}
+        return result
+
+    def reset(self, sample_rate=1.0):
+        """Start over, e.g. for a new Crawler in the same process."""
+        with self._lock:
+            self.sample_rate = sample_rate
+            self._clear()
+
+    def dump(self, path):
+        """Write a snapshot to path as JSON, replacing it atomically."""
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.snapshot(), f, indent=1, sort_keys=True)
+        os.replace(tmp, path)
+
+
+# Shared by everything in the crawler process.
+metrics = Metrics()
+
+
+class MetricsServer(object):
+    """Serves metrics.snapshot() as JSON on a local port from a daemon
+    thread; any GET path returns it."""
+
+    def __init__(self, registry, port, host="127.0.0.1"):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = json.dumps(registry.snapshot(), sort_keys=True).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_port
+        self.thread = Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
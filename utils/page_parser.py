@@ -0,0 +1,105 @@
+import codecs
+import re
+from collections import namedtuple
+from html.parser import HTMLParser
+
+# Only the start of a page is searched for a <meta> charset, as browsers do.
+CHARSET_SNIFF_SIZE = 1024
+_HEADER_CHARSET = re.compile(r"""charset\s*=\s*["']?([^\s;"']+)""", re.I)
+_META_CHARSET = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?\s*([a-zA-Z0-9_.:-]+)""", re.I)
+# Labels browsers read as a superset, per the WHATWG encoding standard.
+_SUPERSETS = {"iso8859-1": "cp1252", "ascii": "cp1252", "iso8859-9": "cp1254"}
+
+# hrefs are the raw href values of <a> tags, in document order and not yet
+# resolved against the page url; text is the visible text, one line per
+# text node, without <script> and <style> contents.
+ParsedPage = namedtuple("ParsedPage", ["hrefs", "text"])
+
+
+class PageParser(HTMLParser):
+    """Collects anchor links and visible text in a single pass."""
+
+    def __init__(self):
+        super().__init__()
+        self.hrefs = []
+        self.text = []
+        self.in_script = False
+        self.in_style = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'a':
+            for attr, value in attrs:
+                if attr == 'href' and value:
+                    self.hrefs.append(value)
+        elif tag in ['script', 'style']:
+            self.in_script = tag == 'script'
+            self.in_style = tag == 'style'
+
+    def handle_endtag(self, tag):
+        if tag in ['script', 'style']:
+            self.in_script = False
+            self.in_style = False
+
+    def handle_data(self, data):
+        if not self.in_script and not self.in_style:
+            self.text.append(data)
+
+
+def _codec(label):
+    try:
+        info = codecs.lookup(label.decode("ascii") if isinstance(label, bytes) else label)
+    except (LookupError, UnicodeDecodeError):
+        return None
+    # codecs also finds bytes-to-bytes codecs such as base64 and zlib.
+    if not info._is_text_encoding:
+        return None
+    return _SUPERSETS.get(info.name, info.name)
+
+
+def detect_encoding(content, content_type=None):
+    """Codec name for a page: from a byte order mark, else the charset of
+    its Content-Type, else a <meta> charset near the top, else utf-8."""
+    head = bytes(content[:CHARSET_SNIFF_SIZE])
+    if head.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    if head.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return "utf-16"
+    match = _HEADER_CHARSET.search(content_type) if content_type else None
+    codec = _codec(match.group(1)) if match else None
+    if codec is None:
+        match = _META_CHARSET.search(head)
+        codec = _codec(match.group(1)) if match else None
+        # A page that can declare its charset in ASCII is not UTF-16.
+        if codec is not None and codec.startswith("utf-16"):
+            codec = "utf-8"
+    return codec or "utf-8"
+
+
+def decode_content(content, content_type=None):
+    """content as str. Bytes are decoded without copying them first, and
+    those that are invalid in the page's encoding are dropped. Pages
+    declaring a codec that cannot decode that way are read as utf-8."""
+    if isinstance(content, (bytes, bytearray, memoryview)):
+        try:
+            return str(content, detect_encoding(content, content_type), "ignore")
+        except UnicodeError:
+            # e.g. idna, punycode and undefined, which refuse "ignore"
+            return str(content, "utf-8", "ignore")
+    return str(content)
+
+
+def parse_html(content, content_type=None):
+    """Decode `content` once and parse it into a ParsedPage."""
+    parser = PageParser()
+    parser.feed(decode_content(content, content_type))
+    return ParsedPage(parser.hrefs, '\n'.join(parser.text))
+
+
+def parse_response(resp):
+    """ParsedPage of resp.text, parsed at most once per response so the
+    scraper and the statistics share the work."""
+    page = getattr(resp, "parsed_page", None)
+    if page is None:
+        page = parse_html(resp.text)
+        resp.parsed_page = page
+    return page
@@ -1,14 +1,60 @@
 import pickle
 
+from utils.gate import header
+from utils.page_parser import decode_content
+
+
 class Response(object):
+    """A download, with the page's bytes and text made on first use.
+
+    The pickled requests.Response is only unpickled when raw_response is
+    first read, and the pickle is let go then. body is the page's bytes as
+    they are, and text is body decoded once, in the charset the headers or
+    the page declare, for every reader after that.
+    """
+
+    __slots__ = ("url", "status", "error", "parsed_page", "skipped",
+                 "_pickled", "_raw_response", "_text")
+
     def __init__(self, resp_dict):
         self.url = resp_dict["url"]
         self.status = resp_dict["status"]
         self.error = resp_dict["error"] if "error" in resp_dict else None
-        try:
-            self.raw_response = (
-                pickle.loads(resp_dict["response"])
-                if "response" in resp_dict else
-                None)
-        except TypeError:
-            self.raw_response = None
+        # Filled in by utils.page_parser.parse_response on first use.
+        self.parsed_page = None
+        # Why the body was not downloaded or was dropped unparsed, if it was.
+        self.skipped = resp_dict["skipped"] if "skipped" in resp_dict else None
+        self._pickled = resp_dict["response"] if "response" in resp_dict else None
+        self._raw_response = None
+        self._text = None
+
+    @property
+    def raw_response(self):
+        if self._pickled is not None:
+            pickled, self._pickled = self._pickled, None
+            try:
+                self._raw_response = pickle.loads(pickled)
+            except TypeError:
+                self._raw_response = None
+        return self._raw_response
+
+    @raw_response.setter
+    def raw_response(self, raw_response):
+        self._pickled = None
+        self._raw_response = raw_response
+        self._text = None
+        self.parsed_page = None
+
+    @property
+    def body(self):
+        """raw_response.content, not copied, or b"" without one."""
+        raw = self.raw_response
+        return (getattr(raw, "content", None) if raw is not None else None) or b""
+
+    @property
+    def text(self):
+        if self._text is None:
+            self._text = decode_content(
+                self.body,
+                header(getattr(self.raw_response, "headers", None), "Content-Type"))
+        return self._text
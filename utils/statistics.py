@@ -1,50 +1,73 @@
-import shelve
-from html.parser import HTMLParser
-import time
-import os
 import dbm
-import PartA
+from threading import Lock
+from utils import PartA
+from utils.page_parser import parse_html, parse_response
+from utils.aggregates import CrawlAggregates
+from utils.stats_store import open_stats_store
 from utils import get_urlhash, normalize
 
-class TextExtractor(HTMLParser):
-    def __init__(self):
-        super().__init__()
-        self.text = []
-        self.in_script = False
-        self.in_style = False
-    
-    def handle_starttag(self, tag, attrs):
-        if tag in ['script', 'style']:
-            self.in_script = tag == 'script'
-            self.in_style = tag == 'style'
-    
-    def handle_endtag(self, tag):
-        if tag in ['script', 'style']:
-            self.in_script = False
-            self.in_style = False
-    
-    def handle_data(self, data):
-        if not self.in_script and not self.in_style:
-            self.text.append(data)
-    
-    def get_text(self):
-        return '\n'.join(self.text)
-
 class StatisticsCollector:
-    def __init__(self, stats_file='crawl_stats.shelve'):
+    # All collectors writing to the same file share one open store, which
+    # keeps the CrawlAggregates attached to it up to date.
+    _stores = {}
+    _stores_lock = Lock()
+    # Bumped by close_stores(); collectors made before cannot reopen them.
+    _generation = 0
+
+    def __init__(self, stats_file='crawl_stats.seg', backend=None,
+                 aggregates_file=None, checkpoint_interval=10.0, **store_kwargs):
         self.stats_file = stats_file
+        self.backend = backend
+        self.aggregates_file = aggregates_file
+        self.checkpoint_interval = checkpoint_interval
+        self.store_kwargs = store_kwargs
+        self._generation = StatisticsCollector._generation
+
+    @property
+    def store(self):
+        with StatisticsCollector._stores_lock:
+            self._check_open()
+            store = StatisticsCollector._stores.get(self.stats_file)
+            if store is None:
+                aggregates = None
+                if self.aggregates_file is not None:
+                    aggregates = CrawlAggregates(self.aggregates_file, self.checkpoint_interval)
+                store = open_stats_store(
+                    self.stats_file, self.backend, aggregates, **self.store_kwargs)
+                StatisticsCollector._stores[self.stats_file] = store
+            return store
+
+    @property
+    def aggregates(self):
+        """Shared CrawlAggregates, or None when aggregates_file is not set."""
+        return self.store.aggregates
+
+    def _check_open(self):
+        if self._generation != StatisticsCollector._generation:
+            raise ValueError(
+                f"Statistics for {self.stats_file} were closed; "
+                f"a new collector is needed to reopen them.")
+
+    @classmethod
+    def close_stores(cls):
+        """Flush and close every open store and aggregates file. Collectors
+        made before this raise ValueError instead of reopening them."""
+        with cls._stores_lock:
+            cls._generation += 1
+            for store in cls._stores.values():
+                store.close()
+            cls._stores.clear()
     
     def extract_text_from_html(self, html_content):
-        parser = TextExtractor()
-        if isinstance(html_content, bytes):
-            html_content = html_content.decode('utf-8', errors='ignore')
-
-        parser.feed(html_content)
-        return parser.get_text()
+        return parse_html(html_content).text
     
     def count_words(self, text):
         return PartA.tokenize_text(text)
     
+    def page_word_counts(self, html_content):
+        """Token counts of the visible text of a page."""
+        return self.count_words(self.extract_text_from_html(html_content))
+
     def save_page_stats(self, url, resp):
         """Save page statistics.
         
@@ -52,44 +75,34 @@ class StatisticsCollector:
             url: URL of the page
             resp: Response object
         """
-        if not resp.raw_response or not resp.raw_response.content:
+        if not resp.body:
             return
         
-        html_content = resp.raw_response.content
-        text = self.extract_text_from_html(html_content)
-        word_counts = self.count_words(text)
-        
-        total_word_count = sum(word_counts.values())
+        self.record_page_stats(url, self.count_words(parse_response(resp).text))
+
+    def record_page_stats(self, url, word_counts):
+        """Save token counts already computed for a page.
         
+        Args:
+            url: URL of the page
+            word_counts: dict of token -> count
+        """
         normalized_url = normalize(url)
         urlhash = get_urlhash(normalized_url)
         
-        # Retry logic for shelve file access (handles concurrent access issues)
-        max_retries = 3
-        retry_delay = 0.1
-        
-        for attempt in range(max_retries):
-            try:
-                # Use flag='c' to create if doesn't exist, open if exists
-                stats = shelve.open(self.stats_file, flag='c')
-                stats[urlhash] = {
-                    'url': normalized_url,
-                    'word_count': total_word_count,
-                    'words': word_counts
-                }
-                stats.sync()
-                stats.close()
-                break  # Success, exit retry loop
-            except (dbm.error, OSError) as e:
-                # Handle concurrent access errors with retryyyy
-                if attempt < max_retries - 1:
-                    time.sleep(retry_delay * (attempt + 1))  # Exponential backoff
-                    continue
-                else:
-                    # On final failure, silently skip saving stats for this page
-                    # The page will still be crawled and processed normally
-                    pass
-            except Exception:
-                # For any other unexpected error, skip saving stats
-                break
+        try:
+            # Also adds a new page to the aggregates.
+            self.store.add_page(normalized_url, urlhash, word_counts)
+        except (dbm.error, OSError):
+            # Skip statistics for this page; it is still crawled and
+            # processed normally.
+            return
 
+    def record_completed(self, url):
+        """Count a url the frontier newly marked complete, for the
+        per-subdomain totals."""
+        store = self.store
+        if store.aggregates is not None:
+            store.aggregates.add_completed(url)
+            # Checkpoints them when it is time, as pages may not come.
+            store.maybe_flush()
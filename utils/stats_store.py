@@ -0,0 +1,376 @@
+import os
+import shelve
+import struct
+import sys
+import time
+from array import array
+from collections import namedtuple
+from threading import Lock
+
+from utils import get_urlhash, urlhash_to_digest
+
+SEGMENT_HEADER = b"CSTATS\x00\x01"
+# body length, then inside the body: url length, total word count, terms
+_RECORD_LEN = struct.Struct("<I")
+_RECORD_HEAD = struct.Struct("<III")
+
+PageStats = namedtuple("PageStats", ["url", "word_count", "words"])
+
+
+def _to_le(values):
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values
+
+
+class StatsStore(object):
+    """Per-page token counts, written by every worker through one handle.
+
+    Like the frontier store, writes are grouped: flush() makes them durable
+    and maybe_flush() calls it once `commit_batch` pages are pending or
+    `commit_interval` seconds have passed.
+
+    With CrawlAggregates attached, every page stored is added to them, in
+    the same order, and they are checkpointed only while no page is
+    waiting to be flushed.
+    """
+
+    # Whether pages can be read back in the order they were added.
+    ORDERED = True
+
+    def __init__(self, commit_interval=1.0, commit_batch=1000):
+        self.commit_interval = commit_interval
+        self.commit_batch = commit_batch
+        self.pending_writes = 0
+        self.last_flush = time.time()
+        self.aggregates = None
+        self._lock = Lock()
+
+    def attach(self, aggregates):
+        """Keep aggregates up to date with the pages stored from now on,
+        first adding the pages they are missing after a crash."""
+        with self._lock:
+            counted = aggregates.pages
+            if counted is None or counted > len(self) or (
+                    counted < len(self) and not self.ORDERED):
+                aggregates.rebuild(self._pages_since(0))
+            elif counted < len(self):
+                aggregates.catch_up(self._pages_since(counted))
+            self.aggregates = aggregates
+
+    def add_page(self, url, urlhash, word_counts):
+        """Store word_counts for a page and return True. A url that is
+        already stored is kept as it is, and False returned."""
+        with self._lock:
+            if not self._add_page(url, urlhash, word_counts):
+                return False
+            if self.aggregates is not None:
+                self.aggregates.add_page(url, word_counts)
+            self.pending_writes += 1
+            self._maybe_flush()
+            return True
+
+    def maybe_flush(self):
+        with self._lock:
+            self._maybe_flush()
+
+    def _maybe_flush(self):
+        if self.pending_writes and (
+                self.pending_writes >= self.commit_batch
+                or time.time() - self.last_flush >= self.commit_interval):
+            self._flush_locked()
+        # Pages still to be flushed would be in the checkpoint but could
+        # be lost from the store.
+        if self.aggregates is not None and not self.pending_writes:
+            self.aggregates.maybe_checkpoint()
+
+    def _flush_locked(self):
+        self._flush()
+        self.pending_writes = 0
+        self.last_flush = time.time()
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def close(self):
+        with self._lock:
+            self._flush_locked()
+            self._close()
+            if self.aggregates is not None:
+                self.aggregates.close()
+                self.aggregates = None
+
+
+class SegmentStatsStore(StatsStore):
+    """Append-only segment file of compact per-page term arrays.
+
+    Words are interned: `<path>.words` holds one word per line, and a word's
+    id is its line number. Each page is one record in `<path>`, holding the
+    url, the page's total word count and little-endian uint32 (word id,
+    count) pairs. Records are only ever appended; a torn record at the end
+    of the file, left by a crash, is cut off the next time it is opened.
+    """
+
+    def __init__(self, path, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self.words_file = path + ".words"
+        self.word_ids = {}
+        # digests of the urls already stored
+        self.seen = set()
+        if os.path.exists(self.words_file):
+            valid = self._load_words()
+            with open(self.words_file, "r+b") as f:
+                f.truncate(valid)
+        if os.path.exists(path):
+            valid = self._load_urls()
+            with open(path, "r+b") as f:
+                f.truncate(valid)
+        self.words = open(self.words_file, "ab")
+        self.segment = open(path, "ab")
+        # Records wait here until flush() has written the words they use.
+        self.buffer = bytearray()
+        if self.segment.tell() == 0:
+            self.segment.write(SEGMENT_HEADER)
+
+    def _load_words(self):
+        valid = 0
+        with open(self.words_file, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                self.word_ids[line[:-1].decode("utf-8")] = len(self.word_ids)
+                valid += len(line)
+        return valid
+
+    def _load_urls(self):
+        if os.path.getsize(self.path) < len(SEGMENT_HEADER):
+            return 0
+        valid = len(SEGMENT_HEADER)
+        for offset, url, _, _ in _read_records(self.path, decode_terms=False):
+            self.seen.add(urlhash_to_digest(get_urlhash(url)))
+            valid = offset
+        return valid
+
+    def _intern(self, word):
+        word_id = self.word_ids.get(word)
+        if word_id is None:
+            word_id = self.word_ids[word] = len(self.word_ids)
+            self.words.write(word.encode("utf-8") + b"\n")
+        return word_id
+
+    def __len__(self):
+        return len(self.seen)
+
+    def _pages_since(self, count):
+        # Records are in the order the pages were added.
+        words = list(self.word_ids)
+        for i, (_, url, _, terms) in enumerate(_read_records(self.path)):
+            if i >= count:
+                yield url, {words[terms[j]]: terms[j + 1] for j in range(0, len(terms), 2)}
+
+    def _add_page(self, url, urlhash, word_counts):
+        digest = urlhash_to_digest(urlhash)
+        if digest in self.seen:
+            return False
+        self.seen.add(digest)
+        terms = array("I")
+        for word, count in word_counts.items():
+            terms.append(self._intern(word))
+            terms.append(count)
+        url_bytes = url.encode("utf-8")
+        body = (
+            _RECORD_HEAD.pack(len(url_bytes), sum(word_counts.values()), len(word_counts))
+            + url_bytes + _to_le(terms).tobytes())
+        self.buffer += _RECORD_LEN.pack(len(body))
+        self.buffer += body
+        return True
+
+    def _flush(self):
+        # Words first, so no record on disk refers to a word that is not.
+        self.words.flush()
+        self.segment.write(self.buffer)
+        self.segment.flush()
+        self.buffer.clear()
+
+    def _close(self):
+        self.words.close()
+        self.segment.close()
+
+
+class ShelveStatsStore(StatsStore):
+    """The original format: one pickled dict per page, keyed by urlhash."""
+
+    ORDERED = False
+
+    def __init__(self, path, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self.db = shelve.open(path, flag='c')
+
+    def __len__(self):
+        return len(self.db)
+
+    def _pages_since(self, count):
+        # Without an order, only all of them can be read back.
+        assert count == 0
+        for page in ShelveStatsReader.pages_of(self.db):
+            yield page.url, page.words
+
+    def _add_page(self, url, urlhash, word_counts):
+        if urlhash in self.db:
+            return False
+        self.db[urlhash] = {
+            'url': url,
+            'word_count': sum(word_counts.values()),
+            'words': word_counts
+        }
+        return True
+
+    def _flush(self):
+        self.db.sync()
+
+    def _close(self):
+        self.db.close()
+
+
+def _read_records(path, decode_terms=True):
+    """Yield (end offset, url, word count, terms) for each complete record.
+
+    terms is an array of alternating word ids and counts, or None when
+    decode_terms is False.
+    """
+    with open(path, "rb") as f:
+        if f.read(len(SEGMENT_HEADER)) != SEGMENT_HEADER:
+            raise ValueError(f"{path} is not a statistics segment file.")
+        offset = len(SEGMENT_HEADER)
+        while True:
+            head = f.read(_RECORD_LEN.size)
+            if len(head) < _RECORD_LEN.size:
+                return
+            (length,) = _RECORD_LEN.unpack(head)
+            body = f.read(length)
+            if len(body) < length:
+                return
+            offset += _RECORD_LEN.size + length
+            url_len, word_count, num_terms = _RECORD_HEAD.unpack_from(body)
+            start = _RECORD_HEAD.size
+            url = body[start:start + url_len].decode("utf-8")
+            terms = None
+            if decode_terms:
+                terms = _to_le(array("I", body[start + url_len:]))
+            yield offset, url, word_count, terms
+
+
+class SegmentStatsReader(object):
+    """Streams the pages of a segment file without loading all of them.
+
+    Safe to use while the crawl is still writing; it sees the pages up to
+    the last flush.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.words = []
+        self._words_read = 0
+        self._load_words()
+
+    def _load_words(self):
+        words_file = self.path + ".words"
+        if not os.path.exists(words_file):
+            return
+        with open(words_file, "rb") as f:
+            f.seek(self._words_read)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                self.words.append(line[:-1].decode("utf-8"))
+                self._words_read += len(line)
+
+    def raw_pages(self):
+        """Yield (url, word_count, terms) with terms an array of
+        alternating word ids and counts; ids index self.words."""
+        for _, url, word_count, terms in _read_records(self.path):
+            if terms and max(terms[0::2]) >= len(self.words):
+                self._load_words()
+            yield url, word_count, terms
+
+    def pages(self):
+        """Yield a PageStats with a word -> count dict for each page."""
+        words = self.words
+        for url, word_count, terms in self.raw_pages():
+            yield PageStats(url, word_count, {
+                words[terms[i]]: terms[i + 1] for i in range(0, len(terms), 2)})
+
+    def close(self):
+        pass
+
+
+class ShelveStatsReader(object):
+
+    def __init__(self, path):
+        self.db = shelve.open(path, flag='r')
+
+    def pages(self):
+        return self.pages_of(self.db)
+
+    @staticmethod
+    def pages_of(db):
+        for urlhash, data in db.items():
+            if isinstance(data, dict) and 'word_count' in data:
+                words = data.get('words')
+                yield PageStats(
+                    data.get('url', urlhash), data['word_count'],
+                    words if isinstance(words, dict) else {})
+
+    def close(self):
+        self.db.close()
+
+
+STATS_STORES = {
+    "segment": (SegmentStatsStore, SegmentStatsReader),
+    "shelve": (ShelveStatsStore, ShelveStatsReader),
+}
+
+
+def detect_backend(path):
+    """Guess the backend of an existing stats file, defaulting to shelve."""
+    try:
+        with open(path, "rb") as f:
+            if f.read(len(SEGMENT_HEADER)) == SEGMENT_HEADER:
+                return "segment"
+    except OSError:
+        pass
+    return "shelve"
+
+
+def _get_backend(backend):
+    try:
+        return STATS_STORES[backend.strip().lower()]
+    except KeyError:
+        raise ValueError(
+            f"Unknown statistics store {backend!r}, "
+            f"expected one of {', '.join(sorted(STATS_STORES))}.")
+
+
+def open_stats_store(path, backend=None, aggregates=None, **kwargs):
+    if backend is None:
+        backend = detect_backend(path)
+    store = _get_backend(backend)[0](path, **kwargs)
+    if aggregates is not None:
+        store.attach(aggregates)
+    return store
+
+
+def open_stats_reader(path, backend=None):
+    if backend is None:
+        backend = detect_backend(path)
+    return _get_backend(backend)[1](path)
+
+
+def remove_stats_store(path):
+    # shelve may be backed by dbm.dumb (.dat/.dir/.bak) or by ndbm (.db)
+    for suffix in ("", ".words", ".dat", ".dir", ".bak", ".db"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
@@ -0,0 +1,92 @@
+from heapq import heapify, heappush, heappop, nsmallest
+
+
+class SpaceSaving(object):
+    """Approximate heavy hitters of a weighted stream in O(capacity) memory.
+
+    Tracks at most `capacity` items. An untracked item replaces the one with
+    the smallest count and inherits that count as its error, so every
+    reported count is an overestimate by at most its error, and any item
+    whose true total exceeds total / capacity is guaranteed to be tracked.
+    """
+
+    def __init__(self, capacity):
+        if capacity <= 0:
+            raise ValueError("Space-Saving needs capacity > 0.")
+        self.capacity = capacity
+        self.total = 0
+        self.counts = {}
+        self.errors = {}
+        # (count, item) entries; an entry is stale once the item's count
+        # has moved on, and is skipped when it reaches the top.
+        self._heap = []
+
+    def update(self, item, count=1):
+        self.total += count
+        counts = self.counts
+        if item in counts:
+            counts[item] += count
+        elif len(counts) < self.capacity:
+            counts[item] = count
+            self.errors[item] = 0
+        else:
+            min_count, min_item = self._pop_min()
+            del counts[min_item]
+            del self.errors[min_item]
+            counts[item] = min_count + count
+            self.errors[item] = min_count
+        heappush(self._heap, (counts[item], item))
+        if len(self._heap) > 4 * self.capacity:
+            self._heap = [(c, i) for i, c in counts.items()]
+            heapify(self._heap)
+
+    def _pop_min(self):
+        heap = self._heap
+        while True:
+            count, item = heappop(heap)
+            if self.counts.get(item) == count:
+                return count, item
+
+    def top(self, k):
+        """The k items with the highest estimated counts as (item, count),
+        highest first and ties in item order."""
+        return nsmallest(k, self.counts.items(), key=lambda x: (-x[1], x[0]))
+
+    def guaranteed(self, k):
+        """How many of top(k) are certainly in the true top k: an item is,
+        when its lowest possible count is not below the (k+1)-th estimate
+        nor, once the summary is full, the count an untracked item may have."""
+        ranked = self.top(k + 1)
+        threshold = ranked[k][1] if len(ranked) > k else 0
+        if len(self.counts) == self.capacity:
+            # Evicted items, and so any untracked one, may have had as
+            # many as the smallest tracked count.
+            threshold = max(threshold, min(self.counts.values()))
+        return sum(1 for item, count in ranked[:k]
+                   if count - self.errors[item] >= threshold)
+
+
+def exact_top(pairs, k):
+    """The k (item, count) pairs with the highest counts, highest first and
+    ties in item order, without sorting all of them."""
+    return nsmallest(k, pairs, key=lambda x: (-x[1], x[0]))
+
+
+def accuracy_report(exact, approx):
+    """Compare an approximate top-k list with the exact one.
+
+    Both are lists of (item, count). Returns recall (share of the exact
+    items that were found), how many share the same rank, and the largest
+    and mean relative count errors over the items found.
+    """
+    exact_counts = dict(exact)
+    found = [(item, count) for item, count in approx if item in exact_counts]
+    errors = [abs(count - exact_counts[item]) / exact_counts[item]
+              for item, count in found]
+    return {
+        'k': len(exact),
+        'recall': len(found) / len(exact) if exact else 1.0,
+        'same_rank': sum(1 for a, b in zip(exact, approx) if a[0] == b[0]),
+        'max_count_error': max(errors, default=0.0),
+        'mean_count_error': sum(errors) / len(errors) if errors else 0.0,
+    }